@@ -0,0 +1,74 @@
+"""
+rows/sec of the make_price chunk accumulation loop, before (pd.concat onto an object frame) and after (PriceBuffer).
+storage is left out: each chunk is only turned into the frame save_price would get.
+
+    python -m benchmarks.bench_accumulate --windows 3000
+"""
+import time
+
+import json
+
+import click
+import pandas as pd
+
+from benchmarks.synthetic import klines_bn
+from crypto.PriceMaker import PriceBuffer, chunk_rows
+from crypto.kline import parse_klines, to_frame
+from crypto.utils import price_config
+
+
+def make_windows(n, ticker="BTCUSDT", start="2022-01-01"):
+    interval = pd.to_timedelta(price_config["BN"]["interval"])
+    interval_1 = pd.to_timedelta(price_config["BN"]["interval_1"])
+    windows = []
+    for s in pd.date_range(start, periods=n, freq=interval):
+        e = s + interval_1
+        payload = json.dumps(klines_bn(ticker, 1000 * int(s.timestamp()), 1000 * int(e.timestamp()), 1000))
+        windows.append(to_frame(*parse_klines(payload, "BN", s, e), "BN"))
+    return windows
+
+
+def accumulate_concat(windows, source="BN"):
+    chunk = price_config[source]["chunk_size"]
+    prices = pd.DataFrame(columns=price_config[source]["columns"])
+    for i, price in enumerate(windows, 1):
+        prices = pd.concat([prices, price], axis=0, ignore_index=True)
+        if i % chunk == 0:
+            prices.astype({"epoch": int})
+            prices = pd.DataFrame(columns=price_config[source]["columns"])
+
+
+def accumulate_buffer(windows, source="BN"):
+    chunk = price_config[source]["chunk_size"]
+    prices = PriceBuffer(source, chunk_rows(source))
+    for i, price in enumerate(windows, 1):
+        prices.append(price)
+        if i % chunk == 0:
+            prices.frame()
+            prices.size = 0
+
+
+def rows_per_sec(func, windows, repeat=3):
+    rows = sum(len(w) for w in windows)
+    best = min(_timed(func, windows) for _ in range(repeat))
+    return rows / best
+
+
+def _timed(func, windows):
+    t0 = time.perf_counter()
+    func(windows)
+    return time.perf_counter() - t0
+
+
+@click.command()
+@click.option("--windows", "-w", default=3000)
+def main(windows):
+    windows = make_windows(windows)
+    before = rows_per_sec(accumulate_concat, windows)
+    after = rows_per_sec(accumulate_buffer, windows)
+    print(f"pd.concat   : {before:,.0f} rows/sec")
+    print(f"PriceBuffer : {after:,.0f} rows/sec  ({after / before:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
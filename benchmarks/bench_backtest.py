@@ -0,0 +1,82 @@
+"""
+model.backtest over a parameter grid, before (one combination after another, pandas frames like a notebook)
+and after (Backtest.run, every combination at once), on synthetic minute closes of the universe with momentum
+signals. total returns are checked to agree before the timings are reported.
+
+    python -m benchmarks.bench_backtest --days 90 --tickers 10
+"""
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import minute_bars
+from model.backtest import Backtest, param_grid, walk_forward
+
+LOOKBACKS = [5, 30, 240]  # minutes of the momentum signals
+
+
+def make_closes(days, tickers, start="2022-01-01"):
+    start = int(pd.Timestamp(start).timestamp())
+    epoch = start + 60 * np.arange(days * 1440, dtype=np.int64)
+    close = np.full((len(epoch), tickers), np.nan)
+    for j in range(tickers):
+        bars = minute_bars(f"T{j}USDT", int(epoch[0]), int(epoch[-1]))
+        close[(bars["epoch"] - start) // 60, j] = bars["close"]
+    filled = pd.DataFrame(close).ffill().values
+    signal = np.stack([np.r_[np.full((k, tickers), np.nan), filled[k:] / filled[:-k] - 1] for k in LOOKBACKS])
+    return epoch, close, signal.astype(np.float32)
+
+
+def backtest_before(close, signal, grid):
+    close = pd.DataFrame(close)
+    returns = (close.ffill() / close.ffill().shift() - 1).fillna(0)
+    out = []
+    for i in range(len(grid["entry"])):
+        s = pd.DataFrame(signal[grid["signal"][i]], dtype=np.float64).where(close.notna())
+        state = s.where(s.abs() > grid["entry"][i])
+        state = np.sign(state).clip(lower=0 if grid["long_only"][i] else -1)
+        state = state.mask(s.abs() < grid["exit"][i], 0).ffill().fillna(0)
+        position = state.shift(grid["lag"][i]).fillna(0)
+        turnover = position.diff().fillna(position).abs().sum(axis=1) / close.shape[1]
+        pnl = (position.shift().fillna(0) * returns).sum(axis=1) / close.shape[1] - \
+            turnover * (grid["fee"][i] + grid["slippage"][i])
+        out.append(np.expm1(np.log1p(pnl).sum()))
+    return np.array(out)
+
+
+def bench(days, tickers, slippage):
+    epoch, close, signal = make_closes(days, tickers)
+    grid = param_grid(signal=range(len(LOOKBACKS)), entry=[0.0005, 0.001, 0.002, 0.005], exit=[0.0, 0.0005],
+                      long_only=[False, True], lag=[0, 1], fee=[0.0, 0.0005, 0.001, 0.002], slippage=[slippage])
+    folds = walk_forward(epoch, "30D", "15D")
+
+    t = time.perf_counter()
+    before = backtest_before(close, signal, grid)
+    seconds_before = time.perf_counter() - t
+    t = time.perf_counter()
+    result = Backtest(epoch, close).run(signal, grid, folds)
+    seconds_after = time.perf_counter() - t
+
+    after = result.summary().total_return.values
+    if not np.allclose(before, after, rtol=1e-9, atol=1e-12):
+        raise Exception(f"total returns differ by up to {np.abs(before - after).max()}")
+    print(f"{len(after)} combinations x {len(epoch)} minutes x {tickers} tickers, identical total returns")
+    print(f"before: {seconds_before:.2f}s\n after: {seconds_after:.2f}s\nspeedup {seconds_before / seconds_after:.1f}x")
+    if folds:
+        print(result.walk_forward(folds)[["test_start", "combination", "train_sharpe", "test_sharpe"]].to_string())
+    else:
+        print(f"no walk forward fold in {days} days (30D train + 15D test)")
+
+
+@click.command()
+@click.option("--days", default=90, help="days of minute bars")
+@click.option("--tickers", default=10)
+@click.option("--slippage", default=0.0005)
+def main(days, tickers, slippage):
+    bench(days, tickers, slippage)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+texts/sec of the sentiment text cleaning, before (text_clean per row: regexes, TweetTokenizer and
+WordNetLemmatizer built for every text, stopwords looked up in a list) and after (model.sentiment.TextCleaner,
+serial and on a process pool). outputs are checked to be identical.
+
+    python -m benchmarks.bench_clean --texts 100000 --workers 4
+    python -m benchmarks.bench_clean --no-wordnet    # without the wordnet corpus: lemmas left as they are
+"""
+import re
+import time
+
+import click
+from nltk.corpus import stopwords
+from nltk.stem.wordnet import WordNetLemmatizer
+from nltk.tokenize import TweetTokenizer
+
+import model.sentiment as sentiment
+from benchmarks.synthetic import texts
+
+CRYPTO_WORDS = ['btc', 'bitcoin', 'eth', 'etherum', 'crypto']
+
+
+class IdentityLemmatizer:
+    def lemmatize(self, word):
+        return word
+
+
+def clean_before(text, stop_words, crypto_words, lemmatizer_class=WordNetLemmatizer):
+    text = re.sub(r'((www\.[^\s]+)|(http\S+))', ' ', text)
+    text = re.sub(r'#\w+', ' ', text)
+    text = re.sub(r'@\w+', ' ', text)
+    text = re.sub('[^A-Za-z]+', ' ', text)
+    text = re.sub(r'[\s]+', ' ', text)
+    text = TweetTokenizer().tokenize(text)
+    text = [t.lower() for t in text]
+    text = [w for w in text if w.isalpha()]
+    lemmatizer = lemmatizer_class()
+    text = [t for t in text if t not in (stop_words + crypto_words)]
+    text = [lemmatizer.lemmatize(t) for t in text]
+    return " ".join(text)
+
+
+def bench(corpus, stop_words, workers, lemmatizer_class=WordNetLemmatizer):
+    results = {}
+
+    t = time.perf_counter()
+    before = [clean_before(text, stop_words, CRYPTO_WORDS, lemmatizer_class) for text in corpus]
+    results["before"] = len(corpus) / (time.perf_counter() - t)
+
+    cleaner = sentiment.TextCleaner(stop_words, CRYPTO_WORDS)
+    for name, w in [("after", None), (f"after, {workers} workers", workers)]:
+        sentiment.lemmatize.cache_clear()
+        t = time.perf_counter()
+        after = cleaner.clean_batch(corpus, w)
+        results[name] = len(corpus) / (time.perf_counter() - t)
+        assert after == before
+    return results
+
+
+@click.command()
+@click.option("--texts", "n", default=20000, help="synthetic texts, ~30% duplicated")
+@click.option("--workers", "-w", default=4)
+@click.option("--no-wordnet/", is_flag=True, default=False, help="skip lemmatizing, for machines without wordnet")
+def main(n, workers, no_wordnet):
+    try:
+        stop_words = stopwords.words('english')
+    except LookupError:
+        stop_words = "i me my we our you your he him his she her it its they them the a an and or but if of to in on " \
+                     "at by for with about is are was were be been this that these those not no so very".split()
+
+    lemmatizer_class = WordNetLemmatizer
+    if no_wordnet:
+        lemmatizer_class = IdentityLemmatizer
+        sentiment.WordNetLemmatizer = IdentityLemmatizer
+
+    for name, rate in bench(texts(n), stop_words, workers, lemmatizer_class).items():
+        print(f"{name}: {rate:,.0f} texts/sec")
+
+
+if __name__ == '__main__':
+    main()
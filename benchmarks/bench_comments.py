@@ -0,0 +1,87 @@
+"""
+RedditMaker.search_comment_by_post_r, before (one post after another, PRAW comment lists) and after
+(comment trees expanded COMMENT_WORKERS at once, flattened straight into columns) against the stub reddit
+client of benchmarks.reddit, every request paying `latency` and taken out of one shared rate limit. one of the
+post ids is not on reddit: dropped by `info` before, answered 404 and skipped after.
+outputs are checked to be identical before the timings are reported.
+
+    python -m benchmarks.bench_comments --days 3 --latency 0.05 --rate 60 --workers 8
+"""
+import time
+
+import click
+import pandas as pd
+from praw.models import MoreComments
+
+from benchmarks.reddit import StubReddit
+from crypto.htmltext import clean_href_batch
+from crypto.ratelimit import RateLimiter
+from crypto.TextMaker import RedditMaker
+
+
+def comments_before(reddit, post_ids):
+    post_ids = ["t3_"+i for i in post_ids]
+
+    comments = []
+    post_iter = reddit.info(fullnames=post_ids)
+    for post in post_iter:
+        comment_obj = post.comments
+        comment_obj.replace_more(limit=RedditMaker.REPLACE_MORE)
+        comments.extend(comment_obj.list())
+
+    comment_list = []
+    for comment in comments:
+        if isinstance(comment, MoreComments):
+            continue
+        if comment.body in ["[deleted]", "[removed]", '']:
+            continue
+        comment_list.append(
+            [comment.subreddit, comment.link_id, comment.parent_id,
+             comment.id, comment.permalink, comment.created_utc, comment.body, comment.body_html,
+             comment.score, comment.downs, comment.ups]
+        )
+
+    comment_df = pd.DataFrame(comment_list, columns=RedditMaker.COMMENT_COLUMNS)
+    comment_df["body_clean"] = clean_href_batch(comment_df["body_html"], RedditMaker.HTML_WORKERS,
+                                                RedditMaker.HTML_CHUNK)
+    comment_df["subreddit"] = comment_df["subreddit"].apply(lambda x: x.display_name)
+
+    return comment_df
+
+
+def bench(days, latency, rate, workers, posts_per_day=50):
+    reddit = StubReddit(latency=latency, posts_per_day=posts_per_day, limiter=RateLimiter(rate))
+    start = pd.Timestamp("2022-01-01").timestamp()
+    posts = reddit.submissions("Bitcoin", start, start + days * 86400 - 1)
+    post_ids = [post["id"] for post in posts if post["num_comments"] > 0] + ["zzzzzz"]  # one reddit does not have
+    for post in posts:
+        reddit.comments(post)  # generated up front, only requests are timed
+    maker = RedditMaker("Bitcoin", "2022-01-01", "2022-01-01", reddit=reddit, api=lambda: None)
+    maker.COMMENT_WORKERS = workers
+
+    out = {}
+    for name, func in [("before", lambda: comments_before(reddit, post_ids)),
+                       ("after", lambda: maker.search_comment_by_post_r(post_ids))]:
+        reddit.calls = reddit.max_active = 0
+        t = time.perf_counter()
+        frame = func()
+        out[name] = (frame, time.perf_counter() - t, reddit.calls, reddit.max_active)
+
+    pd.testing.assert_frame_equal(out["before"][0], out["after"][0])
+    print(f"{len(post_ids)} posts, {len(out['after'][0])} comments, identical output")
+    for name, (_, seconds, calls, active) in out.items():
+        print(f"{name:>6}: {seconds:.2f}s, {calls} requests, at most {active} in flight")
+    print(f"speedup {out['before'][1] / out['after'][1]:.1f}x")
+
+
+@click.command()
+@click.option("--days", default=3, help="days of stub posts")
+@click.option("--latency", default=0.05, help="seconds per request")
+@click.option("--rate", default=60, help="requests per second, shared")
+@click.option("--workers", "-w", default=RedditMaker.COMMENT_WORKERS, help="comment trees expanded at once")
+def main(days, latency, rate, workers):
+    bench(days, latency, rate, workers)
+
+
+if __name__ == '__main__':
+    main()
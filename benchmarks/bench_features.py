@@ -0,0 +1,97 @@
+"""
+the feature memmaps of model.dataset.FeatureFile kept up to date with price_clean through incremental tech updates:
+synthetic minutes are saved piece by piece (each piece ending inside a bar, so the last stored bar is partial),
+after every piece update_price_tech appends to the h5 and FeatureFile.update to the memmaps, which are checked to
+equal the h5 bar for bar. then the incremental memmap update is timed against a rebuild. files go to a temporary
+directory.
+
+    python -m benchmarks.bench_features --days 30 --freq 1H
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+import crypto.cache as cache
+import crypto.PriceMaker as PriceMaker
+import crypto.pyramid as pyramid
+import crypto.store as store
+from benchmarks.synthetic import minute_bars
+from crypto.utils import price_config
+from model.dataset import FeatureFile
+
+GROUPS = ("Momentum Indicators", "Overlap Studies", "Volume Indicators")
+
+
+def make_pieces(days, pieces, ticker="BTCUSDT", start="2022-01-01", source="BN"):
+    """
+    days of minutes cut into `pieces`, every cut 37 minutes into an hour
+    """
+    start = int(pd.Timestamp(start).timestamp())
+    bars = minute_bars(ticker, start, start + days * 86400 - 60)
+    prices = pd.DataFrame({column: bars[column] for column in price_config[source]["columns"]})
+    cuts = start + 60 * (np.linspace(0, days * 1440, pieces + 1).astype(np.int64)[1:-1] // 60 * 60 + 37)
+    edges = np.searchsorted(prices.epoch.values, cuts)
+    return [piece.reset_index(drop=True) for piece in np.split(prices, edges)]
+
+
+def check(ticker, freq, root):
+    features = FeatureFile(ticker, freq, root)
+    stored = pd.read_hdf(*PriceMaker._price_tech_path(ticker, freq))
+    if features.columns != [str(col) for col in stored.columns] or \
+            not np.array_equal(features.epoch()[:], stored.index.values.astype("datetime64[s]").astype(np.int64)) or \
+            not np.array_equal(features.values()[:], stored.values.astype(np.float32), equal_nan=True):
+        raise Exception(f"{ticker}-{freq} memmaps differ from price_clean h5")
+
+
+def bench(days, freq, pieces, warmup, ticker="BTCUSDT", source="BN"):
+    chunks = make_pieces(days, pieces, ticker)
+    paths = [(store, "price_path"), (PriceMaker, "price_path"), (pyramid, "price_path"), (cache, "tech_cache_path")]
+    saved = [getattr(module, name) for module, name in paths]
+    root = tempfile.mkdtemp(prefix="bench-features-")
+    for module, name in paths:
+        setattr(module, name, root + "/")
+    features = os.path.join(root, "memmap")
+    try:
+        os.makedirs(os.path.join(root, source))
+        os.makedirs(os.path.join(root, "price_clean"))
+        with open(os.path.join(root, f"{source}/meta.json"), 'w') as f:
+            json.dump({ticker: {"start": str(pd.to_datetime(chunks[0].epoch[0], unit='s'))}}, f)
+
+        seconds = 0.0
+        for chunk in chunks:
+            PriceMaker.save_price(chunk, ticker, source, "h5")
+            PriceMaker.update_price_tech(ticker, source, freq, "h5", GROUPS, warmup)
+            t = time.perf_counter()
+            FeatureFile(ticker, freq, features).update()
+            seconds += time.perf_counter() - t
+            check(ticker, freq, features)
+        rows = FeatureFile(ticker, freq, features).rows
+        print(f"{rows} {freq} bars in {len(chunks)} pieces, memmaps identical to price_clean after every update")
+
+        shutil.rmtree(features)
+        t = time.perf_counter()
+        FeatureFile(ticker, freq, features).update()
+        print(f"incremental: {seconds / len(chunks):.4f}s per update\n    rebuild: {time.perf_counter() - t:.4f}s")
+    finally:
+        for (module, name), value in zip(paths, saved):
+            setattr(module, name, value)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+@click.command()
+@click.option("--days", default=30, help="days of minute bars")
+@click.option("--freq", default="1H")
+@click.option("--pieces", default=6, help="updates the minutes are saved in")
+@click.option("--warmup", default=200, help="stored bars recomputed by update_price_tech")
+def main(days, freq, pieces, warmup):
+    bench(days, freq, pieces, warmup)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+RedditMaker html cleaning, before (BeautifulSoup tree, find_all, get_text per tag) and after
+(crypto.htmltext.clean_href). outputs are checked to be identical on reddit-style samples, on the real
+selftext_html / body_html of the API responses in notebooks/reddit-test.ipynb and on random tag soup before
+anything is timed.
+
+    python -m benchmarks.bench_html --texts 20000 --workers 4
+"""
+import ast
+import html
+import json
+import os
+import time
+
+import click
+import numpy as np
+from bs4 import BeautifulSoup
+
+from benchmarks.synthetic import texts
+from crypto.htmltext import clean_href, clean_href_batch
+
+SAMPLES = [  # the shapes reddit's selftext_html / body_html come in
+    '<!-- SC_OFF --><div class="md"><p>Just bought more, see <a href="https://www.coinbase.com">coinbase</a> '
+    'fees &amp; all. It&#39;s fine.</p>\n</div><!-- SC_ON -->',
+    '<div class="md"><p>Is it too late?</p>\n\n<ul>\n<li>BTC</li>\n<li><strong>ETH</strong> &gt; 2k</li>\n'
+    '<li><em>nested <strong>bold <code>code</code></strong></em></li>\n</ul>\n</div>',
+    '<div class="md"><blockquote>\n<p>quoted &quot;text&quot;</p>\n</blockquote>\n\n<p>reply</p>\n'
+    '<pre><code>print(&quot;hi&quot;)\n  indented\n</code></pre>\n</div>',
+    '<div class="md"><table><thead>\n<tr>\n<th>coin</th>\n<th align="right">price</th>\n</tr>\n</thead><tbody>\n'
+    '<tr>\n<td>BTC</td>\n<td align="right">$20,000</td>\n</tr>\n</tbody></table>\n</div>',
+    '<div class="md"><p><a href="/r/Bitcoin">r/Bitcoin</a> and <a href="/u/someone">u/someone</a></p>\n'
+    '<p>&nbsp;</p>\n<hr/>\n<p>edit: <del>wrong</del> right<br/>\nline two</p>\n<h1>Title</h1>\n</div>',
+    '<div class="md"><p>unicode éè \U0001F680 &#128640; &#x1F680; &euro; &unknown; &amp &#147; &#0;</p></div>',
+    '<div class="md"><p>unclosed <em>tags <strong>everywhere</p><p>next</div> trailing',
+    '<div class="md"><ol>\n<li><p>one</p></li>\n<li><p>two <a>no href</a> <a href="">empty href</a></p></li>\n'
+    '</ol>\n<p><sup>sup</sup> <span class="md-spoiler-text">spoiler</span></p></div>',
+    '<p>before</p><div class="md"><div>inner <script>x = 1 < 2</script><style>p {}</style></div>'
+    '<![CDATA[cdata]]> <br> </br> <img src="x"></div><div>second div</div>',
+    '<a href="x"><div>in link</div></a><div class="md"><p>after link</p></div>',
+]
+
+
+NOTEBOOK = os.path.join(os.path.dirname(__file__), "../notebooks/reddit-test.ipynb")
+
+
+def reddit_samples(path=NOTEBOOK):
+    """
+    every distinct selftext_html / body_html in the reddit API responses printed in the notebook. the API
+    escapes them (no raw_json=1), so they are unescaped once, as praw hands them over
+    """
+    with open(path, 'r') as f:
+        notebook = json.load(f)
+    samples = []
+
+    def walk(item):
+        if isinstance(item, dict):
+            for key, value in item.items():
+                if key in ("selftext_html", "body_html") and isinstance(value, str):
+                    samples.append(html.unescape(value))
+                else:
+                    walk(value)
+        elif isinstance(item, list):
+            for value in item:
+                walk(value)
+
+    for cell in notebook["cells"]:
+        for output in cell.get("outputs", []):
+            text = "".join(output.get("data", {}).get("text/plain", ""))
+            if "_html'" not in text:
+                continue
+            try:
+                walk(ast.literal_eval(text))
+            except (ValueError, SyntaxError):  # not a printed response
+                pass
+    return list(dict.fromkeys(samples))
+
+
+def clean_before(text):
+    soup = BeautifulSoup(text, 'html.parser')
+    for a in soup.findAll('a', href=True):
+        a.extract()
+
+    try:
+        soup = soup.find('div')
+    except:
+        pass
+
+    ps = [p.get_text(strip=True, separator=' ') for p in soup.find_all()]
+    return ' '.join(ps)
+
+
+def tag_soup(n, seed=0):
+    """
+    random reddit-ish html with misnested / unclosed tags, entities, links and comments
+    """
+    rng = np.random.default_rng(seed)
+    words = texts(n, seed, duplicates=0)
+    pieces = ['<p>', '</p>', '<em>', '</em>', '<strong>', '</strong>', '<a href="https://x.io">', '<a>', '</a>',
+              '<ul><li>', '</li>', '</ul>', '<br>', '<br/>', '</br>', '<div>', '</div>', '&amp;', '&lt;', '&#39;',
+              '&nbsp;', '<!-- c -->', '<code>', '</code>', '<pre>', '</pre>', '\n', '  ', '&bogus;', '<hr>']
+    out = []
+    for text in words:
+        tokens = text.split(' ')
+        body = []
+        for token in tokens:
+            body.append(token)
+            if rng.random() < 0.4:
+                body.append(pieces[rng.integers(len(pieces))])
+        out.append('<!-- SC_OFF --><div class="md">' + ' '.join(body) + '</div><!-- SC_ON -->')
+    return out
+
+
+def check(corpus):
+    for text in corpus:
+        before = clean_before(text)
+        after = clean_href(text)
+        assert before == after, (text, before, after)
+    return len(corpus)
+
+
+def bench(corpus, workers):
+    results = {}
+    t = time.perf_counter()
+    before = [clean_before(text) for text in corpus]
+    results["before"] = len(corpus) / (time.perf_counter() - t)
+
+    for name, w in [("after", None), (f"after, {workers} workers", workers)]:
+        t = time.perf_counter()
+        after = clean_href_batch(corpus, w, chunksize=max(len(corpus) // (4 * workers), 1))
+        results[name] = len(corpus) / (time.perf_counter() - t)
+        assert after == before
+    return results
+
+
+@click.command()
+@click.option("--texts", "n", default=10000)
+@click.option("--workers", "-w", default=4)
+def main(n, workers):
+    print(f"identical on {check(SAMPLES) + check(reddit_samples()) + check(tag_soup(2000, seed=1))} texts")
+    for name, rate in bench(tag_soup(n), workers).items():
+        print(f"{name}: {rate:,.0f} texts/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+kline payload parsing per window, before (json -> np.array of str -> astype -> DataFrame.reindex) and after
+(crypto.kline.parse_klines). payloads are recorded from the stand-in exchange, or from the real exchanges
+with --record.
+
+    python -m benchmarks.bench_kline
+    python -m benchmarks.bench_kline --record benchmarks/payloads    # live binance / coinbase windows
+    python -m benchmarks.bench_kline --payloads benchmarks/payloads
+"""
+import glob
+import json
+import os
+import timeit
+
+import click
+import numpy as np
+import pandas as pd
+import requests
+
+from benchmarks.exchange import running
+from crypto.kline import parse_klines, to_frame
+from crypto.utils import price_config
+
+WINDOWS = {"BN": ("BTCUSDT", "2022-09-01 00:00", "2022-09-01 07:59"),
+           "CB": ("BTC-USD", "2022-09-01 00:00", "2022-09-01 03:59")}
+
+
+def record(host=None):
+    """
+    {source: (raw payload bytes, start, end)} of one full window per exchange
+    """
+    payloads = {}
+    for source, (ticker, start, end) in WINDOWS.items():
+        start, end = pd.to_datetime(start), pd.to_datetime(end)
+        url = host or price_config[source]["host"]
+        if source == "BN":
+            res = requests.get(f"{url}/api/v3/klines", params={
+                "symbol": ticker, "interval": "1m", "startTime": 1000 * int(start.timestamp()),
+                "endTime": 1000 * int(end.timestamp()), "limit": 1000})
+        else:
+            res = requests.get(f"{url}/products/{ticker}/candles", params={
+                "start": str(start), "end": str(end), "granularity": 60})
+        res.raise_for_status()
+        payloads[source] = (res.content, start, end)
+    return payloads
+
+
+def parse_before(payload, source, start, end):
+    price = np.array(json.loads(payload))
+    if source == "BN":
+        price = np.delete(price, [6, 9, 10, 11], axis=1)
+        index = (price[:, 0].astype(np.int64) / 1000).astype(int)
+    else:
+        index = price[:, 0].astype(int)
+    price = pd.DataFrame(price[:, 1:].astype(float), index=index, columns=price_config[source]["columns"][1:])
+    price = price.reindex(range(int(start.timestamp()), int(end.timestamp()) + 60, 60))
+    price.index.name = "epoch"
+    price.reset_index(inplace=True)
+    return price
+
+
+def parse_after(payload, source, start, end):
+    return to_frame(*parse_klines(payload, source, start, end), source)
+
+
+def bench(payloads, number=200):
+    results = {}
+    for source, (payload, start, end) in payloads.items():
+        before = parse_before(payload, source, start, end)
+        after = parse_after(payload, source, start, end)
+        pd.testing.assert_frame_equal(before, after, check_dtype=False)
+
+        results[source] = {
+            name: min(timeit.repeat(lambda: func(payload, source, start, end), number=number, repeat=3)) / number
+            for name, func in [("before", parse_before), ("after", parse_after)]
+        }
+    return results
+
+
+@click.command()
+@click.option("--payloads", default=None, help="directory of recorded payloads")
+@click.option("--record", "record_dir", default=None, help="record live payloads into this directory")
+@click.option("--number", "-n", default=200)
+def main(payloads, record_dir, number):
+    if record_dir is not None:
+        os.makedirs(record_dir, exist_ok=True)
+        for source, (payload, start, end) in record().items():
+            with open(os.path.join(record_dir, f"{source}_{int(start.timestamp())}_{int(end.timestamp())}.json"),
+                      'wb') as f:
+                f.write(payload)
+        return
+
+    if payloads is not None:
+        recorded = {}
+        for path in glob.glob(os.path.join(payloads, "*.json")):
+            source, start, end = os.path.basename(path)[:-len(".json")].split("_")
+            with open(path, 'rb') as f:
+                recorded[source] = (f.read(), pd.to_datetime(int(start), unit='s'), pd.to_datetime(int(end), unit='s'))
+    else:
+        with running() as (host, _):
+            recorded = record(host)
+
+    for source, t in bench(recorded, number).items():
+        print(f"{source}: before {1e6 * t['before']:.0f}us  after {1e6 * t['after']:.0f}us  "
+              f"({t['before'] / t['after']:.1f}x) per window")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+agreement & speed of the vectorized lexicon scorer (model.sentiment.LexiconScorer) against TextBlob on the
+same cleaned texts. stopwords are kept by default so negations and intensifiers reach the scorers.
+
+    python -m benchmarks.bench_sentiment --texts 20000
+"""
+import time
+
+import click
+import numpy as np
+from textblob import TextBlob
+
+import model.sentiment as sentiment
+from benchmarks.bench_clean import IdentityLemmatizer
+from benchmarks.synthetic import texts
+
+
+def report(corpus):
+    t = time.perf_counter()
+    reference = np.array([tuple(TextBlob(text).sentiment) for text in corpus]).reshape(-1, 2)
+    textblob = time.perf_counter() - t
+
+    scorer = sentiment.LexiconScorer()
+    t = time.perf_counter()
+    polarity, subjectivity = scorer.score(corpus)
+    lexicon = time.perf_counter() - t
+
+    results = {"texts": len(corpus), "textblob_sec": textblob, "lexicon_sec": lexicon, "speedup": textblob / lexicon}
+    for name, ours, theirs in [("polarity", polarity, reference[:, 0]), ("subjectivity", subjectivity, reference[:, 1])]:
+        results[name] = {
+            "exact": float(np.isclose(ours, theirs).mean()),
+            "mae": float(np.abs(ours - theirs).mean()),
+            "corr": float(np.corrcoef(ours, theirs)[0, 1]),
+            "sign": float((np.sign(ours) == np.sign(theirs)).mean()),
+        }
+    return results
+
+
+@click.command()
+@click.option("--texts", "n", default=20000)
+@click.option("--stopwords/", is_flag=True, default=False, help="clean with a small stopword list incl. negations")
+@click.option("--no-wordnet/", is_flag=True, default=False, help="skip lemmatizing, for machines without wordnet")
+def main(n, stopwords, no_wordnet):
+    if no_wordnet:
+        sentiment.WordNetLemmatizer = IdentityLemmatizer
+    drop = "the a an is are to and of it this that not no very so".split() if stopwords else []
+    corpus = sentiment.TextCleaner(drop).clean_batch(texts(n, duplicates=0))
+
+    results = report(corpus)
+    print(f"{results['texts']} texts: textblob {results['textblob_sec']:.2f}s  lexicon {results['lexicon_sec']:.3f}s  "
+          f"({results['speedup']:.0f}x)")
+    for name in ["polarity", "subjectivity"]:
+        r = results[name]
+        print(f"{name}: identical {r['exact']:.2%}  mae {r['mae']:.4f}  corr {r['corr']:.4f}  same sign {r['sign']:.2%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+the h5 and parquet price stores side by side: the same synthetic minutes are saved to both (in make_price sized
+chunks, so parquet gets several parts per month), get_clean_price is checked to return identical frames from
+either store (raw minutes, resampled, from a start on or inside a bar), before and after the parquet months are
+compacted into one file each (zero-copy, read-only columns), and once more with the pyramid built for h5 (bars
+from the pyramid against bars resampled from parquet minutes, equal up to summation order), then save & read are
+timed. files go to a temporary directory.
+
+    python -m benchmarks.bench_store --days 90
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+import crypto.PriceMaker as PriceMaker
+import crypto.pyramid as pyramid
+import crypto.store as store
+from benchmarks.synthetic import minute_bars
+from crypto.utils import price_config
+
+STORES = ["h5", "parquet"]
+CHECKS = [(None, None), ("1H", None), ("15min", None), ("4H", "2022-01-03 05:17"), (None, "2022-01-02 12:00"),
+          ("1H", "2022-01-02 12:01"), ("2H", "2022-01-02 13:07"), ("15min", "2022-01-04 00:03"),
+          ("1D", "2022-01-05 00:00")]
+
+
+def make_chunks(days, ticker="BTCUSDT", start="2022-01-01", source="BN"):
+    start = int(pd.Timestamp(start).timestamp())
+    bars = minute_bars(ticker, start, start + days * 86400 - 60)
+    prices = pd.DataFrame({column: bars[column] for column in price_config[source]["columns"]})
+    rows = PriceMaker.chunk_rows(source)
+    return [prices[(prices.epoch - start) // 60 // rows == i].reset_index(drop=True)
+            for i in range(-(-days * 1440 // rows))]
+
+
+def check(ticker="BTCUSDT", source="BN", exact=True):
+    for freq, start in CHECKS:
+        h5, parquet = [PriceMaker.get_clean_price(ticker, source, freq, name, start=start) for name in STORES]
+        if not (h5.equals(parquet) if exact else h5.index.equals(parquet.index) and
+                np.allclose(h5.values, parquet.values, rtol=1e-9, atol=0)):
+            raise Exception(f"get_clean_price(freq={freq}, start={start}) differs between the h5 & parquet stores")
+
+
+def bench(days, repeat=3, ticker="BTCUSDT", source="BN"):
+    chunks = make_chunks(days, ticker)
+    paths = [(store, "price_path"), (PriceMaker, "price_path"), (pyramid, "price_path")]
+    saved = [getattr(module, name) for module, name in paths]
+    root = tempfile.mkdtemp(prefix="bench-store-")
+    for module, name in paths:
+        setattr(module, name, root + "/")
+    try:
+        os.makedirs(os.path.join(root, source))
+        with open(os.path.join(root, f"{source}/meta.json"), 'w') as f:
+            json.dump({ticker: {"start": str(pd.to_datetime(chunks[0].epoch[0], unit='s'))}}, f)
+
+        seconds = {}
+        for name in STORES:
+            t = time.perf_counter()
+            for chunk in chunks:
+                PriceMaker.save_price(chunk, ticker, source, name)
+            seconds[name] = [time.perf_counter() - t]
+        check(ticker, source)
+        store.ParquetPriceStore().compact(ticker, source)
+        check(ticker, source)
+        print(f"{sum(len(chunk) for chunk in chunks)} minutes in {len(chunks)} chunks, "
+              f"get_clean_price identical from both stores")
+        pyramid.build_pyramid(ticker, source, "h5")
+        check(ticker, source, exact=False)
+        print("h5 bars from the pyramid equal to parquet bars from minutes")
+        shutil.rmtree(os.path.join(root, "pyramid"))  # the timings read minutes
+
+        for name in STORES:
+            for freq in [None, "1H"]:
+                seconds[name].append(min(_timed(PriceMaker.get_clean_price, ticker, source, freq, name)
+                                         for _ in range(repeat)))
+        for name in STORES:
+            print(f"{name:8}: save {seconds[name][0]:.3f}s, get_clean_price {seconds[name][1]:.3f}s (minutes) "
+                  f"{seconds[name][2]:.3f}s (1H)")
+    finally:
+        for (module, name), value in zip(paths, saved):
+            setattr(module, name, value)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _timed(func, *args):
+    t = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - t
+
+
+@click.command()
+@click.option("--days", default=90, help="days of minute bars")
+@click.option("--repeat", default=3)
+def main(days, repeat):
+    bench(days, repeat)
+
+
+if __name__ == '__main__':
+    main()
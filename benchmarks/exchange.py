@@ -0,0 +1,125 @@
+"""
+local stand-in for the binance / coinbase kline endpoints, serving benchmarks.synthetic bars.
+
+    python -m benchmarks.exchange --port 8080 --latency 0.05 --rate-limit 10
+
+then point the fetchers at it, e.g. `python -m crypto make-price ... --host http://127.0.0.1:8080`
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import click
+import pandas as pd
+
+from benchmarks.synthetic import klines_bn, klines_cb
+
+
+class ExchangeHandler(BaseHTTPRequestHandler):
+    # set per server in `serve`
+    latency = 0.0
+    rate_limit = None
+    listed = {}
+    stamps = None
+    lock = None
+    requests = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if self.latency:
+            time.sleep(self.latency)
+        if not self._within_limit():
+            return self._send(429, {"code": -1003, "msg": "Too many requests"}, {"Retry-After": "1"})
+
+        if url.path == "/api/v3/klines":
+            ticker = query["symbol"]
+            end = int(query["endTime"]) if "endTime" in query else None
+            return self._send(200, klines_bn(ticker, int(query["startTime"]), end, int(query.get("limit", 500)),
+                                             self.listed.get(ticker)))
+
+        parts = url.path.strip("/").split("/")
+        if len(parts) == 3 and parts[0] == "products" and parts[2] == "candles":
+            start = int(pd.to_datetime(query["start"]).timestamp())
+            end = int(pd.to_datetime(query["end"]).timestamp())
+            if (end - start) // 60 + 1 > 300:
+                return self._send(400, {"message": "granularity too small for the requested time range"})
+            return self._send(200, klines_cb(parts[1], start, end, self.listed.get(parts[1])))
+
+        return self._send(404, {"message": "NotFound"})
+
+    def _within_limit(self):
+        with self.lock:
+            type(self).requests += 1
+            if self.rate_limit is None:
+                return True
+            now = time.monotonic()
+            while self.stamps and now - self.stamps[0] >= 1:
+                self.stamps.popleft()
+            if len(self.stamps) >= self.rate_limit:
+                return False
+            self.stamps.append(now)
+            return True
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(port=0, latency=0.0, rate_limit=None, listed=None):
+    """
+    start the stand-in exchange on a background thread; `listed` maps ticker -> first epoch with bars
+    """
+    handler = type("Handler", (ExchangeHandler,), {
+        "latency": latency, "rate_limit": rate_limit, "listed": listed or {},
+        "stamps": deque(), "lock": threading.Lock(), "requests": 0
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@contextmanager
+def running(**kwargs):
+    """
+    with running(latency=0.05) as (host, server): ...
+    """
+    server = serve(**kwargs)
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}", server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@click.command()
+@click.option("--port", "-p", default=8080)
+@click.option("--latency", "-l", default=0.0, help="seconds added to every response")
+@click.option("--rate-limit", "-r", default=None, type=int, help="requests per second before 429")
+def main(port, latency, rate_limit):
+    server = serve(port, latency, rate_limit)
+    print(f"stand-in exchange on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""
+offline stand-ins for the pushshift (pmaw) and reddit (praw) clients RedditMaker talks to, serving
+deterministic synthetic posts & comments with a configurable latency per call.
+
+    from benchmarks.reddit import StubPushshift, StubReddit
+    reddit = StubReddit(latency=0.05)
+    maker = RedditMaker("Bitcoin,ethereum", "2022-01-01", "2022-01-31", workers=4, reddit=reddit,
+                        api=lambda: StubPushshift(reddit, latency=0.2))
+"""
+import threading
+import time
+import zlib
+
+import numpy as np
+import requests
+from praw.models import MoreComments
+from prawcore.exceptions import NotFound
+
+from benchmarks.synthetic import texts
+
+
+def base36(n):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = digits[r] + out
+        if n == 0:
+            return out
+
+
+class Subreddit:
+    def __init__(self, display_name):
+        self.display_name = display_name
+
+    def __str__(self):
+        return self.display_name
+
+
+class Comment:
+    def __init__(self, fields):
+        self.__dict__.update(fields)
+        self.replies = []
+
+
+class More(MoreComments):
+    """
+    placeholder for a hidden chunk of comments, as reddit returns them
+    """
+
+    def __init__(self, chunk):
+        self.chunk = chunk
+
+    def __repr__(self):
+        return f"<More {self.chunk}>"
+
+
+class CommentForest:
+    """
+    the first 100 comments are in the tree, every further 100 sit behind a More placeholder
+    until replace_more fetches them (one request each)
+    """
+
+    def __init__(self, reddit, comments):
+        self._reddit = reddit
+        self._comments = [Comment(comment) for comment in comments]
+        self._shown = 1
+        self._build()
+
+    def _build(self):
+        shown = self._comments[:100 * self._shown]
+        by_name = {f"t1_{comment.id}": comment for comment in shown}
+        self._top = []
+        for comment in shown:
+            comment.replies = []
+            parent = by_name.get(comment.parent_id)
+            (self._top if parent is None else parent.replies).append(comment)
+        self._top.extend(More(chunk) for chunk in range(self._shown, -(-len(self._comments) // 100)))
+
+    def __getitem__(self, index):
+        return self._top[index]
+
+    def __len__(self):
+        return len(self._top)
+
+    def replace_more(self, limit=32):
+        while self._shown * 100 < len(self._comments) and (limit is None or limit > 0):
+            self._reddit.call()
+            self._shown += 1
+            limit = None if limit is None else limit - 1
+        self._build()
+        return []
+
+    def list(self):
+        comments = []
+        queue = list(self._top)
+        while queue:
+            comment = queue.pop(0)
+            comments.append(comment)
+            if not isinstance(comment, MoreComments):
+                queue.extend(comment.replies)
+        return comments
+
+
+class Submission:
+    def __init__(self, reddit, post):
+        self.id = post["id"]
+        self._reddit = reddit
+        self._post = post
+        self._comments = None
+
+    @property
+    def comments(self):
+        # fetched on first access, like praw; reddit answers 404 for a post it does not have
+        if self._comments is None:
+            self._reddit.call()
+            if "num_comments" not in self._post:
+                response = requests.Response()
+                response.status_code = 404
+                raise NotFound(response)
+            self._comments = CommentForest(self._reddit, self._reddit.comments(self._post))
+        return self._comments
+
+
+class StubReddit:
+    """
+    praw.Reddit stand-in: `info` / `submission` give submissions whose comment forest holds `num_comments` comments.
+    posts are looked up in what StubPushshift handed out before (or registered through `submissions`).
+    `limiter` (crypto.ratelimit.RateLimiter) plays the shared request budget of LimitedRequestor
+    """
+
+    def __init__(self, latency=0.0, posts_per_day=20, seed=0, limiter=None):
+        self.latency = latency
+        self.limiter = limiter
+        self.posts_per_day = posts_per_day
+        self.seed = seed
+        self.posts = {}
+        self._comments = {}
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def call(self):
+        if self.limiter is not None:
+            self.limiter.acquire()
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def info(self, fullnames):
+        for i in range(0, len(fullnames), 100):  # praw asks for 100 things per request
+            self.call()
+            for name in fullnames[i:i + 100]:
+                post = self.posts.get(name[len("t3_"):])
+                if post is not None:
+                    yield Submission(self, post)
+
+    def submission(self, id):
+        return Submission(self, self.posts.get(id, {"id": id}))  # lazy, like praw: nothing fetched yet
+
+    def submissions(self, subreddit, start, end):
+        """
+        the posts of one subreddit created within [start, end], registered for later lookups
+        """
+        out = []
+        for day in range(int(start) // 86400, int(end) // 86400 + 1):
+            rng = np.random.default_rng([self.seed, zlib.crc32(f"{subreddit}/{day}".encode())])
+            titles = texts(self.posts_per_day, seed=int(rng.integers(2 ** 31)), duplicates=0)
+            bodies = texts(self.posts_per_day, seed=int(rng.integers(2 ** 31)))
+            created = day * 86400 + np.sort(rng.integers(0, 86400, self.posts_per_day))
+            comments = rng.zipf(1.6, self.posts_per_day) - 1
+            for i in range(self.posts_per_day):
+                if not start <= created[i] <= end:
+                    continue
+                pid = base36(day * 10 ** 6 + zlib.crc32(subreddit.lower().encode()) % 1000 * 1000 + i)
+                body = bodies[i] if i % 7 else "[removed]"
+                out.append({
+                    "subreddit": Subreddit(subreddit), "subreddit_subscribers": 100000,
+                    "id": pid, "permalink": f"/r/{subreddit}/comments/{pid}/", "url": f"https://redd.it/{pid}",
+                    "created_utc": int(created[i]), "title": titles[i], "selftext": body,
+                    "selftext_html": f'<!-- SC_OFF --><div class="md"><p>{body}</p>\n</div><!-- SC_ON -->',
+                    "num_comments": int(min(comments[i], 2000)), "score": int(comments[i] * 3),
+                    "downs": 0, "ups": int(comments[i] * 3), "upvote_ratio": 0.9,
+                })
+        with self._lock:
+            self.posts.update((post["id"], post) for post in out)
+        return out
+
+    def comments(self, post):
+        if post["id"] not in self._comments:
+            self._comments[post["id"]] = self._make_comments(post)
+        return self._comments[post["id"]]
+
+    def _make_comments(self, post):
+        rng = np.random.default_rng([self.seed, zlib.crc32(post["id"].encode())])
+        n = post["num_comments"]
+        bodies = texts(n, seed=int(rng.integers(2 ** 31)))
+        created = post["created_utc"] + np.sort(rng.integers(0, 3 * 86400, n))
+        out = []
+        for i in range(n):
+            cid = base36(int(post["id"], 36) * 4096 + i)
+            parent = f"t3_{post['id']}" if i == 0 or rng.random() < 0.5 else f"t1_{out[-1]['id']}"
+            body = bodies[i] if i % 11 else "[deleted]"
+            out.append({
+                "subreddit": post["subreddit"], "link_id": f"t3_{post['id']}", "parent_id": parent,
+                "id": cid, "permalink": f"{post['permalink']}{cid}/", "created_utc": int(created[i]),
+                "body": body, "body_html": f'<div class="md"><p>{body}</p>\n</div>',
+                "score": int(rng.integers(-5, 50)), "downs": 0, "ups": 1,
+            })
+        return out
+
+
+class StubPushshift:
+    """
+    pmaw.PushshiftAPI stand-in over the posts of a StubReddit; one call per `search_*`
+    """
+
+    def __init__(self, reddit, latency=0.0):
+        self.reddit = reddit
+        self.latency = latency
+
+    def _call(self):
+        with self.reddit._lock:
+            self.reddit.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def search_submissions(self, subreddit, limit=None, filter_fn=None, after=None, before=None):
+        self._call()
+        posts = [post for sub in subreddit.split(',') for post in self.reddit.submissions(sub, after, before)]
+        return [post for post in posts if filter_fn is None or filter_fn(post)][:limit]
+
+    def search_comments(self, subreddit, limit=None, filter_fn=None, after=None, before=None):
+        self._call()
+        comments = [comment for sub in subreddit.split(',') for post in self.reddit.submissions(sub, after, before)
+                    for comment in self.reddit.comments(post)]
+        return [comment for comment in comments if filter_fn is None or filter_fn(comment)][:limit]
+
+    def search_submission_comment_ids(self, ids, limit=None):
+        self._call()
+        comments = [comment for pid in ids if pid in self.reddit.posts
+                    for comment in self.reddit.comments(self.reddit.posts[pid])]
+        return comments[:limit]
@@ -0,0 +1,362 @@
+"""
+the benchmark suite: every hot path on synthetic data (benchmarks.synthetic klines, texts & tweets, the stub reddit
+clients of benchmarks.reddit), fetchers against the stand-in exchange of benchmarks.exchange, files written to a
+temporary directory. a case is timed best of `repeat`, the report (JSON: commit, versions, machine, seconds &
+throughput per case) is compared with the report of another commit by `compare`.
+
+    python -m benchmarks.suite run -o bench-new.json
+    python -m benchmarks.suite run -k kline -k sentiment --scale 0.2    # cases whose name contains kline / sentiment
+    python -m benchmarks.suite compare bench-old.json bench-new.json --threshold 0.1
+"""
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime
+from importlib.metadata import version, PackageNotFoundError
+
+import click
+import pandas as pd
+from tqdm import tqdm
+
+import crypto.PriceMaker as PriceMaker
+import crypto.pyramid as pyramid
+import crypto.store as store
+import crypto.TextMaker as TextMaker
+import model.sentiment as sentiment
+from benchmarks.bench_accumulate import make_windows, accumulate_buffer
+from benchmarks.bench_backtest import make_closes
+from benchmarks.bench_clean import IdentityLemmatizer
+from benchmarks.bench_kline import record, parse_after
+from benchmarks.exchange import running
+from benchmarks.reddit import StubPushshift, StubReddit
+from benchmarks.synthetic import minute_bars, texts, tweets
+from crypto.utils import price_config
+
+PACKAGES = ["numpy", "pandas", "tables", "pyarrow", "fastparquet", "TA-Lib", "textblob", "nltk", "scipy", "aiohttp"]
+STOPWORDS = "the a an is are to and of it this that so".split()
+CRYPTO_WORDS = ['btc', 'bitcoin', 'eth', 'etherum', 'crypto']
+START = int(pd.Timestamp("2022-01-01").timestamp())
+CASES = {}  # name -> (setup, unit)
+
+
+def case(name, unit):
+    """
+    register a case: setup(scale) is a generator yielding (run, items), run() being what is timed and items
+    the number of `unit` one run goes through; code after the yield cleans up
+    """
+    def register(func):
+        CASES[name] = (contextmanager(func), unit)
+        return func
+    return register
+
+
+@contextmanager
+def scratch():
+    """
+    price & text paths of the crypto modules pointed at a temporary directory
+    """
+    paths = [(store, "price_path"), (PriceMaker, "price_path"), (pyramid, "price_path"), (TextMaker, "text_path")]
+    saved = [getattr(module, name) for module, name in paths]
+    root = tempfile.mkdtemp(prefix="bench-")
+    for module, name in paths:
+        setattr(module, name, root + "/")
+    for source in price_config:
+        os.makedirs(os.path.join(root, source))
+    try:
+        yield root
+    finally:
+        for (module, name), value in zip(paths, saved):
+            setattr(module, name, value)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+@contextmanager
+def local_exchange(sources=("BN", "CB")):
+    """
+    the stand-in exchange running, price_config hosts pointed at it and the request budgets lifted
+    """
+    saved = {source: dict(price_config[source]) for source in sources}
+    with running() as (host, server):
+        for source in sources:
+            price_config[source].update(host=host, rate_limit=10 ** 6)
+        try:
+            yield host, server
+        finally:
+            for source in sources:
+                price_config[source].update(saved[source])
+
+
+def price_frame(ticker, days, source="BN"):
+    bars = minute_bars(ticker, START, START + days * 86400 - 60)
+    return pd.DataFrame({column: bars[column] for column in price_config[source]["columns"]})
+
+
+# price
+
+for source in ["BN", "CB"]:
+    @case(f"kline.parse_{source.lower()}", "rows")
+    def _parse(scale, source=source):
+        with running() as (host, _):
+            payload, start, end = record(host)[source]
+        windows = max(1, int(50 * scale))
+        rows = len(parse_after(payload, source, start, end))
+        yield (lambda: [parse_after(payload, source, start, end) for _ in range(windows)]), windows * rows
+
+    @case(f"fetch.price_{source.lower()}", "rows")
+    def _fetch(scale, source=source):
+        price_func = PriceMaker.price_bn if source == "BN" else PriceMaker.price_cb
+        interval = pd.to_timedelta(price_config[source]["interval"])
+        interval_1 = pd.to_timedelta(price_config[source]["interval_1"])
+        windows = [(s, s + interval_1) for s in pd.date_range("2022-01-01", periods=max(1, int(30 * scale)),
+                                                               freq=interval)]
+        bar = tqdm(disable=True)
+
+        def run():
+            PriceMaker.rate_ctrl_t = [0.0] * len(windows)  # the local exchange has no request budget
+            return sum(len(price_func(f"BTC{source}", s, e, bar)) for s, e in windows)
+
+        with local_exchange([source]):
+            yield run, run()
+
+
+@case("fetch.make_price_async", "rows")
+def _make_price_async(scale):
+    from crypto.fetcher import make_price_async
+
+    tickers = [f"T{i}USDT" for i in range(4)]
+    days = max(1, int(4 * scale))
+
+    with scratch() as root, local_exchange(["BN"]):
+        def run():
+            shutil.rmtree(os.path.join(root, "BN"))
+            os.makedirs(os.path.join(root, "BN"))
+            made = make_price_async(tickers, "2022-01-01", pd.Timestamp("2022-01-01") + pd.Timedelta(days=days - 1),
+                                    "BN", concurrency=16, store="h5")
+            return sum(m[2] for m in made.values())
+
+        yield run, run()
+
+
+@case("price.accumulate", "rows")
+def _accumulate(scale):
+    windows = make_windows(max(1, int(300 * scale)))
+    yield (lambda: accumulate_buffer(windows)), sum(len(w) for w in windows)
+
+
+for name in ["h5", "parquet"]:
+    @case(f"price.save_{name}", "rows")
+    def _save(scale, name=name):
+        prices = price_frame("BTCUSDT", max(1, int(30 * scale)))
+        with scratch():
+            count = iter(range(10 ** 6))
+            yield (lambda: PriceMaker.save_price(prices, f"T{next(count)}USDT", "BN", name)), len(prices)
+
+    @case(f"price.get_clean_price_{name}", "rows")
+    def _clean(scale, name=name):
+        prices = price_frame("BTCUSDT", max(1, int(90 * scale)))
+        with scratch() as root:
+            PriceMaker.save_price(prices, "BTCUSDT", "BN", name)
+            with open(os.path.join(root, "BN/meta.json"), 'w') as f:
+                json.dump({"BTCUSDT": {"start": str(pd.to_datetime(START, unit='s'))}}, f)
+            yield (lambda: PriceMaker.get_clean_price("BTCUSDT", "BN", "1H", name)), len(prices)
+
+
+@case("tech.get_tech_factor", "bars")
+def _tech(scale):
+    prices = price_frame("BTCUSDT", max(1, int(180 * scale)))
+    prices.index = pd.to_datetime(prices.pop("epoch"), unit='s')
+    bars = pyramid.resample_bars(prices, "5min")[["open", "high", "low", "close", "volume"]].dropna()
+    yield (lambda: PriceMaker.get_tech_factor(bars)), len(bars)
+
+
+@case("backtest.run", "combinations x bars")
+def _backtest(scale):
+    from model.backtest import Backtest, param_grid
+
+    epoch, close, signal = make_closes(max(1, int(30 * scale)), 10)
+    grid = param_grid(signal=range(len(signal)), entry=[0.0005, 0.001, 0.002, 0.005], lag=[0, 1], fee=[0.0, 0.001])
+    yield (lambda: Backtest(epoch, close).run(signal, grid)), len(grid["entry"]) * len(epoch)
+
+
+# reddit & sentiment
+
+def _reddit(days, posts_per_day=200):
+    reddit = StubReddit(posts_per_day=posts_per_day)
+    maker = TextMaker.RedditMaker("Bitcoin", "2022-01-01", "2022-01-01", reddit=reddit,
+                                  api=lambda: StubPushshift(reddit))
+    return maker, START, START + days * 86400 - 1
+
+
+@case("reddit.search_post", "posts")
+def _search_post(scale):
+    maker, start, end = _reddit(max(1, int(10 * scale)))
+    posts = maker.search_post("Bitcoin", start, end)  # stub posts generated before timing
+    yield (lambda: maker.search_post("Bitcoin", start, end)), len(posts)
+
+
+@case("reddit.clean_href", "texts")
+def _clean_href(scale):
+    from crypto.htmltext import clean_href_batch
+
+    html = [f'<div class="md"><p>{text} <a href="https://example.com/{i}">link</a></p>\n</div>'
+            for i, text in enumerate(texts(max(1, int(20000 * scale)), duplicates=0))]
+    Maker = TextMaker.RedditMaker
+    yield (lambda: clean_href_batch(html, Maker.HTML_WORKERS, Maker.HTML_CHUNK)), len(html)
+
+
+@case("reddit.save_text", "posts")
+def _save_text(scale):
+    maker, start, end = _reddit(max(1, int(10 * scale)))
+    posts = maker.search_post("Bitcoin", start, end)
+    with scratch():
+        maker.save_text(posts, 'p')
+        yield (lambda: maker.save_text(posts, 'p')), len(posts)  # appends, as every fetched window does
+
+
+@case("text.clean", "texts")
+def _text_clean(scale):
+    corpus = texts(max(1, int(20000 * scale)))
+    cleaner = sentiment.TextCleaner(STOPWORDS, CRYPTO_WORDS)
+    yield (lambda: cleaner.clean_batch(corpus)), len(corpus)
+
+
+for engine in ["textblob", "lexicon"]:
+    @case(f"sentiment.{engine}", "texts")
+    def _score(scale, engine=engine):
+        corpus = sentiment.TextCleaner(STOPWORDS).clean_batch(texts(max(1, int(5000 * scale))))
+        yield (lambda: sentiment.get_scorer(engine, cache=None).score(corpus)), len(corpus)
+
+
+@case("sentiment.tweets", "tweets")
+def _tweets(scale):
+    data = tweets(max(1, int(5000 * scale)))
+    yield (lambda: sentiment.tweetSentimentAnalysis(data, STOPWORDS, CRYPTO_WORDS, cache=None)), len(data)
+
+
+# running & comparing
+
+def run_case(name, scale, repeat):
+    setup, unit = CASES[name]
+    try:
+        with setup(scale) as (func, items):
+            runs = []
+            for _ in range(repeat):
+                t = time.perf_counter()
+                func()
+                runs.append(time.perf_counter() - t)
+    except Exception as ex:
+        return {"error": "".join(traceback.format_exception_only(type(ex), ex)).strip()}
+    best = min(runs)
+    return {"seconds": best, "runs": runs, "items": items, "unit": unit, "per_sec": items / best if best else None}
+
+
+def environment():
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    packages = {}
+    for package in PACKAGES:
+        try:
+            packages[package] = version(package)
+        except PackageNotFoundError:
+            packages[package] = None
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": None if status is None else status != "",
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "packages": packages,
+    }
+
+
+def compare_reports(old, new, threshold=0.1):
+    """
+    DataFrame per case of both reports: seconds, new / old ratio and a verdict beyond `threshold`
+    """
+    rows = []
+    for name in sorted(set(old["cases"]) | set(new["cases"])):
+        a, b = old["cases"].get(name, {}), new["cases"].get(name, {})
+        ratio = b["seconds"] / a["seconds"] if "seconds" in a and "seconds" in b else None
+        if ratio is None:
+            verdict = "missing" if not a or not b else "error"
+        elif ratio > 1 + threshold:
+            verdict = "slower"
+        elif ratio < 1 / (1 + threshold):
+            verdict = "faster"
+        else:
+            verdict = ""
+        rows.append({"case": name, "old": a.get("seconds"), "new": b.get("seconds"), "ratio": ratio,
+                     "verdict": verdict})
+    return pd.DataFrame(rows).set_index("case")
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option("--output", "-o", default=None, help="report path, default bench-{commit}.json")
+@click.option("--scale", "-s", default=1.0, help="data size factor")
+@click.option("--repeat", "-r", default=3)
+@click.option("--case", "-k", "patterns", multiple=True, help="only cases whose name contains this")
+@click.option("--no-wordnet/", is_flag=True, default=False, help="skip lemmatizing, for machines without wordnet")
+def run(output, scale, repeat, patterns, no_wordnet):
+    """time the cases and write the report"""
+    if no_wordnet:
+        sentiment.WordNetLemmatizer = IdentityLemmatizer
+
+    report = environment()
+    report.update({"scale": scale, "repeat": repeat, "wordnet": not no_wordnet, "cases": {}})
+    names = [name for name in CASES if not patterns or any(p in name for p in patterns)]
+    for name in names:
+        result = report["cases"][name] = run_case(name, scale, repeat)
+        if "error" in result:
+            print(f"{name:<30} failed: {' '.join(result['error'].split())[:120]}")
+        else:
+            print(f"{name:<30} {result['seconds']:9.4f}s  {result['per_sec']:14,.0f} {result['unit']}/s")
+
+    output = output or f"bench-{(report['commit'] or 'local')[:8]}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f"report written to {output}")
+
+
+@cli.command()
+@click.argument("old")
+@click.argument("new")
+@click.option("--threshold", "-t", default=0.1, help="relative change reported as slower / faster")
+@click.option("--fail/", is_flag=True, default=False, help="exit 1 if a case got slower")
+def compare(old, new, threshold, fail):
+    """compare two reports case by case"""
+    with open(old, 'r') as f:
+        old = json.load(f)
+    with open(new, 'r') as f:
+        new = json.load(f)
+    for report in [old, new]:
+        print(f"{(report['commit'] or 'local')[:8]}{' (dirty)' if report['dirty'] else ''}  {report['created']}  "
+              f"scale {report['scale']}  python {report['python']}  {report['cpus']} cpus")
+    if old["scale"] != new["scale"]:
+        print("reports were made at different scales, seconds are not comparable")
+
+    table = compare_reports(old, new, threshold)
+    print(table.to_string(float_format=lambda x: f"{x:.4f}"))
+    if fail and (table.verdict == "slower").any():
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    cli()
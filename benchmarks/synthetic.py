@@ -0,0 +1,103 @@
+import zlib
+
+import numpy as np
+import pandas as pd
+
+
+def minute_bars(ticker, start, end, listed=None):
+    """
+    deterministic 1-minute ohlcv bars for epoch seconds [start, end].
+    the same ticker & minute always give the same bar; ~1% of minutes are missing like a thin market
+    """
+    seed = zlib.crc32(ticker.encode())
+    if listed is not None:
+        start = max(start, listed)
+    m = np.arange(-(-start // 60), end // 60 + 1, dtype=np.int64)
+    m = m[(m + seed) % 97 != 0]
+
+    noise = ((m * 2654435761 + seed) % 10007) / 10007.0
+    close = 100 + seed % 900 + 10 * np.sin(m / 1440) + noise
+    open_ = close + (noise - 0.5) * 0.2
+    volume = 1 + noise * 10
+
+    return {
+        "epoch": m * 60,
+        "open": open_,
+        "high": np.maximum(open_, close) + noise * 0.1,
+        "low": np.minimum(open_, close) - noise * 0.1,
+        "close": close,
+        "volume": volume,
+        "amount": volume * close,
+        "count": (noise * 100).astype(np.int64),
+    }
+
+
+def klines_bn(ticker, start_ms, end_ms=None, limit=500, listed=None):
+    """
+    /api/v3/klines payload (list of 12-field rows, numbers as strings like the real thing)
+    """
+    end = end_ms // 1000 if end_ms is not None else start_ms // 1000 + 60 * (limit - 1)
+    bars = minute_bars(ticker, start_ms // 1000, end, listed)
+    return [
+        [int(t) * 1000, f"{o:.8f}", f"{h:.8f}", f"{lo:.8f}", f"{c:.8f}", f"{v:.8f}", int(t) * 1000 + 59999,
+         f"{a:.8f}", int(n), f"{v / 2:.8f}", f"{a / 2:.8f}", "0"]
+        for t, o, h, lo, c, v, a, n in zip(*[bars[k][:limit] for k in
+                                              ["epoch", "open", "high", "low", "close", "volume", "amount", "count"]])
+    ]
+
+
+def klines_cb(ticker, start, end, listed=None):
+    """
+    /products/{ticker}/candles payload: [time, low, high, open, close, volume], newest first
+    """
+    bars = minute_bars(ticker, start, end, listed)
+    rows = [
+        [int(t), lo, h, o, c, v]
+        for t, lo, h, o, c, v in zip(*[bars[k] for k in ["epoch", "low", "high", "open", "close", "volume"]])
+    ]
+    return rows[::-1]
+
+
+TEXT_WORDS = ("bitcoin btc eth crypto the a is to and of it this that not never no very really extremely so "
+              "good great bad terrible amazing awful happy sad bullish bearish moon dump pump hodl buy sell price "
+              "market coins coming going went running wallets exchanges fees best worst love hate nice poor "
+              "lol wow sure maybe think know feel rich broke long short gains losses").split()
+
+
+def texts(n, seed=0, duplicates=0.3):
+    """
+    n reddit / tweet like texts: words, urls, hashtags, mentions, numbers, punctuation & markup,
+    a `duplicates` share repeats earlier texts like bots & copy-pasta do
+    """
+    rng = np.random.default_rng(seed)
+    extras = ["https://example.com/x?a=1", "www.coin.io/p", "#BTC", "#ToTheMoon", "@elon", "@user_1", "100x",
+              "$ETH", "!!!", "...", ":)", "<3", "don't", "isn't", "&amp;", "<b>", "</b>", "\n", "2022"]
+    words = np.array(TEXT_WORDS + extras)
+    weights = np.r_[np.full(len(TEXT_WORDS), 4.0), np.ones(len(extras))]
+    weights /= weights.sum()
+
+    out = []
+    for _ in range(n):
+        if out and rng.random() < duplicates:
+            out.append(out[rng.integers(len(out))])
+            continue
+        tokens = rng.choice(words, size=rng.integers(3, 60), p=weights)
+        text = " ".join(tokens)
+        out.append(text[0].upper() + text[1:])
+    return out
+
+
+def tweets(n, seed=0, start="2022-01-01"):
+    """
+    n tweets in the layout tweetSentimentAnalysis reads (Bitcoin_tweets): date, user_followers, user_friends,
+    text, hashtags
+    """
+    rng = np.random.default_rng(seed)
+    text = texts(n, seed)
+    return pd.DataFrame({
+        "date": pd.to_datetime(start) + pd.to_timedelta(np.sort(rng.integers(0, 86400 * 30, n)), unit='s'),
+        "user_followers": rng.zipf(1.5, n).clip(max=10 ** 7),
+        "user_friends": rng.integers(0, 5000, n),
+        "text": text,
+        "hashtags": [str([word[1:] for word in t.split() if word.startswith("#")]) for t in text],
+    })
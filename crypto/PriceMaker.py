@@ -2,90 +2,238 @@ import os
 import time
 import warnings
 import json
-from operator import itemgetter
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-import cbpro
 import numpy as np
 import pandas as pd
+from pandas.tseries.frequencies import to_offset
 from tables import NaturalNameWarning
 from tqdm import tqdm
 import requests
-import talib
-from talib import abstract
 
+from crypto.cache import FactorCache
+from crypto.kline import parse_klines, to_frame
+from crypto.metrics import METRICS
+from crypto.pyramid import pyramid_current, pyramid_level, read_pyramid, resample_bars
+from crypto.ratelimit import retry_after
+from crypto.store import get_store
+from crypto.tech import TECH_CUMULATIVE, TECH_WARMUP, TECH_RTOL, tech_plan, tech_factor, tech_owner, group_factor, \
+    submit_factor, collect_factor
 from crypto.utils import price_path, price_config
 
-TECH_GROUPS = ['Cycle Indicators', 'Momentum Indicators', 'Overlap Studies', 'Pattern Recognition', 'Price Transform',
-               'Statistic Functions', 'Volatility Indicators', 'Volume Indicators']
-
 warnings.filterwarnings('ignore', category=NaturalNameWarning)
 
-public_client = cbpro.PublicClient()
-
 rate_ctrl_t = []
 
 
-def get_tech_factor(price):
-    tech_factors = itemgetter(*TECH_GROUPS)(talib.get_function_groups())
-    tech_factors = [factor for group in tech_factors for factor in group]
-    tech_factors.remove('MAVP')
-
-    factor_results = []
-    for func in tech_factors:
-        factor = eval('abstract.' + func)(price)
-        if isinstance(factor, pd.Series):
-            factor.name = func
-        elif isinstance(factor, pd.DataFrame):
-            factor.columns = ['_'.join([func, col]) for col in factor.columns]
-        factor_results.append(factor)
-
-    return pd.concat(factor_results, axis=1)
+def get_tech_factor(price, groups=None, workers=None):
+    """
+    groups: subset of TECH_GROUPS, default all. workers > 1: indicator groups in a process pool
+    """
+    return tech_factor(price, groups, workers)
 
 
-def make_price_tech(ticker, source, freq=None, save=False):
+def make_price_tech(ticker, source, freq=None, save=False, store=None, groups=None, workers=None, cache=True):
     """
-    return clean price & tech indicators
+    return clean price & tech indicators.
+    cache: look the frame up in / add it to the tech factor cache (crypto/cache.py) first, by price_stamp
     """
+    factor_cache = FactorCache() if cache else None
+    df = key = None
     try:
-        price = get_clean_price(ticker, source, freq)
+        if factor_cache is not None:  # stamped before the prices are read, a write in between only misses
+            key = factor_cache.key(price_stamp(ticker, source, freq, store),
+                                   tech_plan(None if groups is None else tuple(groups)))
+            df = factor_cache.get(key)
+        if df is None:
+            price = get_clean_price(ticker, source, freq, store)
     except Exception as e:
         return f"{ticker} failed", e
-    factor = get_tech_factor(price[['open', 'high', 'low', 'close', 'volume']])
 
-    df = pd.concat([price, factor], axis=1).dropna()
+    if df is None:
+        factor = get_tech_factor(price[['open', 'high', 'low', 'close', 'volume']], groups, workers)
+        df = pd.concat([price, factor], axis=1).dropna()
+        if factor_cache is not None:
+            factor_cache.put(key, df)
 
     if save:
-        if freq is None:
-            freq = '1min'
-        df.to_hdf(os.path.join(price_path, f"price_clean/{ticker}-{freq}.h5"),
-                  key=ticker + '-' + freq,
-                  mode='w',
-                  format='table',
-                  complevel=5)
+        _save_price_tech(df, ticker, freq)
     else:
         return df
 
 
-def get_clean_price(ticker, source, freq=None):
+def make_price_tech_universe(tickers, source, freq=None, store=None, groups=None, workers=None, depth=2):
+    """
+    make_price_tech(..., save=True) for many tickers on one process pool: every (ticker, indicator group)
+    is a task, prices of up to `depth` tickers ahead are loaded while the pool works
+    """
+    plan = tech_plan(None if groups is None else tuple(groups))
+    failed = []
+
+    def finish(ticker, price, futures):
+        df = pd.concat([price, collect_factor(futures)], axis=1).dropna()
+        _save_price_tech(df, ticker, freq)
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for ticker in tqdm(tickers):
+            try:
+                price = get_clean_price(ticker, source, freq, store)
+            except Exception as e:
+                failed.append((f"{ticker} failed", e))
+                continue
+            futures = submit_factor(pool, price[['open', 'high', 'low', 'close', 'volume']], plan)
+            pending.append((ticker, price, futures))
+            if len(pending) > depth:
+                finish(*pending.popleft())
+        while pending:
+            finish(*pending.popleft())
+
+    return failed
+
+
+def update_price_tech(ticker, source, freq=None, store=None, groups=None, warmup=TECH_WARMUP, rtol=TECH_RTOL,
+                      bar=None):
+    """
+    append tech factors for bars newer than price_clean/{ticker}-{freq}.h5 instead of rewriting it.
+
+    only the last `warmup` stored bars plus the new ones are recomputed. running totals (TECH_CUMULATIVE the installed
+    TA-Lib has) continue from their stored value, and every indicator is checked against the stored bars it overlaps;
+    the ones that do not match within `rtol` (of the column scale) are recomputed over the full history
+    (reported through bar.write). return the number of bars written
+    """
+    path, key = _price_tech_path(ticker, freq)
+    nrows = 0
+    if os.path.exists(path):
+        with pd.HDFStore(path, mode='r') as hdf:
+            nrows = hdf.get_storer(key).nrows
+            stored = hdf.select(key, start=max(nrows - warmup, 0))
+    if nrows < warmup:  # missing or short history: a full recompute is as cheap
+        df = make_price_tech(ticker, source, freq, False, store, groups)
+        if isinstance(df, tuple):
+            raise df[1]
+        _save_price_tech(df, ticker, freq)
+        return len(df)
+
+    last = stored.index[-1]  # may have been a partial bar: recomputed & replaced
+    anchor = stored.index[-2]
+    # from the first minute of the first stored bar, so that bar is whole again
+    first = stored.index[0] - to_offset(freq or '1min') + pd.to_timedelta('1min')
+    price = get_clean_price(ticker, source, freq, store, start=first)
+    factor = get_tech_factor(price[['open', 'high', 'low', 'close', 'volume']], groups)
+    df = pd.concat([price, factor], axis=1).dropna()
+
+    for col, kind in TECH_CUMULATIVE.items():
+        if col in df.columns:
+            if kind == 'add':
+                df[col] += stored.at[anchor, col] - df.at[anchor, col]
+            else:
+                df[col] *= stored.at[anchor, col] / df.at[anchor, col]
+
+    overlap = df.index[(df.index <= anchor) & df.index.isin(stored.index)][-(warmup // 4):]
+    mismatch = [col for col in factor.columns
+                if not _matches(df.loc[overlap, col].values, stored.loc[overlap, col].values, rtol)]
+    if mismatch:
+        funcs = tech_owner(mismatch, groups)
+        (bar or tqdm).write(f"{ticker}: {', '.join(funcs)} recomputed over full history")
+        full = get_clean_price(ticker, source, freq, store)
+        full = group_factor(full[['open', 'high', 'low', 'close', 'volume']], funcs)
+        df[full.columns] = full.loc[df.index]
+
+    df = df.loc[df.index >= last]
+    with pd.HDFStore(path, mode='a') as hdf:
+        hdf.remove(key, where=f"index>='{last}'")
+    df.to_hdf(path, key=key, mode='a', format='table', append=True, complevel=5)
+    return len(df)
+
+
+def verify_price_tech(ticker, source, freq=None, store=None, groups=None):
+    """
+    max difference per column between price_clean/{ticker}-{freq}.h5 and a full recompute,
+    relative to the column scale
+    """
+    path, key = _price_tech_path(ticker, freq)
+    stored = pd.read_hdf(path, key=key)
+    full = make_price_tech(ticker, source, freq, False, store, groups, cache=False)
+    if len(full) != len(stored) or not full.index.equals(stored.index):
+        raise Exception(f"{ticker}: stored bars differ from a full recompute")
+
+    scale = full.abs().max().replace(0, 1)
+    return ((stored[full.columns] - full).abs().max() / scale).sort_values(ascending=False)
+
+
+def _matches(a, b, rtol):
+    scale = max(np.abs(b).max(initial=0), 1e-12)
+    return np.allclose(a, b, rtol=0, atol=rtol * scale, equal_nan=True)
+
+
+def _price_tech_path(ticker, freq=None):
+    if freq is None:
+        freq = '1min'
+    return os.path.join(price_path, f"price_clean/{ticker}-{freq}.h5"), ticker + '-' + freq
+
+
+def _save_price_tech(df, ticker, freq=None):
+    path, key = _price_tech_path(ticker, freq)
+    df.to_hdf(path,
+              key=key,
+              mode='w',
+              format='table',
+              complevel=5)
+
+
+def price_stamp(ticker, source, freq=None, store=None):
+    """
+    what get_clean_price(ticker, source, freq, store) reads, without reading it: the store's row count &
+    modification time and the listing start (resample origin)
+    """
+    with open(os.path.join(price_path, f"{source}/meta.json"), 'r') as f:
+        meta = json.load(f)
+    store = get_store(store)
+    if not store.exists(ticker, source):
+        raise Exception(f"{ticker} does not exist on disk")
+    return ticker, source, freq or '1min', store.name, store.stamp(ticker, source), meta.get(ticker).get('start')
+
+
+def get_clean_price(ticker, source, freq=None, store=None, start=None):
+    """
+    start: only minutes from here on. bars keep the resample origin of a full read, so the bar holding `start`
+    is whole when `start` is the first minute of a bar and partial otherwise
+    """
     with open(os.path.join(price_path, f"{source}/meta.json"), 'r') as f:
         meta = json.load(f)
     meta = meta.get(ticker)
-    start_dt = pd.to_datetime(meta.get('start')).timestamp()
+    start_dt = int(pd.to_datetime(meta.get('start')).timestamp())
+    origin = pd.to_datetime(meta.get('start')).floor('D')
+    if start is not None:
+        start_dt = max(start_dt, int(pd.to_datetime(start).timestamp()))
 
-    if not os.path.exists(os.path.join(price_path, f"{source}/{ticker}.h5")):
+    store = get_store(store)
+    if not store.exists(ticker, source):
         raise Exception(f"{ticker} does not exist on disk")
-    price_df = pd.read_hdf(os.path.join(price_path, f"{source}/{ticker}.h5"), where=f"epoch>={start_dt}")
-    price_df['datetime'] = pd.to_datetime(price_df.epoch, unit='s')
-    price_df.set_index('datetime', inplace=True)
-    price_df.drop('epoch', axis=1, inplace=True)
 
-    if freq is not None:
-        price_df_freq = price_df.resample(freq, label='right', closed='right', origin='start_day').agg(
-            {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum', 'amount': 'sum',
-             'count': 'sum'}
-        )
-    else:
+    level = None if freq is None else pyramid_level(freq)
+    if level is not None and pyramid_current(ticker, source, store.name):
+        # whole bars of the pyramid level add up to `freq` bars, raw minutes are not read. a pyramid behind the
+        # store (or built from another one) is skipped. when `start` falls inside a level bar, that bar is made
+        # from the minutes from `start` on, like the raw path does
+        step = int(pd.to_timedelta(level).total_seconds())
+        first = -(-start_dt // step) * step  # label of the level bar holding `start`
+        price_df = read_pyramid(ticker, source, level, start=pd.to_datetime(start_dt, unit='s'))
+        if start_dt != first - step + 60:
+            head = resample_bars(_read_minutes(store, ticker, source, start_dt, first), level, origin)
+            price_df = pd.concat([head, price_df[price_df.index > pd.to_datetime(first, unit='s')]])
+        if pd.to_timedelta(freq) != pd.to_timedelta(level):
+            price_df = resample_bars(price_df, freq, origin)
         price_df_freq = price_df
+    else:
+        price_df = _read_minutes(store, ticker, source, start_dt)
+
+        if freq is not None:
+            price_df_freq = resample_bars(price_df, freq, origin)
+        else:
+            price_df_freq = price_df
 
     price_df_freq.close.fillna(method='ffill', inplace=True)
     price_df_freq.fillna(
@@ -95,20 +243,34 @@ def get_clean_price(ticker, source, freq=None):
     )
     price_df_freq.dropna(inplace=True)
 
+    return price_df_freq
+
+
+def _read_minutes(store, ticker, source, start=None, end=None):
+    price_df = store.read(ticker, source, start=start, end=end)
+    price_df['datetime'] = price_df.epoch.values.astype("datetime64[s]")  # works on read-only (zero-copy) columns
+    price_df.set_index('datetime', inplace=True)
+    price_df.drop('epoch', axis=1, inplace=True)
     return price_df
 
 
-def make_price(ticker, start, end, source):
+def make_price(ticker, start, end, source, incremental=False, store=None):
+    """
+    incremental: only fetch minutes that are not on disk yet, skip windows recorded in the checkpoint
+    store: "h5" / "parquet", default utils.price_store
+    """
     global rate_ctrl_t
     rate_ctrl_t = price_config[source]["rate_limit"] * [time.time()]
 
     chunk = price_config[source]["chunk_size"]
 
-    prices = pd.DataFrame(columns=price_config[source]["columns"])
+    prices = PriceBuffer(source, chunk_rows(source))
 
     start = pd.to_datetime(start)
     start_ = None
     end = pd.to_datetime(end) + pd.to_timedelta('23H59min')
+    if incremental:
+        end = min(end, last_closed_minute())
     bar = tqdm(pd.date_range(start, end, freq=price_config[source]["interval"]))  # x-Hour interval one iteration
 
     if source == "CB":
@@ -123,64 +285,238 @@ def make_price(ticker, start, end, source):
     chunk_count = 0
     row_count = 0
     na_count = 0
+    fetched = 0
+    t0 = time.perf_counter()
+
+    if incremental:
+        epochs, na_count = read_stored(ticker, source, store)
+        row_count = len(epochs)
+        if row_count > 0:
+            start_ = pd.to_datetime(epochs[0], unit='s')
+        done = load_checkpoint(ticker, source)
+        done_chunk = []
 
     for s in bar:
         bar.set_description(str(s))
         e = s + pd.to_timedelta(price_config[source]["interval_1"])  # 0H00m -- x-Hour-1min
+        whole = e <= end  # a window cut short by `end` is never checkpointed
+        e = min(e, end)
         if first_dt is not None:
             if e < first_dt:
                 continue
 
-        price = price_func(ticker, s, e, bar)
+        s_, e_ = s, e
+        if incremental:
+            if int(s.timestamp()) in done:
+                continue
+            missing = missing_range(epochs, s, e)
+            if missing is None:
+                continue
+            s_, e_ = missing
+
+        price = price_func(ticker, s_, e_, bar)
         if type(price) == int:
             if price == -2 and start_ is not None:
                 bar.write(f"{ticker} + {s}: no data")
+            if price == -2 and incremental and whole:
+                done_chunk.append(int(s.timestamp()))
             continue
+        if incremental:
+            price = price[~np.isin(price.epoch.values, epochs)]
+            if whole:
+                done_chunk.append(int(s.timestamp()))
         row_count += len(price)
+        fetched += len(price)
+        METRICS.inc("price_rows_total", len(price), source=source)
         na_count += price.isna().any(axis=1).sum()
         if start_ is None and row_count > 0:
             start_ = pd.to_datetime(price.epoch.min(), unit='s')
-        prices = pd.concat([prices, price], axis=0, ignore_index=True)
-        # prices = prices.append(price)
+        prices.append(price)
 
         chunk_count += 1
         if chunk_count % chunk == 0:
-            save_price(prices, ticker, source)
-            del prices
-            prices = pd.DataFrame(columns=price_config[source]["columns"])
+            prices.flush(ticker, source, store)
+            METRICS.set("price_rows_per_second", fetched / (time.perf_counter() - t0), source=source, ticker=ticker)
+            if incremental:
+                done.update(done_chunk)
+                save_checkpoint(ticker, source, done)
+                done_chunk = []
 
     if len(prices) > 0:
-        save_price(prices, ticker, source)
+        prices.flush(ticker, source, store)
+    METRICS.set("price_rows_per_second", fetched / (time.perf_counter() - t0), source=source, ticker=ticker)
+    if incremental:
+        done.update(done_chunk)
+        save_checkpoint(ticker, source, done)
 
     return start_, end, row_count, na_count
 
 
-def __rate_limit():
+def chunk_rows(source):
+    """
+    rows in one full chunk of windows
+    """
+    interval = pd.to_timedelta(price_config[source]["interval"])
+    return price_config[source]["chunk_size"] * (interval // pd.to_timedelta('1min'))
+
+
+class PriceBuffer:
+    """
+    preallocated columnar chunk of price rows, columns as price_config[source]["columns"]:
+    epoch int64, everything else float64. windows are copied in place and the frame handed to
+    save_price is a view on the buffer, so nothing is re-copied while a chunk fills up
+    """
+
+    def __init__(self, source, capacity):
+        self.source = source
+        self.columns = price_config[source]["columns"]
+        self.epoch = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty((len(self.columns) - 1, capacity), dtype=np.float64)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def reserve(self, n):
+        """
+        (epoch, values) views of the next n rows, to be filled in place
+        """
+        if self.size + n > len(self.epoch):
+            self._grow(max(2 * len(self.epoch), self.size + n))
+        rows = slice(self.size, self.size + n)
+        self.size += n
+        return self.epoch[rows], self.values[:, rows]
+
+    def append(self, price):
+        epoch, values = self.reserve(len(price))
+        epoch[:] = price["epoch"].values
+        for i, col in enumerate(self.columns[1:]):
+            values[i] = price[col].values
+
+    def frame(self):
+        return to_frame(self.epoch[:self.size], self.values[:, :self.size], self.source)
+
+    def flush(self, ticker, source, store=None):
+        save_price(self.frame(), ticker, source, store)
+        self.size = 0
+
+    def _grow(self, capacity):
+        epoch = np.empty(capacity, dtype=np.int64)
+        values = np.empty((len(self.values), capacity), dtype=np.float64)
+        epoch[:self.size] = self.epoch[:self.size]
+        values[:, :self.size] = self.values[:, :self.size]
+        self.epoch, self.values = epoch, values
+
+
+def last_closed_minute():
+    return pd.to_datetime(time.time(), unit='s').floor('min') - pd.to_timedelta('1min')
+
+
+def read_stored(ticker, source, store=None):
+    """
+    sorted epochs already on disk & how many of them have no price.
+    trailing rows without a close (minutes still in the future when they were fetched) are removed from
+    disk first, so they count as missing
+    """
+    store = get_store(store)
+    if not store.exists(ticker, source):
+        return np.empty(0, dtype=np.int64), 0
+
+    stored = store.read(ticker, source, columns=["epoch", "close"])
+    epochs = stored.epoch.values.astype(np.int64)
+    valid = stored.close.notna().values
+    if valid.any():
+        last = epochs[valid].max()
+        if (epochs > last).any():
+            store.truncate(ticker, source, last)
+            keep = epochs <= last
+            epochs, valid = epochs[keep], valid[keep]
+
+    epochs, first = np.unique(epochs, return_index=True)
+    return epochs, int((~valid[first]).sum())
+
+
+def missing_range(epochs, start, end):
+    """
+    (first, last) minute of [start, end] that is not in the sorted epochs, None if the window is complete
+    """
+    grid = np.arange(int(start.timestamp()), int(end.timestamp()) + 60, 60)
+    lo = np.searchsorted(epochs, grid[0], side='left')
+    hi = np.searchsorted(epochs, grid[-1], side='right')
+    if hi - lo == len(grid):
+        return None
+    missing = grid[~np.isin(grid, epochs[lo:hi])]
+    return pd.to_datetime(missing[0], unit='s'), pd.to_datetime(missing[-1], unit='s')
+
+
+def load_checkpoint(ticker, source):
+    """
+    window starts (epoch) already written to disk, or known to have no data
+    """
+    path = os.path.join(price_path, f"{source}/{ticker}.ckpt.json")
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r') as f:
+        return set(json.load(f))
+
+
+def save_checkpoint(ticker, source, done):
+    path = os.path.join(price_path, f"{source}/{ticker}.ckpt.json")
+    with open(path + ".tmp", 'w') as f:
+        json.dump(sorted(done), f)
+    os.replace(path + ".tmp", path)
+
+
+def __rate_limit(source):
     global rate_ctrl_t
     t0 = rate_ctrl_t.pop(0)
     t1 = time.time()
     if t1 - t0 < 1:
         time.sleep(1 - (t1 - t0))
+        METRICS.inc("price_rate_limit_sleep_seconds_total", 1 - (t1 - t0), source=source)
     rate_ctrl_t.append(time.time())
 
 
-def save_price(prices, ticker, source):
-    prices = prices.astype({"epoch": int})
-    if os.path.exists(os.path.join(price_path, f"{source}/{ticker}.h5")):
-        prices.to_hdf(os.path.join(price_path, f"{source}/{ticker}.h5"),
-                      key=ticker,
-                      mode='a',
-                      format='table',
-                      index=False,
-                      data_columns=["epoch"],
-                      append=True)
-    else:
-        prices.to_hdf(os.path.join(price_path, f"{source}/{ticker}.h5"),
-                      key=ticker,
-                      mode='w',
-                      format='table',
-                      index=False,
-                      data_columns=["epoch"])
+def _request(source, url, params=None):
+    """
+    requests.get, latency & status recorded
+    """
+    t = time.perf_counter()
+    try:
+        res = requests.get(url=url, params=params)
+    except Exception:
+        METRICS.inc("price_requests_total", source=source, status="error")
+        raise
+    finally:
+        METRICS.observe("price_request_seconds", time.perf_counter() - t, source=source)
+    METRICS.inc("price_requests_total", source=source, status=res.status_code)
+    return res
+
+
+def _backoff(res, source, bar):
+    """
+    a non-200 answer: wait as long as the exchange asks when over its budget (429 / 418, retry not counted),
+    return whether the request counts as a failed try
+    """
+    bar.write(f"{source} HTTP {res.status_code}: {res.text}")
+    if res.status_code in (418, 429):
+        METRICS.inc("price_retries_total", source=source, reason="rate_limited")
+        wait = retry_after(res.headers)
+        METRICS.inc("price_rate_limit_sleep_seconds_total", wait, source=source)
+        time.sleep(wait)
+        return False
+    METRICS.inc("price_retries_total", source=source, reason="http")
+    time.sleep(0.5)
+    return True
+
+
+def save_price(prices, ticker, source, store=None):
+    if prices.epoch.dtype != np.int64:
+        prices = prices.astype({"epoch": np.int64})
+    store = get_store(store)
+    with METRICS.timer("price_store_write_seconds", store=store.name):
+        store.append(prices, ticker, source)
+    METRICS.inc("price_store_rows_total", len(prices), store=store.name)
 
 
 def price_cb(ticker, start, end, bar=None):
@@ -190,15 +526,12 @@ def price_cb(ticker, start, end, bar=None):
     retry_times = 0
     while True:
         try:
-            __rate_limit()
-            price = public_client.get_product_historic_rates(
-                ticker,
-                start=str(start),
-                end=str(end),
-                granularity=60
-            )  # price from cbpro api
+            __rate_limit("CB")
+            res = _request("CB", f"{price_config['CB']['host']}/products/{ticker}/candles",
+                           {"start": str(start), "end": str(end), "granularity": 60})  # price from coinbase api
         except Exception as ex:  # failed
             # failed -- retry
+            METRICS.inc("price_retries_total", source="CB", reason="error")
             retry_times += 1
             if retry_times > 5:  # timeout
                 # return f"{ticker} + {start}: failed\n" + str(ex)
@@ -209,23 +542,19 @@ def price_cb(ticker, start, end, bar=None):
             time.sleep(0.5)
             continue  # --> retry
 
-        price = np.array(price)
-        if price.ndim == 0:  # price matrix not ok: usually hitted the api rate limit
+        with METRICS.timer("price_parse_seconds", source="CB"):
+            price = parse_klines(res.content, "CB", start, end)
+        if price is None:  # price matrix not ok: usually hitted the api rate limit
+            METRICS.inc("price_retries_total", source="CB", reason="payload")
             bar.write(f"{ticker} + {start}")
-            bar.write(str(price))
+            bar.write(res.text)
             time.sleep(1)
             continue
-        elif price.ndim != 2:
+        elif type(price) == int:
             # bar.write(f"{ticker} + {start}: no data")
-            # bar.write(str(price))
-            return -2
+            return price
 
-        price = pd.DataFrame(price[:, 1:].astype(float), index=price[:, 0].astype(int),
-                             columns=["high", "low", "open", "close", "volume"])
-        price = price.reindex(range(int(start.timestamp()), int(end.timestamp()) + 60, 60))
-        price.index.name = "epoch"
-        price.reset_index(inplace=True)
-        return price
+        return to_frame(*price, "CB")
 
 
 def price_bn(ticker, start, end, bar=None):
@@ -235,19 +564,12 @@ def price_bn(ticker, start, end, bar=None):
     retry_times = 0
     while True:
         try:
-            __rate_limit()
-            price = requests.get(
-                url=f"https://api.binance.com/api/v3/klines?symbol={ticker}&interval=1m"
-                    f"&startTime={1000 * int(start.timestamp())}"
-                    f"&endTime={1000 * int(end.timestamp())}&limit=1000"
-            )
-            if price.status_code != 200:
-                bar.write(price.status_code)
-                bar.write(price.json())
-                os.system("pause")
-                continue
-            price = price.json()
+            __rate_limit("BN")
+            res = _request("BN", f"{price_config['BN']['host']}/api/v3/klines?symbol={ticker}&interval=1m"
+                                 f"&startTime={1000 * int(start.timestamp())}"
+                                 f"&endTime={1000 * int(end.timestamp())}&limit=1000")
         except Exception as ex:
+            METRICS.inc("price_retries_total", source="BN", reason="error")
             retry_times += 1
             if retry_times > 5:
                 bar.write(f"{ticker} + {start}: failed")
@@ -255,44 +577,44 @@ def price_bn(ticker, start, end, bar=None):
                 return -1
             time.sleep(0.5)
             continue
+        if res.status_code != 200:
+            if _backoff(res, "BN", bar):
+                retry_times += 1
+                if retry_times > 5:
+                    bar.write(f"{ticker} + {start}: failed")
+                    return -1
+            continue
 
-        price = np.array(price)
-        if price.ndim == 0:  # price matrix not ok: usually hitted the api rate limit
+        with METRICS.timer("price_parse_seconds", source="BN"):
+            price = parse_klines(res.content, "BN", start, end)
+        if price is None:  # price matrix not ok: usually hitted the api rate limit
+            METRICS.inc("price_retries_total", source="BN", reason="payload")
             bar.write(f"{ticker} + {start}")
-            bar.write(str(price))
+            bar.write(res.text)
             time.sleep(1)
             continue
-        elif price.ndim != 2:
-            return -2
-
-        # price[:, 0] = price[:, 0]/1000
-        price = np.delete(price, [6, 9, 10, 11], axis=1)
-
-        price = pd.DataFrame(price[:, 1:].astype(float), index=(price[:, 0].astype(np.int64) / 1000).astype(int),
-                             columns=["open", "high", "low", "close", "volume", "amount", "count"])
-        price = price.reindex(range(int(start.timestamp()), int(end.timestamp()) + 60, 60))
-        price.index.name = "epoch"
-        price.reset_index(inplace=True)
+        elif type(price) == int:
+            return price
 
-        return price
+        return to_frame(*price, "BN")
 
 
 def _price_bn_earliest(ticker, start):
     retry_times = 0
     while True:
         try:
-            price = requests.get(
-                url=f"https://api.binance.com/api/v3/klines?symbol={ticker}&interval=1m"
-                    f"&startTime={1000 * int(start.timestamp())}&limit=2"
-            )
+            price = _request("BN", f"{price_config['BN']['host']}/api/v3/klines?symbol={ticker}&interval=1m"
+                                   f"&startTime={1000 * int(start.timestamp())}&limit=2")
             if price.status_code != 200:
-                print(price.status_code)
-                print(price.json())
-                os.system("pause")
+                if _backoff(price, "BN", tqdm):
+                    retry_times += 1
+                    if retry_times > 5:
+                        return start
                 continue
             price = price.json()
             break
         except Exception as ex:
+            METRICS.inc("price_retries_total", source="BN", reason="error")
             retry_times += 1
             if retry_times > 5:
                 return start
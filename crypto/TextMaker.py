@@ -1,19 +1,55 @@
 import json
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from operator import itemgetter
 
 import pandas as pd
 import praw
 from praw.models import MoreComments
-from bs4 import BeautifulSoup
+from prawcore import Requestor
+from prawcore.exceptions import Forbidden, NotFound
 from pmaw import PushshiftAPI
 from tqdm import tqdm
 import fastparquet
 
+from crypto.htmltext import clean_href_batch, html_pool
+from crypto.metrics import METRICS, WINDOW_BUCKETS
+from crypto.ratelimit import RateLimiter
+from crypto.textstore import PostIndex, IdIndex, ExpandedIndex
 from crypto.utils import reddit_auth_path
 from crypto.utils import text_path
 
 
+class LimitedRequestor(Requestor):
+    """
+    prawcore requestor taking every request out of one RateLimiter, shared by the praw.Reddit of every thread
+    """
+
+    def __init__(self, *args, limiter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+
+    def request(self, *args, **kwargs):
+        if self.limiter is not None:
+            waited = self.limiter.acquire()
+            if waited > 0:
+                METRICS.inc("reddit_rate_limit_sleep_seconds_total", waited, api="reddit")
+        t = time.perf_counter()
+        try:
+            res = super().request(*args, **kwargs)
+        except Exception:
+            METRICS.inc("reddit_requests_total", api="reddit", status="error")
+            raise
+        finally:
+            METRICS.observe("reddit_request_seconds", time.perf_counter() - t, api="reddit")
+        METRICS.inc("reddit_requests_total", api="reddit", status=res.status_code)
+        return res
+
+
 class RedditMaker:
     NUM_WORKERS = 22
     RATE_LIMIT = 85
@@ -23,7 +59,14 @@ class RedditMaker:
     BASE_BACKOFF = 0.2
     LIMIT = 50000
     DOWN_BEHAVIOR = None  # 'warn', 'stop'
+    PRAW_RATE = 100  # reddit requests per PRAW_PERIOD seconds, across all threads
+    PRAW_PERIOD = 60
+    COMMENT_WORKERS = 8  # comment trees expanded at once, shared by the day workers
+    REPLACE_MORE = 48  # "load more comments" requests per post
+    HTML_WORKERS = 4  # processes for html cleaning of frames larger than HTML_CHUNK (one pool, see html_pool)
+    HTML_CHUNK = 5000
     DAY_S = 86400
+    MANIFEST = "reddit/manifest.json"  # finished (channel, window, text type) units, under text_path
     STEP = 86400 * 1
     POST_COLUMNS = [
         "subreddit", "subreddit_subscribers",
@@ -36,24 +79,64 @@ class RedditMaker:
         "score", "downs", "ups"
     ]
 
-    def __init__(self, channels, start, end):
-        with open(reddit_auth_path, "r") as file:
-            auth_config = json.load(file)
-
-        self.reddit = praw.Reddit(
-            client_id=auth_config.get("CLIENT_ID"),
-            client_secret=auth_config.get("SECRET_TOKEN"),
-            user_agent=f'python: PMAW request enrichment (by u/{auth_config.get("data").get("username")})',
-            # ratelimit_seconds=60
-        )
-        self.api = PushshiftAPI(num_workers=self.NUM_WORKERS, praw=self.reddit, shards_down_behavior=self.DOWN_BEHAVIOR,
-                                limit_type=self.LIMIT_TYPE, jitter=self.JITTER, base_backoff=self.BASE_BACKOFF,
-                                rate_limit=self.RATE_LIMIT, max_sleep=self.MAX_SLEEP)
+    def __init__(self, channels, start, end, workers=1, reddit=None, api=None):
+        """
+        workers: day windows fetched at once. pmaw keeps the state of a search on the client, so every day
+        worker gets its own PushshiftAPI and the pushshift budget (RATE_LIMIT, NUM_WORKERS) is split between them.
+        praw.Reddit is not thread safe: by default every thread gets its own, all of them taking their requests
+        out of one RateLimiter (PRAW_RATE per PRAW_PERIOD).
+        reddit: a client shared by all threads (e.g. the benchmarks.reddit stub) or a callable making one per thread.
+        api: callable returning a PushshiftAPI-like client
+        """
+        if reddit is None:
+            with open(reddit_auth_path, "r") as file:
+                auth_config = json.load(file)
+
+            reddit = partial(
+                praw.Reddit,
+                client_id=auth_config.get("CLIENT_ID"),
+                client_secret=auth_config.get("SECRET_TOKEN"),
+                user_agent=f'python: PMAW request enrichment (by u/{auth_config.get("data").get("username")})',
+                requestor_class=LimitedRequestor,
+                requestor_kwargs={"limiter": RateLimiter(self.PRAW_RATE, self.PRAW_PERIOD)},
+                # ratelimit_seconds=60
+            )
+        self._reddit_factory = reddit if callable(reddit) else lambda: reddit
+        self.workers = max(1, workers)
+        self._api_factory = api or self.__pushshift
+        self._local = threading.local()
+        self._comment_pool = None
+        self._comment_pool_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._manifest = None
+        self._ids = {}  # text type -> IdIndex of what is on disk, loaded per run
+        self._expanded = None  # ExpandedIndex, loaded per run
+        self._redo = False
 
         self.channels = channels
         self.start = pd.to_datetime(start).timestamp()
         self.end = pd.to_datetime(end).timestamp()
 
+    def __pushshift(self):
+        return PushshiftAPI(num_workers=max(1, self.NUM_WORKERS // self.workers), praw=self.reddit,
+                            shards_down_behavior=self.DOWN_BEHAVIOR, limit_type=self.LIMIT_TYPE, jitter=self.JITTER,
+                            base_backoff=self.BASE_BACKOFF, rate_limit=max(1, self.RATE_LIMIT // self.workers),
+                            max_sleep=self.MAX_SLEEP)
+
+    @property
+    def reddit(self):
+        # one praw.Reddit per thread
+        if getattr(self._local, "reddit", None) is None:
+            self._local.reddit = self._reddit_factory()
+        return self._local.reddit
+
+    @property
+    def api(self):
+        # one pushshift client per thread
+        if getattr(self._local, "api", None) is None:
+            self._local.api = self._api_factory()
+        return self._local.api
+
     @staticmethod
     def __post_filter(item):
         return item["selftext"] not in ["[deleted]", "[removed]", '']
@@ -66,19 +149,9 @@ class RedditMaker:
     def __comment_filter_praw(item):
         return item.body not in ["[deleted]", "[removed]", '']
 
-    @staticmethod
-    def __clean_href(text):
-        soup = BeautifulSoup(text, 'html.parser')
-        for a in soup.findAll('a', href=True):
-            a.extract()
-
-        try:
-            soup = soup.find('div')
-        except:
-            pass
-
-        ps = [p.get_text(strip=True, separator=' ') for p in soup.find_all()]
-        return ' '.join(ps)
+    def __clean_href_batch(self, texts):
+        with METRICS.timer("reddit_clean_seconds"):
+            return clean_href_batch(texts, self.HTML_WORKERS, self.HTML_CHUNK)
 
     @staticmethod
     def save_text(texts, text_type=None):
@@ -125,33 +198,134 @@ class RedditMaker:
                 partition_on=["date", "subreddit"]
             )
 
-    def fetch_text_union(self, channel):
+    def load_manifest(self):
+        """
+        {channel: {unit: [window starts (epoch)]}} of the windows saved before.
+        unit 'p' / 'c': posts / comments of the window, 'cp': comments of its top posts (fetch_comment_by_post)
+        """
+        path = os.path.join(text_path, self.MANIFEST)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def save_manifest(self, manifest):
+        path = os.path.join(text_path, self.MANIFEST)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", 'w') as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+
+    def windows(self):
+        """
+        (start, end) of every STEP window between self.start and the end of self.end
+        """
+        windows = []
         s = self.start
-        e = min(s + self.STEP - 1, self.end + self.DAY_S - 1)
-
-        bar = tqdm(total=int((self.end + self.DAY_S - self.start)/self.STEP))
         while s < self.end + self.DAY_S - 1:
-            bar.set_description(str(pd.to_datetime(s, unit='s')) + ": posts")
-            post = self.search_post(channel, s, e)
-            post = post.sort_values("created_utc")
-            if len(post) >= self.LIMIT:
-                bar.write(f"{str(pd.to_datetime(s, unit='s'))}: post count {len(post)} > {self.LIMIT}")
-            self.save_text(post, 'p')
-
-            bar.set_description(str(pd.to_datetime(s, unit='s')) + ": comments")
-            comment = self.search_comment_by_post(post.id.to_list())
-            comment = comment.sort_values("created_utc")
-            if len(comment) >= self.LIMIT:
-                bar.write(f"{str(pd.to_datetime(s, unit='s'))}: comment count {len(comment)} > {self.LIMIT}")
-            self.save_text(comment, 'c')
-
-            bar.update(1)
-            s = e + 1
             e = min(s + self.STEP - 1, self.end + self.DAY_S - 1)
+            windows.append((s, e))
+            s = e + 1
+        return windows
+
+    def __todo(self, channel, unit, s):
+        return self._redo or int(s) not in self._manifest.get(channel, {}).get(unit, [])
+
+    def __save_unit(self, texts, text_type, channel, unit, s, e, expanded=None):
+        """
+        expanded: posts whose comment trees `texts` holds in full (search_comment_by_post / _r)
+        """
+        # fastparquet appends & the manifest are not safe to run side by side
+        with self._save_lock:
+            texts = self.__unseen(texts, text_type)
+            if len(texts) > 0:
+                with METRICS.timer("reddit_store_write_seconds", type=text_type):
+                    self.save_text(texts, text_type)
+                METRICS.inc("reddit_saved_total", len(texts), type=text_type)
+                self._ids[text_type].update()
+            if e < time.time():  # a window still in progress is fetched again next time
+                if expanded is not None and len(expanded) > 0:
+                    self._expanded.add(expanded)
+                done = self._manifest.setdefault(channel, {}).setdefault(unit, [])
+                if int(s) not in done:
+                    done.append(int(s))
+                    done.sort()
+                self.save_manifest(self._manifest)
+
+    def __unseen(self, texts, text_type):
+        """
+        texts not on disk yet, each id once
+        """
+        texts = texts[~texts.id.duplicated()]
+        if len(texts) == 0:
+            return texts
+        return texts[~self._ids[text_type].contains(texts.id.values)]
+
+    def __uncommented(self, post_ids):
+        """
+        posts whose comment trees were not expanded & saved before (comments from subreddit windows do not count);
+        all of them with redo or outside a fetch_* run
+        """
+        if self._redo or self._expanded is None or len(post_ids) == 0:
+            return post_ids
+        return [i for i, done in zip(post_ids, self._expanded.contains(post_ids)) if not done]
+
+    def __run_windows(self, channel, units, window_func, redo):
+        """
+        window_func(channel, s, e, bar) over the windows with any of `units` unsaved, `workers` at a time
+        """
+        self._manifest = self.load_manifest()
+        self._redo = redo
+        self._ids = {text_type: IdIndex(text_type, text_path) for text_type in ['p', 'c']}
+        for index in self._ids.values():
+            index.update()
+        self._expanded = ExpandedIndex(text_path)
+        windows = self.windows()
+        todo = [(s, e) for s, e in windows if any(self.__todo(channel, unit, s) for unit in units)]
+
+        if self.HTML_WORKERS > 1:
+            html_pool(self.HTML_WORKERS)  # before the window threads
+        bar = tqdm(total=len(windows), initial=len(windows) - len(todo))
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = [pool.submit(self.__timed_window, window_func, channel, s, e, bar) for s, e in todo]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    bar.update(1)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+            finally:
+                bar.close()
 
-        bar.close()
-
-    def fetch_text(self, channel, text_type=None):
+    @staticmethod
+    def __timed_window(window_func, channel, s, e, bar):
+        with METRICS.timer("reddit_window_seconds", WINDOW_BUCKETS, channel=channel):
+            return window_func(channel, s, e, bar)
+
+    def fetch_text_union(self, channel, redo=False):
+        self.__run_windows(channel, ['p', 'c'], self.__window_union, redo)
+
+    def __window_union(self, channel, s, e, bar):
+        bar.set_description(str(pd.to_datetime(s, unit='s')) + ": posts")
+        post = self.search_post(channel, s, e)
+        post = post.sort_values("created_utc")
+        if len(post) >= self.LIMIT:
+            bar.write(f"{str(pd.to_datetime(s, unit='s'))}: post count {len(post)} > {self.LIMIT}")
+        if self.__todo(channel, 'p', s):
+            self.__save_unit(post, 'p', channel, 'p', s, e)
+
+        if not self.__todo(channel, 'c', s):
+            return
+        bar.set_description(str(pd.to_datetime(s, unit='s')) + ": comments")
+        comment = self.search_comment_by_post(post.id.to_list())
+        comment = comment.sort_values("created_utc")
+        if len(comment) >= self.LIMIT:
+            bar.write(f"{str(pd.to_datetime(s, unit='s'))}: comment count {len(comment)} > {self.LIMIT}")
+        self.__save_unit(comment, 'c', channel, 'c', s, e, expanded=post.id.to_list())
+
+    def fetch_text(self, channel, text_type=None, redo=False):
         if text_type == 'c':
             search_func = self.search_comment
         elif text_type == 'p':
@@ -159,135 +333,144 @@ class RedditMaker:
         else:
             raise Exception(f"text_type {text_type} not supported")
 
-        s = self.start
-        e = min(s + self.STEP - 1, self.end + self.DAY_S - 1)
-        bar = tqdm(total=int((self.end + self.DAY_S - self.start)/self.STEP))
-        while s < self.end + self.DAY_S - 1:
-            bar.set_description(str(pd.to_datetime(s, unit='s')))
-            df = search_func(channel, s, e)
-            df = df.sort_values("created_utc")
-            if len(df) >= self.LIMIT:
-                bar.write(f"{str(pd.to_datetime(s, unit='s'))}: {len(df)} > {self.LIMIT}")
-            self.save_text(df, text_type)
-            bar.update(1)
-
-            s = e + 1
-            e = min(s + self.STEP - 1, self.end + self.DAY_S - 1)
-
-        bar.close()
-
-    def fetch_comment_by_post(self, channel):
-        s = self.start
-        e = min(s + self.STEP - 1, self.end + self.DAY_S - 1)
-        bar = tqdm(total=int((self.end + self.DAY_S - self.start) / self.STEP))
-        posts = fastparquet.ParquetFile(os.path.join(text_path, "reddit/posts.parquet"))
-
-        while s < self.end + self.DAY_S - 1:
-            bar.set_description(str(pd.to_datetime(s, unit='s').date()))
-
-            post_df = posts.to_pandas(
-                columns=['id', 'num_comments', 'subreddit'],
-                filters=[('date', '==', str(pd.to_datetime(s, unit='s').date())),
-                         ('subreddit', 'in', channel.split(','))]
-            )
-            ids = []
-            for sub in channel.split(','):
-                sub_df = post_df[(post_df.subreddit == sub) & (post_df.num_comments != 0)]
-                cutoff = sub_df.num_comments.quantile(0.9)
-                ids.extend(sub_df[sub_df.num_comments > cutoff].id.to_list())
-
-            num_posts = len(ids)
-            num_comments = post_df[post_df.id.isin(ids)].num_comments.sum()
-            bar.set_description(f"{str(pd.to_datetime(s, unit='s').date())}: {num_posts}-{num_comments}")
-            comment = self.search_comment_by_post_r(post_ids=ids)
-            comment = comment.sort_values("created_utc")
-            bar.write(f"{str(pd.to_datetime(s, unit='s').date())}: {num_posts}-{num_comments}-{len(comment)}")
-            self.save_text(comment, 'c')
-            del post_df
-
-            bar.update(1)
-            s = e + 1
-            e = min(s + self.STEP - 1, self.end + self.DAY_S - 1)
-
-        bar.close()
+        self.__run_windows(channel, [text_type], partial(self.__window_text, search_func, text_type), redo)
+
+    def __window_text(self, search_func, text_type, channel, s, e, bar):
+        bar.set_description(str(pd.to_datetime(s, unit='s')))
+        df = search_func(channel, s, e)
+        df = df.sort_values("created_utc")
+        if len(df) >= self.LIMIT:
+            bar.write(f"{str(pd.to_datetime(s, unit='s'))}: {len(df)} > {self.LIMIT}")
+        self.__save_unit(df, text_type, channel, text_type, s, e)
+
+    def fetch_comment_by_post(self, channel, redo=False):
+        index = PostIndex(text_path)
+        index.update()
+        top = index.top(channel.split(','), int(self.start) // self.DAY_S, int(self.end) // self.DAY_S)
+        self.__run_windows(channel, ['cp'], partial(self.__window_comment_by_post, top), redo)
+
+    def __window_comment_by_post(self, top, channel, s, e, bar):
+        bar.set_description(str(pd.to_datetime(s, unit='s').date()))
+
+        ids, num_comments = top.get(int(s) // self.DAY_S, ([], 0))
+        num_posts = len(ids)
+        bar.set_description(f"{str(pd.to_datetime(s, unit='s').date())}: {num_posts}-{num_comments}")
+        comment = self.search_comment_by_post_r(post_ids=ids)
+        comment = comment.sort_values("created_utc")
+        bar.write(f"{str(pd.to_datetime(s, unit='s').date())}: {num_posts}-{num_comments}-{len(comment)}")
+        self.__save_unit(comment, 'c', channel, 'cp', s, e, expanded=ids)
 
     def search_post(self, channel, start, end):
-        posts = self.api.search_submissions(
-            subreddit=channel,
-            limit=self.LIMIT,
-            filter_fn=self.__post_filter,
-            after=int(start),
-            before=int(end)
-        )
+        with METRICS.timer("reddit_request_seconds", WINDOW_BUCKETS, api="pushshift", call="search_submissions"):
+            posts = self.api.search_submissions(
+                subreddit=channel,
+                limit=self.LIMIT,
+                filter_fn=self.__post_filter,
+                after=int(start),
+                before=int(end)
+            )
 
         f_items = itemgetter(*self.POST_COLUMNS)
         post_list = [f_items(post) for post in posts]
 
         post_df = pd.DataFrame(post_list, columns=self.POST_COLUMNS)
-        post_df["selftext_clean"] = post_df["selftext_html"].apply(self.__clean_href)
+        METRICS.inc("reddit_fetched_total", len(post_df), type='p')
+        post_df["selftext_clean"] = self.__clean_href_batch(post_df["selftext_html"])
         post_df["subreddit"] = post_df["subreddit"].apply(lambda x: x.display_name)
 
         return post_df
 
     def search_comment_by_post_r(self, post_ids: list):
-        post_ids = ["t3_"+i for i in post_ids]
+        """
+        comments of the posts through reddit, up to COMMENT_WORKERS comment trees expanded at once.
+        posts expanded before are skipped (see __uncommented)
+        """
+        post_ids = self.__uncommented(post_ids)
 
-        comments = []
-        post_iter = self.reddit.info(fullnames=post_ids)
-        for post in post_iter:
-            comment_obj = post.comments
-            comment_obj.replace_more(limit=48)
-            comments.extend(comment_obj.list())
+        columns = tuple([] for _ in self.COMMENT_COLUMNS)
+        for post_columns in self.__comments_pool().map(self.__expand_comments, post_ids):
+            for column, values in zip(columns, post_columns):
+                column.extend(values)
 
-        comment_list = []
-        for comment in comments:
+        comment_df = pd.DataFrame(dict(zip(self.COMMENT_COLUMNS, columns)), columns=self.COMMENT_COLUMNS)
+        METRICS.inc("reddit_fetched_total", len(comment_df), type='c')
+        comment_df["body_clean"] = self.__clean_href_batch(comment_df["body_html"])
+
+        return comment_df
+
+    def __comments_pool(self):
+        """
+        COMMENT_WORKERS threads kept for the maker's life, so each keeps its praw.Reddit across windows
+        """
+        with self._comment_pool_lock:
+            if self._comment_pool is None:
+                self._comment_pool = ThreadPoolExecutor(max(1, self.COMMENT_WORKERS))
+            return self._comment_pool
+
+    def __expand_comments(self, post_id):
+        """
+        COMMENT_COLUMNS lists of one post's comment tree, walked in the order of CommentForest.list().
+        the tree is fetched & expanded on this thread's own praw.Reddit; a post reddit no longer serves
+        (gone, private subreddit) has no comments
+        """
+        try:
+            comment_obj = self.reddit.submission(id=post_id).comments
+            comment_obj.replace_more(limit=self.REPLACE_MORE)
+        except (NotFound, Forbidden):
+            return tuple([] for _ in self.COMMENT_COLUMNS)
+
+        columns = tuple([] for _ in self.COMMENT_COLUMNS)
+        appends = [column.append for column in columns]
+        queue = deque(comment_obj)
+        while queue:
+            comment = queue.popleft()
             if isinstance(comment, MoreComments):
-                # print('more')
                 continue
+            queue.extend(comment.replies)
             if not self.__comment_filter_praw(comment):
-                # print('filtered')
                 continue
-            comment_list.append(
-                [comment.subreddit, comment.link_id, comment.parent_id,
-                 comment.id, comment.permalink, comment.created_utc, comment.body, comment.body_html,
-                 comment.score, comment.downs, comment.ups]
-            )
-
-        comment_df = pd.DataFrame(comment_list, columns=self.COMMENT_COLUMNS)
-        comment_df["body_clean"] = comment_df["body_html"].apply(self.__clean_href)
-        comment_df["subreddit"] = comment_df["subreddit"].apply(lambda x: x.display_name)
-
-        return comment_df
+            values = (comment.subreddit.display_name, comment.link_id, comment.parent_id,
+                      comment.id, comment.permalink, comment.created_utc, comment.body, comment.body_html,
+                      comment.score, comment.downs, comment.ups)
+            for append, value in zip(appends, values):
+                append(value)
+        return columns
 
     def search_comment_by_post(self, post_ids: list):
-        comments = self.api.search_submission_comment_ids(
-            ids=post_ids,
-            limit=self.LIMIT,
-        )
+        post_ids = self.__uncommented(post_ids)
+        with METRICS.timer("reddit_request_seconds", WINDOW_BUCKETS, api="pushshift",
+                           call="search_submission_comment_ids"):
+            comments = self.api.search_submission_comment_ids(
+                ids=post_ids,
+                limit=self.LIMIT,
+            ) if post_ids else []
 
         f_items = itemgetter(*self.COMMENT_COLUMNS)
         comment_list = [f_items(comment) for comment in comments if self.__comment_filter(comment)]
 
         comment_df = pd.DataFrame(comment_list, columns=self.COMMENT_COLUMNS)
-        comment_df["body_clean"] = comment_df["body_html"].apply(self.__clean_href)
+        METRICS.inc("reddit_fetched_total", len(comment_df), type='c')
+        comment_df["body_clean"] = self.__clean_href_batch(comment_df["body_html"])
         comment_df["subreddit"] = comment_df["subreddit"].apply(lambda x: x.display_name)
 
         return comment_df
 
     def search_comment(self, channel, start, end):
-        comments = self.api.search_comments(
-            subreddit=channel,
-            limit=self.LIMIT,
-            filter_fn=self.__comment_filter,
-            after=int(start),
-            before=int(end)
-        )
+        with METRICS.timer("reddit_request_seconds", WINDOW_BUCKETS, api="pushshift", call="search_comments"):
+            comments = self.api.search_comments(
+                subreddit=channel,
+                limit=self.LIMIT,
+                filter_fn=self.__comment_filter,
+                after=int(start),
+                before=int(end)
+            )
 
         f_items = itemgetter(*self.COMMENT_COLUMNS)
         comment_list = [f_items(comment) for comment in comments]
 
         comment_df = pd.DataFrame(comment_list, columns=self.COMMENT_COLUMNS)
-        comment_df["body_clean"] = comment_df["body_html"].apply(self.__clean_href)
+        METRICS.inc("reddit_fetched_total", len(comment_df), type='c')
+        comment_df["body_clean"] = self.__clean_href_batch(comment_df["body_html"])
         comment_df["subreddit"] = comment_df["subreddit"].apply(lambda x: x.display_name)
 
         return comment_df
@@ -7,8 +7,20 @@ from crypto import utils
 
 
 @click.group()
-def cli():
-    pass
+@click.option("--metrics", default=None, help="write fetch metrics to this file while running (.prom: prometheus "
+                                               "text, otherwise json)")
+@click.option("--metrics-interval", default=10.0, help="seconds between metrics writes")
+@click.option("--profile", default=None, help="cProfile the command into this pstats file")
+@click.pass_context
+def cli(ctx, metrics=None, metrics_interval=10.0, profile=None):
+    if metrics is not None:
+        from crypto.metrics import Exporter
+
+        ctx.call_on_close(Exporter(metrics, metrics_interval).start().stop)
+    if profile is not None:
+        from crypto.metrics import profiling
+
+        ctx.with_resource(profiling(profile))
 
 
 @cli.command()
@@ -22,32 +34,86 @@ def update_universe():
 @cli.command()
 @click.option("--all/", "-a/", is_flag=True, default=False, help="fetch posts & comments")
 @click.option("--comm/", "-c/", is_flag=True, default=False, help="fetch comments by post ids")
+@click.option("--workers", "-w", default=1, help="day windows fetched at once, sharing the request budget")
+@click.option("--redo/", is_flag=True, default=False, help="fetch windows recorded in the manifest again")
 @click.argument("start", nargs=1)
 @click.argument("end", nargs=1)
 @click.argument("channel", nargs=1)
-def make_reddit(all, comm, start, end, channel):
+def make_reddit(all, comm, workers, redo, start, end, channel):
     """build text file from reddit"""
     from crypto.TextMaker import RedditMaker
 
-    r = RedditMaker(channel, start, end)
+    r = RedditMaker(channel, start, end, workers=workers)
 
     if all:
-        r.fetch_text_union(channel)
+        r.fetch_text_union(channel, redo=redo)
     elif comm:
-        r.fetch_comment_by_post(channel)
+        r.fetch_comment_by_post(channel, redo=redo)
     else:
-        r.fetch_text(channel, 'p')
+        r.fetch_text(channel, 'p', redo=redo)
+
+
+@cli.command()
+@click.option("--type", "-t", "text_type", default='p', help="p: posts / c: comments")
+@click.option("--resolution", "-r", default="5min", help="text bucket width")
+def make_sentiment_bars(text_type='p', resolution="5min"):
+    """sum scored reddit texts per time bucket for joining onto price bars"""
+    from model.align import SentimentBars
+
+    bars = SentimentBars(text_type, os.path.join(utils.text_path, "reddit"), resolution)
+    print(f"{bars.update()} texts added")
+
+
+@cli.command()
+@click.option("--type", "-t", "text_type", default='p', help="p: posts / c: comments")
+@click.option("--row-group", "-r", default=100000, help="rows per row group")
+@click.option("--force/", is_flag=True, default=False, help="also rewrite partitions made of one file")
+def compact_reddit(text_type='p', row_group=100000, force=False):
+    """merge the small files of every reddit partition, sorted by epoch"""
+    from crypto.textstore import compact_reddit, read_latency
+
+    before = read_latency(text_type, utils.text_path)
+    partitions, files_before, files_after = compact_reddit(text_type, utils.text_path, row_group, force)
+    after = read_latency(text_type, utils.text_path)
+
+    print(f"{partitions} partitions compacted, {files_before} -> {files_after} files")
+    for name in before:
+        print(f"{name}: {before[name]:.4f}s -> {after[name]:.4f}s ({before[name] / after[name]:.1f}x)")
 
 
 @cli.command()
+@click.option("--type", "-t", "text_type", default='p', help="p: posts / c: comments")
+@click.option("--engine", "-e", default="textblob", help="textblob / lexicon")
+@click.option("--workers", "-w", default=None, type=int, help="processes for text cleaning")
+@click.option("--rescore/", is_flag=True, default=False, help="score partitions scored before again")
+def score_reddit(text_type='p', engine="textblob", workers=None, rescore=False):
+    """score reddit texts partition by partition into reddit/sentiment/"""
+    from nltk.corpus import stopwords
+    from model.sentiment import stream_reddit_sentiment
+
+    crypto_words = ['btc', 'bitcoin', 'eth', 'etherum', 'crypto']
+    scored = stream_reddit_sentiment(text_type, stopwords.words('english'), crypto_words,
+                                     os.path.join(utils.text_path, "reddit"), engine, workers=workers, rescore=rescore)
+    print(f"{scored} partitions scored")
+
+
+@cli.command()
+@click.option("--concurrency", "-n", default=1, help="window requests in flight across all tickers")
+@click.option("--host", default=None, help="exchange api host for concurrent fetch, e.g. a local stand-in")
+@click.option("--incremental/", "-i/", is_flag=True, default=False, help="only fetch minutes missing on disk")
+@click.option("--store", default=None, help="price store: h5 / parquet")
+@click.option("--pyramid/", "-p/", is_flag=True, default=False, help="bring the bar pyramid up to date afterwards")
+@click.option("--panel/", is_flag=True, default=False, help="bring the universe panel up to date afterwards")
 @click.argument("start", nargs=1)
 @click.argument("end", nargs=1)
 @click.argument("base", nargs=1)
 @click.argument("source", nargs=1)
-def make_price(start, end, base="USD", source="CB"):
+def make_price(start, end, base="USD", source="CB", concurrency=1, host=None, incremental=False, store=None,
+               pyramid=False, panel=False):
     """build price file"""
 
     from crypto.PriceMaker import make_price
+    from crypto.pyramid import build_pyramid
     import json
     if source == "CB":
         from crypto.universe import coinbase_universe
@@ -63,16 +129,17 @@ def make_price(start, end, base="USD", source="CB"):
     with open(utils.universe_path, 'r') as universe_file:
         universe = json.load(universe_file)[0]
 
-    meta = {}
-
+    tickers = []
     for name in universe:
         ticker = ticker_join.join([name, base])
         if ticker not in source_universe:
             print(f"\n{ticker} is not supported in {source}")
             continue
-        print(f"\nmaking {ticker}")
-        start_, end_, row_count, na_count = make_price(ticker, start, end, source)
+        tickers.append(ticker)
 
+    meta = {}
+
+    def update_meta(ticker, start_, end_, row_count, na_count):
         # df = pd.read_hdf(os.path.join(utils.price_path, f"{ticker}.h5"))
         meta[ticker] = {"start": str(start_),
                         "end": str(end_),
@@ -83,13 +150,94 @@ def make_price(start, end, base="USD", source="CB"):
         with open(os.path.join(utils.price_path, f"{source}/meta.json"), 'r+') as meta_file:
             json.dump(meta, meta_file)
 
+        if pyramid and row_count > 0:
+            build_pyramid(ticker, source, store)
+
+    if concurrency > 1:
+        from crypto.fetcher import make_price_async
+        print(f"\nmaking {len(tickers)} tickers, {concurrency} requests in flight")
+        for ticker, made in make_price_async(tickers, start, end, source, concurrency, host, incremental,
+                                              store).items():
+            update_meta(ticker, *made)
+    else:
+        for ticker in tickers:
+            print(f"\nmaking {ticker}")
+            update_meta(ticker, *make_price(ticker, start, end, source, incremental, store))
+
+    if panel:
+        from crypto.panel import PricePanel
+        panel = PricePanel(source, base)
+        panel.update([ticker_join.join([name, base]) for name in universe], store)  # the tickers of make-panel
+        print(f"panel: {len(panel.tickers)} tickers x {panel.rows} minutes")
+
+
+@cli.command()
+@click.option("--source", "-s", default='BN')
+@click.option("--base", "-b", default='USDT')
+@click.option("--store", default=None, help="price store: h5 / parquet")
+def make_pyramid(source='BN', base='USDT', store=None):
+    """build / update 5min..1D bars of every ticker from its minute bars"""
+    from crypto.pyramid import build_pyramid
+
+    import json
+
+    with open(utils.universe_path, 'r') as universe_file:
+        universe = json.load(universe_file)[0]
+
+    if source == "CB":
+        ticker_join = '-'
+    elif source == "BN":
+        ticker_join = ''
+    else:
+        raise Exception(f"source {source} undefined")
+
+    with open(os.path.join(utils.price_path, f"{source}/meta.json"), 'r') as meta_file:
+        meta = json.load(meta_file)
+
+    for ticker in [ticker_join.join([name, base]) for name in universe]:
+        if ticker not in meta:
+            continue
+        print(f'building {ticker}')
+        build_pyramid(ticker, source, store)
+
+
+@cli.command()
+@click.option("--source", "-s", default='BN')
+@click.option("--base", "-b", default='USDT')
+@click.option("--store", default=None, help="price store: h5 / parquet")
+@click.option("--rebuild/", is_flag=True, default=False, help="rewrite the panel from scratch")
+def make_panel(source='BN', base='USDT', store=None, rebuild=False):
+    """build / update the (minute, ticker, field) panel of the universe"""
+    from crypto.panel import PricePanel
+
+    import json
+
+    with open(utils.universe_path, 'r') as universe_file:
+        universe = json.load(universe_file)[0]
+
+    if source == "CB":
+        ticker_join = '-'
+    elif source == "BN":
+        ticker_join = ''
+    else:
+        raise Exception(f"source {source} undefined")
+
+    tickers = [ticker_join.join([name, base]) for name in universe]
+    panel = PricePanel(source, base)
+    if rebuild:
+        panel.build(tickers, store)
+    else:
+        panel.update(tickers, store)
+    print(f"{len(panel.tickers)} tickers x {panel.rows} minutes from {panel.epoch[0]}")
+
 
 @cli.command()
 @click.option("--freq", "-f")
 @click.option("--source", "-s", default='BN')
 @click.option("--base", "-b", default='USDT')
-def make_tech_price(source='BN', freq=None, base='USDT'):
-    from crypto.PriceMaker import make_price_tech
+def make_features(source='BN', freq=None, base='USDT'):
+    """memory-map price_clean/{ticker}-{freq}.h5 of the universe for model.dataset"""
+    from model.dataset import FeatureFile
 
     import json
 
@@ -103,10 +251,61 @@ def make_tech_price(source='BN', freq=None, base='USDT'):
     else:
         raise Exception(f"source {source} undefined")
 
-    for name in universe:
-        ticker = ticker_join.join([name, base])
+    for ticker in [ticker_join.join([name, base]) for name in universe]:
+        try:
+            print(f"{ticker}: {FeatureFile(ticker, freq).update()} bars written")
+        except (OSError, KeyError) as e:
+            print(f"{ticker} failed", e)
+
+
+@cli.command()
+@click.option("--freq", "-f")
+@click.option("--source", "-s", default='BN')
+@click.option("--base", "-b", default='USDT')
+@click.option("--store", default=None, help="price store: h5 / parquet")
+@click.option("--workers", "-w", default=None, type=int, help="processes for (ticker, indicator group) tasks")
+@click.option("--groups", "-g", default=None, help="comma separated subset of TECH_GROUPS")
+@click.option("--incremental/", "-i/", is_flag=True, default=False, help="only append factors for new bars")
+@click.option("--verify/", is_flag=True, default=False, help="compare stored factors with a full recompute")
+def make_tech_price(source='BN', freq=None, base='USDT', store=None, workers=None, groups=None, incremental=False,
+                    verify=False):
+    from crypto.PriceMaker import make_price_tech, make_price_tech_universe, update_price_tech, verify_price_tech
+    from tqdm import tqdm
+
+    import json
+
+    with open(utils.universe_path, 'r') as universe_file:
+        universe = json.load(universe_file)[0]
+
+    if source == "CB":
+        ticker_join = '-'
+    elif source == "BN":
+        ticker_join = ''
+    else:
+        raise Exception(f"source {source} undefined")
+
+    if groups is not None:
+        groups = groups.split(',')
+
+    tickers = [ticker_join.join([name, base]) for name in universe]
+    if verify:
+        for ticker in tickers:
+            diff = verify_price_tech(ticker, source, freq, store, groups)
+            print(f"{ticker}: max relative difference {diff.iloc[0]:.2e} ({diff.index[0]})")
+        return
+    if incremental:
+        bar = tqdm(tickers)
+        for ticker in bar:
+            bar.write(f"{ticker}: {update_price_tech(ticker, source, freq, store, groups, bar=bar)} bars written")
+        return
+    if workers is not None and workers > 1:
+        for failed in make_price_tech_universe(tickers, source, freq, store, groups, workers):
+            print(*failed)
+        return
+
+    for ticker in tickers:
         print(f'making {ticker}')
-        make_price_tech(ticker, source, freq, True)
+        make_price_tech(ticker, source, freq, True, store, groups)
 
 
 if __name__ == '__main__':
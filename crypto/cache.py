@@ -0,0 +1,81 @@
+import os
+import glob
+import hashlib
+import pickle
+
+import numpy as np
+import pandas as pd
+import talib
+
+from crypto.utils import tech_cache_path, tech_cache_size
+
+
+class FactorCache:
+    """
+    computed tech factor frames on disk: {root}/{key}.pkl, where key hashes what identifies the input bars
+    (a stamp of the stored prices, not the bars themselves, so a hit reads nothing but the frame), the
+    indicator plan and the library versions. files are touched on every hit and the least recently used
+    ones are evicted once the cache outgrows `max_bytes`
+    """
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or tech_cache_path
+        self.max_bytes = tech_cache_size if max_bytes is None else max_bytes
+
+    def key(self, stamp, plan):
+        """
+        stamp: anything with a stable repr that changes whenever the input bars do (PriceMaker.price_stamp)
+        """
+        h = hashlib.blake2b(digest_size=20)
+        h.update(repr((stamp, plan, talib.__version__, np.__version__, pd.__version__)).encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, f"{key}.pkl")
+
+    def get(self, key):
+        """
+        cached frame or None
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                df = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        os.utime(path)
+        return df
+
+    def put(self, key, df):
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(key)
+        with open(path + ".tmp", 'wb') as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+        self.evict()
+
+    def evict(self):
+        """
+        drop least recently used frames until the cache fits in max_bytes
+        """
+        files = []
+        for path in glob.glob(os.path.join(self.root, "*.pkl")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum(f[1] for f in files)
+        for _, file_size, path in sorted(files):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self.root, "*.pkl")):
+            os.remove(path)
@@ -0,0 +1,245 @@
+import asyncio
+import time
+from collections import deque
+
+import aiohttp
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from crypto.PriceMaker import PriceBuffer, chunk_rows, read_stored, missing_range, load_checkpoint, \
+    save_checkpoint, last_closed_minute
+from crypto.kline import KLINE_LAYOUT, decode, parse_klines, to_frame
+from crypto.metrics import METRICS
+from crypto.ratelimit import AsyncRateLimiter, retry_after
+from crypto.utils import price_config
+
+RETRY_TIMES = 5
+TIMEOUT = 30
+
+
+def make_price_async(tickers, start, end, source, concurrency=32, host=None, incremental=False, store=None):
+    """
+    make_price for many tickers at once: up to `concurrency` window requests in flight across all tickers,
+    one shared request budget per exchange, every ticker still written in order through save_price.
+    return {ticker: (start_, end, row_count, na_count)}
+    """
+    return asyncio.run(_make_price(tickers, start, end, source, concurrency, host, incremental, store))
+
+
+class _Client:
+    def __init__(self, session, limiter, slots, host, bar, source):
+        self.session = session
+        self.limiter = limiter
+        self.slots = slots
+        self.host = host
+        self.bar = bar
+        self.source = source
+
+    async def get(self, path, params, ticker, start, parse):
+        """
+        parse(raw payload) of one request, -1 if it keeps failing.
+        parse returns None when the payload is not klines (error message): wait & ask again
+        """
+        retry_times = 0
+        while True:
+            error = status = None
+            async with self.slots:
+                waited = await self.limiter.acquire()
+                if waited > 0:
+                    METRICS.inc("price_rate_limit_sleep_seconds_total", waited, source=self.source)
+                t = time.perf_counter()
+                try:
+                    async with self.session.get(self.host + path, params=params) as res:
+                        status = res.status
+                        wait = retry_after(res.headers)
+                        payload = await res.read()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+                    error = ex
+                METRICS.observe("price_request_seconds", time.perf_counter() - t, source=self.source)
+                METRICS.inc("price_requests_total", source=self.source, status="error" if error else status)
+
+            if error is None and status in (418, 429):  # over the exchange budget: everybody waits
+                METRICS.inc("price_retries_total", source=self.source, reason="rate_limited")
+                self.limiter.penalize(wait)  # the sleep is counted by the acquires that wait it out
+                continue
+            if error is None and status != 200:
+                error = f"HTTP {status}: {payload.decode(errors='replace')}"
+            if error is not None:
+                METRICS.inc("price_retries_total", source=self.source, reason="error" if status is None else "http")
+                retry_times += 1
+                if retry_times > RETRY_TIMES:
+                    self.bar.write(f"{ticker} + {start}: failed")
+                    self.bar.write(str(error))
+                    return -1
+                await asyncio.sleep(0.5)
+                continue
+
+            with METRICS.timer("price_parse_seconds", source=self.source):
+                price = parse(payload)
+            if price is None:  # error message instead of klines
+                METRICS.inc("price_retries_total", source=self.source, reason="payload")
+                self.bar.write(f"{ticker} + {start}")
+                self.bar.write(payload.decode(errors='replace'))
+                await asyncio.sleep(1)
+                continue
+            return price
+
+
+async def _price_cb(client, ticker, start, end):
+    price = await client.get(
+        f"/products/{ticker}/candles",
+        {"start": start.isoformat(), "end": end.isoformat(), "granularity": 60},
+        ticker, start, lambda payload: parse_klines(payload, "CB", start, end)
+    )
+    if type(price) == int:
+        return price
+    return to_frame(*price, "CB")
+
+
+async def _price_bn(client, ticker, start, end):
+    price = await client.get(
+        "/api/v3/klines",
+        {"symbol": ticker, "interval": "1m", "startTime": 1000 * int(start.timestamp()),
+         "endTime": 1000 * int(end.timestamp()), "limit": 1000},
+        ticker, start, lambda payload: parse_klines(payload, "BN", start, end)
+    )
+    if type(price) == int:
+        return price
+    return to_frame(*price, "BN")
+
+
+async def _price_bn_earliest(client, ticker, start):
+    price = await client.get(
+        "/api/v3/klines",
+        {"symbol": ticker, "interval": "1m", "startTime": 1000 * int(start.timestamp()), "limit": 2},
+        ticker, start, lambda payload: decode(payload, KLINE_LAYOUT["BN"]["width"])
+    )
+    if type(price) == int or len(price) == 0:
+        return start
+    return pd.to_datetime(int(price[0, 0]) // 1000, unit='s')
+
+
+async def _make_price(tickers, start, end, source, concurrency, host, incremental, store):
+    if source == "CB":
+        price_func = _price_cb
+    elif source == "BN":
+        price_func = _price_bn
+    else:
+        raise Exception(f"source {source} undefined")
+
+    start = pd.to_datetime(start)
+    end = pd.to_datetime(end) + pd.to_timedelta('23H59min')
+    if incremental:
+        end = min(end, last_closed_minute())
+    grid = pd.date_range(start, end, freq=price_config[source]["interval"])
+
+    limiter = AsyncRateLimiter(price_config[source]["rate_limit"])
+    slots = asyncio.Semaphore(concurrency)
+    bar = tqdm(total=len(grid) * len(tickers))
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=TIMEOUT)) as session:
+        client = _Client(session, limiter, slots, host or price_config[source]["host"], bar, source)
+        results = await asyncio.gather(*[
+            _make_ticker(client, price_func, ticker, grid, end, source, concurrency, incremental, store)
+            for ticker in tickers
+        ])
+
+    bar.close()
+    return dict(zip(tickers, results))
+
+
+async def _make_ticker(client, price_func, ticker, grid, end, source, depth, incremental, store):
+    """
+    windows of one ticker are requested up to `depth` ahead but consumed & saved strictly in order
+    """
+    chunk = price_config[source]["chunk_size"]
+    interval_1 = pd.to_timedelta(price_config[source]["interval_1"])  # 0H00m -- x-Hour-1min
+    windows = [(s, s, min(s + interval_1, end), s + interval_1 <= end) for s in grid]
+
+    if source == "BN":
+        first_dt = await _price_bn_earliest(client, ticker, grid[0])
+        windows = [w for w in windows if w[2] >= first_dt]
+
+    start_ = None
+    chunk_count = 0
+    row_count = 0
+    na_count = 0
+    fetched = 0
+    t0 = time.perf_counter()
+    prices = PriceBuffer(source, chunk_rows(source))
+
+    if incremental:
+        epochs, na_count = read_stored(ticker, source, store)
+        row_count = len(epochs)
+        if row_count > 0:
+            start_ = pd.to_datetime(epochs[0], unit='s')
+        done = load_checkpoint(ticker, source)
+        done_chunk = []
+
+        todo = []
+        for s, s_, e_, whole in windows:
+            missing = None if int(s.timestamp()) in done else missing_range(epochs, s_, e_)
+            if missing is not None:
+                todo.append((s, *missing, whole))
+        windows = todo
+
+    client.bar.update(len(grid) - len(windows))
+    windows = iter(windows)
+    pending = deque()
+
+    def submit():
+        window = next(windows, None)
+        if window is not None:
+            s, s_, e_, whole = window
+            pending.append((s, whole, asyncio.create_task(price_func(client, ticker, s_, e_))))
+
+    for _ in range(depth):
+        submit()
+
+    try:
+        while pending:
+            s, whole, task = pending.popleft()
+            price = await task
+            submit()
+            client.bar.update(1)
+
+            if type(price) == int:
+                if price == -2 and start_ is not None:
+                    client.bar.write(f"{ticker} + {s}: no data")
+                if price == -2 and incremental and whole:
+                    done_chunk.append(int(s.timestamp()))
+                continue
+            if incremental:
+                price = price[~np.isin(price.epoch.values, epochs)]
+                if whole:
+                    done_chunk.append(int(s.timestamp()))
+            row_count += len(price)
+            fetched += len(price)
+            METRICS.inc("price_rows_total", len(price), source=source)
+            na_count += price.isna().any(axis=1).sum()
+            if start_ is None and row_count > 0:
+                start_ = pd.to_datetime(price.epoch.min(), unit='s')
+            prices.append(price)
+
+            chunk_count += 1
+            if chunk_count % chunk == 0:
+                prices.flush(ticker, source, store)
+                METRICS.set("price_rows_per_second", fetched / (time.perf_counter() - t0), source=source,
+                            ticker=ticker)
+                if incremental:
+                    done.update(done_chunk)
+                    save_checkpoint(ticker, source, done)
+                    done_chunk = []
+    finally:
+        for _, _, task in pending:
+            task.cancel()
+
+    if len(prices) > 0:
+        prices.flush(ticker, source, store)
+    METRICS.set("price_rows_per_second", fetched / (time.perf_counter() - t0), source=source, ticker=ticker)
+    if incremental:
+        done.update(done_chunk)
+        save_checkpoint(ticker, source, done)
+
+    return start_, end, row_count, na_count
@@ -0,0 +1,236 @@
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from multiprocessing import get_context
+
+import bs4
+import pandas as pd
+from bs4.dammit import EntitySubstitution
+
+if int(bs4.__version__.split(".")[0]) != 4:  # only its public named entity table is used, checked against 4.x
+    raise Exception(f"crypto.htmltext expects beautifulsoup4 4.x, found {bs4.__version__}")
+
+# what BeautifulSoup(..., 'html.parser') would do with them (bs4 HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS /
+# DEFAULT_STRING_CONTAINERS)
+EMPTY_ELEMENT_TAGS = frozenset([
+    'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr', 'image', 'img', 'input',
+    'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid', 'param', 'source', 'spacer', 'track', 'wbr'
+])
+STRING_CONTAINERS = frozenset(['rt', 'rp', 'style', 'script', 'template'])
+# numeric references to C1 controls that are windows-1252 characters (&#147; is a quote)
+WINDOWS_1252 = {n: bytes([n]).decode('cp1252') for n in range(0x80, 0xa0) if n not in (0x81, 0x8d, 0x8f, 0x90, 0x9d)}
+DECIMAL_REFERENCE = re.compile("^([0-9]+)(.*)")
+HEX_REFERENCE = re.compile("^([0-9a-f]+)(.*)")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def clean_href(text):
+    """
+    text of reddit html as RedditMaker used to get it from BeautifulSoup: <a href> tags dropped with their
+    content, then for every tag below the first <div>, in document order, its stripped strings joined by
+    ' ' -- nested text shows up once per enclosing tag, empty tags add empty items -- all joined by ' '.
+    the same html.parser events build only tag ranges & strings instead of a soup
+    """
+    if not isinstance(text, str):
+        raise TypeError(f"Incoming markup is of an invalid type: {text!r}")
+    parser = _HrefTextParser()
+    parser.feed(text)
+    parser.close()
+    return parser.text()
+
+
+def clean_href_many(texts):
+    return [clean_href(text) for text in texts]
+
+
+def clean_href_batch(texts, workers=None, chunksize=5000):
+    """
+    clean_href of a Series (Series with the same index returned) or any iterable (list returned).
+    workers > 1: chunks of `chunksize` texts are cleaned in the process pool of html_pool(workers)
+    """
+    index = texts.index if isinstance(texts, pd.Series) else None
+    texts = list(texts)
+    if workers is None or workers <= 1 or len(texts) <= chunksize:
+        cleaned = clean_href_many(texts)
+    else:
+        chunks = [texts[i:i + chunksize] for i in range(0, len(texts), chunksize)]
+        cleaned = [text for chunk in html_pool(workers).map(clean_href_many, chunks) for text in chunk]
+    return cleaned if index is None else pd.Series(cleaned, index=index, dtype=object)
+
+
+def html_pool(workers):
+    """
+    the one process pool of clean_href_batch, `workers` processes on first use. its processes come from a
+    forkserver, so the pool can be started & used from threads (forking a process whose other threads hold
+    locks can deadlock the child); start it before starting threads anyway to pay the startup once
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(workers, mp_context=get_context("forkserver"))
+        return _pool
+
+
+class _HrefTextParser(HTMLParser):
+    """
+    mirrors bs4's html.parser tree builder: same entity handling, same implicit closing of empty elements,
+    same end tag matching, adjacent data merged into one string. every tag & string gets a position in
+    document order; a tag's descendants are the positions handed out while it is open
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.position = 0
+        self.tags = []  # [name, start, end] outside <a href>, document order
+        self.strings = {}  # string kind -> ([position], [stripped text])
+        self.stack = []  # open [name, start, end, is <a href>]
+        self.open = Counter()
+        self.containers = []  # open tags giving their strings a kind of their own (script, style, ...)
+        self.excluded = 0  # open <a href> tags
+        self.data = []
+        self.closed_empty = []
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        self._end_data()
+        href = tag == 'a' and any(key == 'href' for key, _ in attrs)
+        node = [tag, self.position, None, href]
+        self.position += 1
+        if not self.excluded and not href:
+            self.tags.append(node)
+        if href:
+            self.excluded += 1
+        self.stack.append(node)
+        self.open[tag] += 1
+        if tag in STRING_CONTAINERS:
+            self.containers.append(node)
+
+        if tag in EMPTY_ELEMENT_TAGS and handle_empty_element:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.closed_empty.append(tag)
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self.closed_empty:
+            self.closed_empty.remove(tag)
+            return
+        self._end_data()
+        while self.stack and self.open[tag]:
+            if self._pop()[0] == tag:
+                break
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_charref(self, name):
+        character, extra = _dereference(name)
+        self.handle_data(character)
+        if extra:
+            self.handle_data(extra)
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else "&%s" % name)
+
+    def handle_comment(self, data):
+        self._end_data()
+        self.handle_data(data)
+        self._end_data(None)
+
+    def handle_decl(self, decl):
+        self._end_data()
+        self.handle_data(decl)
+        self._end_data(None)
+
+    def unknown_decl(self, data):
+        self._end_data()
+        self.handle_data(data[len("CDATA["):] if data.upper().startswith("CDATA[") else data)
+        self._end_data("cdata" if data.upper().startswith("CDATA[") else None)
+
+    def handle_pi(self, data):
+        self._end_data()
+        self.handle_data(data)
+        self._end_data(None)
+
+    def close(self):
+        super().close()
+        self._end_data()
+        while self.stack:
+            self._pop()
+
+    def text(self):
+        div = next((i for i, tag in enumerate(self.tags) if tag[0] == 'div'), None)
+        if div is None:
+            raise AttributeError("'NoneType' object has no attribute 'find_all'")
+
+        _, start, end = self.tags[div][:3]
+        parts = []
+        for name, s, e, _ in self.tags[div + 1:]:
+            if s >= end:
+                break
+            positions, texts = self.strings.get(name if name in STRING_CONTAINERS else "text", ((), ()))
+            parts.append(' '.join(texts[bisect_right(positions, s):bisect_left(positions, e)]))
+        return ' '.join(parts)
+
+    def _pop(self):
+        node = self.stack.pop()
+        node[2] = self.position
+        self.open[node[0]] -= 1
+        if self.containers and self.containers[-1] is node:
+            self.containers.pop()
+        if node[3]:
+            self.excluded -= 1
+        return node
+
+    def _end_data(self, kind="string"):
+        """
+        kind: "string" (plain text, or the kind of the innermost container tag), "cdata", None (comments &
+        declarations, never part of get_text)
+        """
+        if not self.data:
+            return
+        text = ''.join(self.data).strip()
+        self.data = []
+        position = self.position
+        self.position += 1
+        if kind is None or self.excluded or not text:
+            return
+
+        if kind == "string":
+            kind = self.containers[-1][0] if self.containers else "text"
+        elif kind == "cdata":
+            kind = "text"
+        positions, texts = self.strings.setdefault(kind, ([], []))
+        positions.append(position)
+        texts.append(text)
+
+
+def _dereference(name):
+    """
+    (character, data after the reference) of a numeric character reference as bs4 resolves it (the html
+    spec's numeric character reference end state): NUL, surrogates and beyond U+10FFFF become U+FFFD, C1
+    controls that are windows-1252 characters become those. a reference with trailing junk ("12ab") keeps
+    its leading number, one that does not start with a number is data
+    """
+    base, reference = 10, DECIMAL_REFERENCE
+    if name.startswith("x") or name.startswith("X"):
+        name, base, reference = name[1:], 16, HEX_REFERENCE
+    extra = ""
+    try:
+        numeric = int(name, base)
+    except ValueError:
+        match = reference.search(name)
+        if match is None:
+            return "", name
+        numeric, extra = int(match.group(1), base), match.group(2)
+
+    if numeric == 0 or numeric > 0x10ffff or 0xd800 <= numeric <= 0xdfff:
+        return "\ufffd", extra
+    return WINDOWS_1252.get(numeric, chr(numeric)), extra
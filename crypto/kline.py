@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+from crypto.utils import price_config
+
+# where each exchange puts things in one kline row
+KLINE_LAYOUT = {
+    "BN": {  # [open time ms, open, high, low, close, volume, close time, quote volume, trades, ...] -- 12 fields
+        "width": 12,
+        "epoch_scale": 1000,
+        "fields": [1, 2, 3, 4, 5, 7, 8],
+    },
+    "CB": {  # [time, low, high, open, close, volume], stored as labelled in price_config["CB"]["columns"]
+        "width": 6,
+        "epoch_scale": 1,
+        "fields": [1, 2, 3, 4, 5],
+    },
+}
+
+
+def decode(payload, width):
+    """
+    raw json kline payload (bytes / str) -> float64 matrix (rows, width) in one C pass, without building
+    python lists. None when the payload is not a list of klines (e.g. an error message)
+    """
+    if isinstance(payload, str):
+        payload = payload.encode()
+    payload = payload.strip()
+    if payload[:1] != b'[':
+        return None
+
+    text = payload.translate(None, b'[]"')
+    if len(text.strip()) == 0:
+        return np.empty((0, width))
+    rows = np.fromstring(text, dtype=np.float64, sep=',')
+    if rows.size != text.count(b',') + 1 or rows.size % width != 0:
+        return None
+    return rows.reshape(-1, width)
+
+
+def parse_klines(payload, source, start, end):
+    """
+    kline payload -> (epoch, values) on the minute grid [start, end]:
+    epoch int64 (n,), values float64 (fields, n) in price_config[source]["columns"] order, NaN where no kline.
+    -2 when the payload holds no klines, None when it is not klines at all
+    """
+    layout = KLINE_LAYOUT[source]
+    rows = decode(payload, layout["width"])
+    if rows is None:
+        return None
+    if len(rows) == 0:
+        return -2
+
+    s = int(start.timestamp())
+    n = (int(end.timestamp()) - s) // 60 + 1
+    epoch = np.arange(s, s + 60 * n, 60, dtype=np.int64)
+    values = np.full((len(layout["fields"]), n), np.nan)
+
+    offset = rows[:, 0].astype(np.int64) // layout["epoch_scale"] - s
+    idx = offset // 60
+    keep = (offset % 60 == 0) & (idx >= 0) & (idx < n)
+    values[:, idx[keep]] = rows[keep][:, layout["fields"]].T
+    return epoch, values
+
+
+def to_frame(epoch, values, source):
+    """
+    price frame viewing the parsed arrays, no copy
+    """
+    columns = price_config[source]["columns"]
+    price = pd.DataFrame(values.T, columns=columns[1:], copy=False)
+    price.insert(0, columns[0], epoch)
+    return price
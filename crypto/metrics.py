@@ -0,0 +1,210 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # seconds, requests & writes
+WINDOW_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)  # seconds, whole fetch windows
+
+
+class Metrics:
+    """
+    counters, gauges & histograms keyed by name and labels, updated from any thread or coroutine.
+    written as a JSON snapshot or in the Prometheus text format (a file for node_exporter's textfile collector)
+        METRICS.inc("price_requests_total", source="BN", status="200")
+        with METRICS.timer("price_store_write_seconds", store="h5"): ...
+    """
+
+    def __init__(self, prefix="crypto_"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.counters = {}  # (name, labels) -> value
+            self.gauges = {}
+            self.histograms = {}  # (name, labels) -> {"buckets", "counts", "count", "sum"}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, _labels(labels))] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """
+        one value into a histogram; its buckets are fixed by the first observation
+        """
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": tuple(buckets), "counts": [0] * len(buckets),
+                                                    "count": 0, "sum": 0.0}
+            for i, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    histogram["counts"][i] += 1
+                    break
+            histogram["count"] += 1
+            histogram["sum"] += value
+
+    @contextmanager
+    def timer(self, name, buckets=LATENCY_BUCKETS, **labels):
+        """
+        observe the seconds the block takes, also when it raises
+        """
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t, buckets, **labels)
+
+    def snapshot(self):
+        """
+        {"started", "elapsed", "counters", "gauges", "histograms"}, every series as {"labels", "value"} /
+        {"labels", "buckets" (upper bound -> count, not cumulative), "count", "sum"}
+        """
+        with self._lock:
+            def series(values):
+                out = {}
+                for (name, labels), value in sorted(values.items()):
+                    out.setdefault(name, []).append({"labels": dict(labels), "value": value})
+                return out
+
+            histograms = {}
+            for (name, labels), h in sorted(self.histograms.items()):
+                buckets = dict(zip([str(b) for b in h["buckets"]], h["counts"]))
+                buckets["+Inf"] = h["count"] - sum(h["counts"])
+                histograms.setdefault(name, []).append({"labels": dict(labels), "buckets": buckets,
+                                                        "count": h["count"], "sum": h["sum"]})
+            return {"started": self.started, "elapsed": time.time() - self.started,
+                    "counters": series(self.counters), "gauges": series(self.gauges), "histograms": histograms}
+
+    def prometheus(self):
+        """
+        the Prometheus text exposition format, names prefixed with `prefix`
+        """
+        with self._lock:
+            lines = []
+            for kind, values in [("counter", self.counters), ("gauge", self.gauges)]:
+                typed = set()
+                for (name, labels), value in sorted(values.items()):
+                    name = self.prefix + name
+                    if name not in typed:
+                        lines.append(f"# TYPE {name} {kind}")
+                        typed.add(name)
+                    lines.append(f"{name}{_format(labels)} {value}")
+
+            typed = set()
+            for (name, labels), h in sorted(self.histograms.items()):
+                name = self.prefix + name
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(h["buckets"], h["counts"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format(labels + (('le', '+Inf'),))} {h['count']}")
+                lines.append(f"{name}_sum{_format(labels)} {h['sum']}")
+                lines.append(f"{name}_count{_format(labels)} {h['count']}")
+            return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        replace `path` with the current metrics: Prometheus text for *.prom, JSON otherwise
+        """
+        text = self.prometheus() if path.endswith(".prom") else json.dumps(self.snapshot(), indent=1)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + ".tmp", 'w') as f:
+            f.write(text)
+        os.replace(path + ".tmp", path)
+
+
+METRICS = Metrics()  # what the fetchers record into
+
+
+class Exporter:
+    """
+    writes `metrics` to `path` every `interval` seconds from a daemon thread, and once more on stop
+    """
+
+    def __init__(self, path, interval=10.0, metrics=METRICS):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.metrics.write(self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.metrics.write(self.path)
+
+
+@contextmanager
+def profiling(path):
+    """
+    cProfile the block into `path` (pstats file: python -m pstats path): the calling thread and every thread
+    started inside the block (day workers, comment & pmaw pools), one profiler each, merged at the end.
+    threads started before the block and worker processes (html cleaning) are not seen. from python 3.12 on only
+    one cProfile can be active, so only the calling thread is profiled there
+    """
+    profilers = [cProfile.Profile()]
+    lock = threading.Lock()
+    per_thread = sys.version_info < (3, 12)
+    if not per_thread:
+        warnings.warn("python >= 3.12 allows one active cProfile: only the calling thread is profiled")
+
+    def start(*_):  # first profile event of a new thread: hand it over to its own profiler
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        with lock:
+            profilers.append(profiler)
+        profiler.enable()
+
+    if per_thread:
+        threading.setprofile(start)
+    profilers[0].enable()
+    try:
+        yield profilers[0]
+    finally:
+        profilers[0].disable()
+        if per_thread:
+            threading.setprofile(None)
+        with lock:
+            stats = pstats.Stats(profilers[0])
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        stats.dump_stats(path)
+
+
+def _labels(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format(labels):
+    if not labels:
+        return ""
+    escaped = [(name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+               for name, value in labels]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
@@ -0,0 +1,179 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from crypto.store import get_store
+from crypto.utils import price_path, price_config
+
+
+class PricePanel:
+    """
+    the whole universe on one minute grid: {price_path}/panel/{source}-{base}/
+        values.f64  float64 memmap (minute, ticker, field), NaN where a ticker has no bar
+        mask.u8     bool memmap (minute, ticker), True where a ticker has a bar (close is not NaN)
+        meta.json   grid start, rows, tickers, fields and what has been written per ticker
+
+    time is the outer axis, so a date range is one contiguous block of both files and the grid grows by
+    appending to them. meta.json is replaced last, a run that dies half way is redone by the next update
+    """
+
+    def __init__(self, source, base, root=None):
+        self.source = source
+        self.root = os.path.join(root or os.path.join(price_path, "panel"), f"{source}-{base}")
+        self.fields = price_config[source]["columns"][1:]
+        self.meta = self._load_meta()
+
+    @property
+    def tickers(self):
+        return self.meta["tickers"] if self.meta else []
+
+    @property
+    def rows(self):
+        return self.meta["rows"] if self.meta else 0
+
+    @property
+    def epoch(self):
+        """
+        epoch seconds of the grid rows
+        """
+        return self.meta["start"] + 60 * np.arange(self.rows, dtype=np.int64)
+
+    def values(self, mode='r'):
+        return np.memmap(self._path("values.f64"), dtype=np.float64, mode=mode,
+                         shape=(self.rows, len(self.tickers), len(self.fields)))
+
+    def mask(self, mode='r'):
+        return np.memmap(self._path("mask.u8"), dtype=np.bool_, mode=mode, shape=(self.rows, len(self.tickers)))
+
+    def update(self, tickers, store=None):
+        """
+        bring the panel up to date with the price store: a ticker whose row count did not change is not read,
+        otherwise only its rows newer than what it has in the panel are, unless the store gained or lost rows
+        inside the written range (a gap backfill), then that ticker is reread. a different ticker list or rows
+        before the grid start rebuild the panel
+        """
+        store = get_store(store)
+        tickers = [ticker for ticker in tickers if store.exists(ticker, self.source)]
+        if self.meta is None or self.meta["tickers"] != tickers:
+            return self.build(tickers, store.name)
+
+        written = self.meta["written"]
+        for j, ticker in enumerate(tickers):
+            end, count = written[ticker]
+            stored = store.rows(ticker, self.source)
+            if stored == count:
+                continue
+            rows = store.read(ticker, self.source, start=end + 1)
+            reread = count + len(rows) != stored  # rows were added / dropped inside the written range
+            if reread:
+                count = 0
+                rows = store.read(ticker, self.source)
+            if len(rows) > 0 and rows.epoch.min() < self.meta["start"]:
+                return self.build(tickers, store.name)
+            if len(rows) > 0:
+                self._grow((int(rows.epoch.max()) - self.meta["start"]) // 60 + 1)
+
+            values, mask = self.values('r+'), self.mask('r+')
+            if reread:
+                values[:, j, :] = np.nan
+                mask[:, j] = False
+                written[ticker] = (self.meta["start"] - 60, 0)
+            if len(rows) > 0:
+                written[ticker] = self._write(values, mask, j, rows, count)
+            values.flush()
+            mask.flush()
+            self._save_meta()
+        return self.rows
+
+    def build(self, tickers, store=None):
+        """
+        (re)write the panel from scratch
+        """
+        store = get_store(store)
+        tickers = [ticker for ticker in tickers if store.exists(ticker, self.source)]
+        epochs = [store.read(ticker, self.source, columns=["epoch"]).epoch.values for ticker in tickers]
+        epochs = [e for e in epochs if len(e) > 0]
+        if len(epochs) == 0:
+            raise Exception(f"no {self.source} prices on disk")
+
+        os.makedirs(self.root, exist_ok=True)
+        for name in ["meta.json", "values.f64", "mask.u8"]:
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+        start = int(min(e.min() for e in epochs))
+        self.meta = {"start": start, "rows": 0, "tickers": tickers, "fields": self.fields,
+                     "written": {ticker: (start - 60, 0) for ticker in tickers}}
+        open(self._path("values.f64"), 'wb').close()
+        open(self._path("mask.u8"), 'wb').close()
+        return self.update(tickers, store.name)
+
+    def slice(self, start=None, end=None, tickers=None, fields=None):
+        """
+        (epoch, values, mask) for start <= epoch <= end (epoch seconds or anything pd.to_datetime takes).
+        a date range alone gives views on the memmaps, ticker / field subsets are copied out of them
+        """
+        epoch = self.epoch
+        lo = 0 if start is None else np.searchsorted(epoch, _epoch(start), side='left')
+        hi = len(epoch) if end is None else np.searchsorted(epoch, _epoch(end), side='right')
+        values, mask = self.values()[lo:hi], self.mask()[lo:hi]
+
+        if tickers is not None:
+            idx = [self.tickers.index(ticker) for ticker in tickers]
+            values, mask = values[:, idx], mask[:, idx]
+        if fields is not None:
+            values = values[:, :, [self.fields.index(field) for field in fields]]
+        return epoch[lo:hi], values, mask
+
+    def frame(self, field, start=None, end=None, tickers=None):
+        """
+        one field as a DataFrame, datetime index x ticker columns
+        """
+        epoch, values, _ = self.slice(start, end, tickers, [field])
+        return pd.DataFrame(values[:, :, 0], index=pd.to_datetime(epoch, unit='s'),
+                            columns=tickers or self.tickers)
+
+    def _write(self, values, mask, j, rows, count):
+        idx = (rows.epoch.values - self.meta["start"]) // 60
+        values[idx, j, :] = rows[self.fields].values
+        mask[idx, j] = ~np.isnan(rows.close.values)
+        return int(rows.epoch.values.max()), count + len(rows)
+
+    def _grow(self, rows):
+        if rows <= self.rows:
+            return
+        old = self.rows
+        width = len(self.tickers)
+        with open(self._path("values.f64"), 'r+b') as f:
+            f.truncate(rows * width * len(self.fields) * 8)
+        with open(self._path("mask.u8"), 'r+b') as f:
+            f.truncate(rows * width)
+        self.meta["rows"] = rows
+        values = self.values('r+')
+        values[old:] = np.nan
+        values.flush()
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _load_meta(self):
+        if not os.path.exists(self._path("meta.json")):
+            return None
+        with open(self._path("meta.json"), 'r') as f:
+            meta = json.load(f)
+        if meta["fields"] != self.fields:
+            return None
+        meta["written"] = {ticker: tuple(w) for ticker, w in meta["written"].items()}
+        return meta
+
+    def _save_meta(self):
+        with open(self._path("meta.json.tmp"), 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(self._path("meta.json.tmp"), self._path("meta.json"))
+
+
+def _epoch(t):
+    if isinstance(t, (int, np.integer)):
+        return int(t)
+    return int(pd.to_datetime(t).timestamp())
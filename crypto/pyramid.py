@@ -0,0 +1,131 @@
+import os
+import json
+
+import pandas as pd
+
+from crypto.store import get_store
+from crypto.utils import price_path
+
+# each level is built from the one below it, the first from raw minutes. every level divides a day,
+# so bins line up with any midnight origin and a level can serve any multiple of itself
+PYRAMID_LEVELS = ['5min', '15min', '1H', '4H', '8H', '1D']
+BAR_AGG = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum', 'amount': 'sum',
+           'count': 'sum'}
+
+
+def pyramid_path(ticker, source):
+    return os.path.join(price_path, f"pyramid/{source}/{ticker}.h5")
+
+
+def pyramid_current(ticker, source, store=None):
+    """
+    whether the pyramid was built from `store` and covers every row it holds now. minutes fetched without
+    updating the pyramid (make-price without -p) leave it behind until build_pyramid runs again
+    """
+    meta = _load_meta(ticker, source)
+    store = get_store(store)
+    return meta is not None and meta["store"] == store.name and meta["rows"] == store.rows(ticker, source)
+
+
+def pyramid_level(freq):
+    """
+    coarsest level whose bars add up to `freq` bars, None if only raw minutes do
+    """
+    try:
+        freq = pd.to_timedelta(freq)
+    except ValueError:
+        return None
+    levels = [level for level in PYRAMID_LEVELS if freq % pd.to_timedelta(level) == pd.Timedelta(0)]
+    return levels[-1] if levels else None
+
+
+def resample_bars(bars, freq, origin='epoch'):
+    """
+    bars labelled by the right edge of (t - freq, t], the same bins as get_clean_price
+    """
+    agg = {col: how for col, how in BAR_AGG.items() if col in bars.columns}
+    return bars.resample(freq, label='right', closed='right', origin=origin).agg(agg)
+
+
+def build_pyramid(ticker, source, store=None):
+    """
+    bring every level of pyramid/{source}/{ticker}.h5 up to date. a level only re-aggregates its last
+    stored bar (it may have been partial) and what came after, from the level below. the store and its row
+    count go to pyramid/{source}/{ticker}.json; the pyramid is rebuilt when they do not add up with the rows
+    after its last minute (another store, minutes backfilled before it, rows truncated or compacted away)
+    """
+    with open(os.path.join(price_path, f"{source}/meta.json"), 'r') as f:
+        start = pd.to_datetime(json.load(f).get(ticker).get('start'))
+
+    path = pyramid_path(ticker, source)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    store = get_store(store)
+    rows = store.rows(ticker, source)
+
+    meta = _load_meta(ticker, source)
+    if meta is not None and meta["store"] == store.name:
+        newer = store.read(ticker, source, start=None if meta["epoch"] is None else meta["epoch"] + 1,
+                           columns=["epoch"])
+        if meta["rows"] + len(newer) != rows:
+            meta = None
+    else:
+        meta = None
+    if meta is None and os.path.exists(path):
+        os.remove(path)
+    last_epoch = None if meta is None else meta["epoch"]  # last minute aggregated
+
+    with pd.HDFStore(path, mode='a', complevel=5) as hdf:
+        for i, level in enumerate(PYRAMID_LEVELS):
+            key = _key(level)
+            last = hdf.select_column(key, 'index').iloc[-1] if key in hdf else None
+            since = None if last is None else last - pd.to_timedelta(level)  # bin of the last stored bar
+
+            if i == 0:
+                epoch = int(start.timestamp()) if since is None else max(int(since.timestamp()) + 1,
+                                                                         int(start.timestamp()))
+                base = store.read(ticker, source, start=epoch)
+                if len(base) > 0:
+                    last_epoch = max(last_epoch or 0, int(base.epoch.max()))
+                base['datetime'] = base.epoch.values.astype("datetime64[s]")  # read-only (zero-copy) columns
+                base = base.set_index('datetime').drop('epoch', axis=1)
+            else:
+                base = hdf.select(_key(PYRAMID_LEVELS[i - 1]), where=None if since is None else f"index>'{since}'")
+
+            bars = resample_bars(base, level)
+            if len(bars) == 0:
+                continue
+            if last is not None:
+                hdf.remove(key, where=f"index>='{last}'")
+                bars = bars[bars.index >= last]
+            hdf.append(key, bars, format='table')
+
+    _save_meta(ticker, source, {"store": store.name, "rows": rows, "epoch": last_epoch})
+
+
+def read_pyramid(ticker, source, level, start=None):
+    """
+    stored bars of one level, labels >= start
+    """
+    where = None if start is None else f"index>='{pd.to_datetime(start)}'"
+    return pd.read_hdf(pyramid_path(ticker, source), key=_key(level), where=where)
+
+
+def _key(level):
+    return f"bar_{level}"
+
+
+def _meta_path(ticker, source):
+    return os.path.join(price_path, f"pyramid/{source}/{ticker}.json")
+
+
+def _load_meta(ticker, source):
+    if not os.path.exists(_meta_path(ticker, source)):
+        return None
+    with open(_meta_path(ticker, source), 'r') as f:
+        return json.load(f)
+
+
+def _save_meta(ticker, source, meta):
+    with open(_meta_path(ticker, source) + ".tmp", 'w') as f:
+        json.dump(meta, f)
+    os.replace(_meta_path(ticker, source) + ".tmp", _meta_path(ticker, source))
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+
+class AsyncRateLimiter:
+    """
+    request budget shared by every coroutine talking to one exchange.
+    same rule as PriceMaker.__rate_limit: at most `rate` requests in any `period` seconds
+    """
+
+    def __init__(self, rate, period=1.0):
+        self.rate = rate
+        self.period = period
+        self._stamps = deque()
+        self._lock = asyncio.Lock()
+        self._until = 0.0
+
+    async def acquire(self):
+        """
+        wait for a slot of the budget (and out a penalty), return the seconds waited (for the lock too)
+        """
+        t = time.monotonic()
+        async with self._lock:
+            if self._until > t:
+                await asyncio.sleep(self._until - time.monotonic())
+            while len(self._stamps) >= self.rate:
+                wait = self._stamps[0] + self.period - time.monotonic()
+                if wait <= 0:
+                    self._stamps.popleft()
+                    continue
+                await asyncio.sleep(wait)
+            now = time.monotonic()
+            self._stamps.append(now)
+        return now - t
+
+    def penalize(self, seconds):
+        """
+        exchange told us to back off (429/418): no request before `seconds` from now. the wait is served and
+        reported by acquire, like any other
+        """
+        self._until = max(self._until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """
+    thread-safe twin of AsyncRateLimiter: at most `rate` calls in any `period` seconds, whichever thread makes them
+    """
+
+    def __init__(self, rate, period=1.0):
+        self.rate = rate
+        self.period = period
+        self._stamps = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        wait for a slot of the budget, return the seconds waited (for the lock too)
+        """
+        t = time.monotonic()
+        with self._lock:
+            while len(self._stamps) >= self.rate:
+                wait = self._stamps[0] + self.period - time.monotonic()
+                if wait <= 0:
+                    self._stamps.popleft()
+                    continue
+                time.sleep(wait)
+            now = time.monotonic()
+            self._stamps.append(now)
+        return now - t
+
+
+def retry_after(headers, default=1.0):
+    """
+    seconds a Retry-After header asks for, either delay seconds or an HTTP date; `default` when it is missing or
+    unreadable
+    """
+    value = headers.get("Retry-After")
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return default
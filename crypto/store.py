@@ -0,0 +1,224 @@
+import os
+import glob
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from crypto.utils import price_path, price_store
+
+
+class H5PriceStore:
+    """
+    one PyTables table per ticker: {price_path}/{source}/{ticker}.h5
+    """
+    name = "h5"
+
+    def __init__(self, root=None):
+        self.root = root or price_path
+
+    def path(self, ticker, source):
+        return os.path.join(self.root, f"{source}/{ticker}.h5")
+
+    def exists(self, ticker, source):
+        return os.path.exists(self.path(ticker, source))
+
+    def append(self, prices, ticker, source):
+        if self.exists(ticker, source):
+            prices.to_hdf(self.path(ticker, source),
+                          key=ticker,
+                          mode='a',
+                          format='table',
+                          index=False,
+                          data_columns=["epoch"],
+                          append=True)
+        else:
+            prices.to_hdf(self.path(ticker, source),
+                          key=ticker,
+                          mode='w',
+                          format='table',
+                          index=False,
+                          data_columns=["epoch"])
+
+    def read(self, ticker, source, start=None, end=None, columns=None):
+        """
+        rows with start <= epoch <= end (epoch seconds, either side open when None)
+        """
+        where = []
+        if start is not None:
+            where.append(f"epoch>={start}")
+        if end is not None:
+            where.append(f"epoch<={end}")
+        return pd.read_hdf(self.path(ticker, source), key=ticker, where=where or None, columns=columns)
+
+    def rows(self, ticker, source):
+        with pd.HDFStore(self.path(ticker, source), mode='r') as store:
+            return int(store.get_storer(ticker).nrows)
+
+    def stamp(self, ticker, source):
+        """
+        (rows, modification time ns): changes with every write
+        """
+        return self.rows(ticker, source), os.stat(self.path(ticker, source)).st_mtime_ns
+
+    def truncate(self, ticker, source, epoch):
+        """
+        drop every row after `epoch`
+        """
+        with pd.HDFStore(self.path(ticker, source), mode='a') as store:
+            store.remove(ticker, where=f"epoch>{epoch}")
+
+
+class ParquetPriceStore:
+    """
+    parquet dataset partitioned by source, ticker and month:
+    {price_path}/parquet/source={source}/ticker={ticker}/month=YYYY-MM/part-{first epoch}-{last epoch}.parquet
+
+    every file carries epoch statistics, so range reads prune months by path and row groups by
+    predicate pushdown. files are read through a memory-mapped filesystem and numeric columns
+    are handed to numpy without copies where arrow allows it (see read_arrays)
+    """
+    name = "parquet"
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(price_path, "parquet")
+        self.filesystem = fs.LocalFileSystem(use_mmap=True)
+
+    def path(self, ticker, source):
+        return os.path.join(self.root, f"source={source}", f"ticker={ticker}")
+
+    def exists(self, ticker, source):
+        return len(self._files(ticker, source)) > 0
+
+    def append(self, prices, ticker, source):
+        month = _month(prices.epoch.values)
+        for m in np.unique(month):
+            self._write(prices[month == m], ticker, source, m)
+
+    def read(self, ticker, source, start=None, end=None, columns=None):
+        """
+        rows with start <= epoch <= end (epoch seconds, either side open when None), sorted by epoch
+        """
+        table = self._table(ticker, source, start, end, columns)
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+
+    def read_arrays(self, ticker, source, start=None, end=None, columns=None):
+        """
+        {column: np.ndarray}; a column is a zero-copy view on the memory-mapped data when it comes from
+        a single chunk, otherwise chunks are concatenated once
+        """
+        table = self._table(ticker, source, start, end, columns)
+        return {name: _to_numpy(table.column(name)) for name in table.column_names}
+
+    def rows(self, ticker, source):
+        """
+        row count from the file footers
+        """
+        return sum(pq.read_metadata(file).num_rows for file in self._files(ticker, source))
+
+    def stamp(self, ticker, source):
+        """
+        (rows, newest file modification time ns, files): changes with every write
+        """
+        files = self._files(ticker, source)
+        return self.rows(ticker, source), max(os.stat(file).st_mtime_ns for file in files), len(files)
+
+    def truncate(self, ticker, source, epoch):
+        """
+        drop every row after `epoch`
+        """
+        for month_path in sorted(glob.glob(os.path.join(self.path(ticker, source), "month=*"))):
+            m = os.path.basename(month_path)[len("month="):]
+            if m < _month(np.array([epoch]))[0]:
+                continue
+            files = glob.glob(os.path.join(month_path, "*.parquet"))
+            kept = pq.read_table(files, filters=[("epoch", "<=", epoch)], partitioning=None).to_pandas()
+            name = None
+            if len(kept) > 0:
+                self._write(kept, ticker, source, m)
+                name = _part_name(kept)
+            for file in files:
+                if os.path.basename(file) != name:
+                    os.remove(file)
+
+    def compact(self, ticker, source):
+        """
+        rewrite every month of a ticker as one file sorted by epoch
+        """
+        for month_path in sorted(glob.glob(os.path.join(self.path(ticker, source), "month=*"))):
+            files = glob.glob(os.path.join(month_path, "*.parquet"))
+            if len(files) < 2:
+                continue
+            prices = pq.read_table(files, partitioning=None).to_pandas()
+            prices = prices.sort_values("epoch").drop_duplicates("epoch", keep="last")
+            self._write(prices, ticker, source, os.path.basename(month_path)[len("month="):])
+            for file in files:
+                if os.path.basename(file) != _part_name(prices):
+                    os.remove(file)
+
+    def _files(self, ticker, source):
+        return sorted(glob.glob(os.path.join(self.path(ticker, source), "month=*", "*.parquet")))
+
+    def _write(self, prices, ticker, source, month):
+        # NaN stays NaN (not null), so float columns keep a plain numpy-compatible buffer
+        table = pa.Table.from_arrays(
+            [pa.array(prices[col].values) for col in prices.columns], names=list(prices.columns)
+        )
+        month_path = os.path.join(self.path(ticker, source), f"month={month}")
+        os.makedirs(month_path, exist_ok=True)
+        path = os.path.join(month_path, _part_name(prices))
+        pq.write_table(table, path + ".tmp", compression="snappy", write_statistics=True)
+        os.replace(path + ".tmp", path)
+
+    def _table(self, ticker, source, start, end, columns):
+        files = self._files(ticker, source)
+        if len(files) == 0:
+            raise Exception(f"{ticker} does not exist on disk")
+
+        dataset = ds.dataset(self.path(ticker, source), format="parquet", partitioning="hive",
+                             filesystem=self.filesystem)
+        condition = None
+        if start is not None:
+            condition = (ds.field("month") >= _month(np.array([start]))[0]) & (ds.field("epoch") >= start)
+        if end is not None:
+            upper = (ds.field("month") <= _month(np.array([end]))[0]) & (ds.field("epoch") <= end)
+            condition = upper if condition is None else condition & upper
+        if columns is None:
+            columns = [name for name in dataset.schema.names if name != "month"]
+
+        table = dataset.to_table(columns=columns, filter=condition)
+        if "epoch" in columns and len(table) > 1:
+            epoch = _to_numpy(table.column("epoch"))
+            if (np.diff(epoch) < 0).any():
+                table = table.take(np.argsort(epoch, kind="stable"))
+        return table
+
+
+STORES = {store.name: store for store in [H5PriceStore, ParquetPriceStore]}
+
+
+def get_store(name=None):
+    """
+    price store by name ("h5" / "parquet"), default utils.price_store
+    """
+    name = name or price_store
+    if name not in STORES:
+        raise Exception(f"store {name} undefined")
+    return STORES[name]()
+
+
+def _month(epoch):
+    return pd.to_datetime(epoch, unit='s').strftime("%Y-%m").values
+
+
+def _part_name(prices):
+    return f"part-{int(prices.epoch.min())}-{int(prices.epoch.max())}.parquet"
+
+
+def _to_numpy(column):
+    if column.num_chunks == 1 and column.null_count == 0:
+        return column.chunk(0).to_numpy(zero_copy_only=False)
+    return column.to_numpy()
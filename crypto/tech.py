@@ -0,0 +1,93 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import pandas as pd
+import talib
+from talib import abstract
+
+TECH_GROUPS = ['Cycle Indicators', 'Momentum Indicators', 'Overlap Studies', 'Pattern Recognition', 'Price Transform',
+               'Statistic Functions', 'Volatility Indicators', 'Volume Indicators']
+TECH_EXCLUDE = ['MAVP']  # needs a `periods` input series
+
+# incremental updates (PriceMaker.update_price_tech)
+TECH_WARMUP = 2000  # stored bars recomputed in front of the new ones
+TECH_RTOL = 1e-8  # allowed difference to a full recompute, relative to the column scale
+# running totals from the first bar, continued from the stored value. AD & OBV are in every TA-Lib; PVT, PVI, NVI
+# (Volume Indicators) & WAD (Momentum Indicators) come with the 0.8 C library (talib.__ta_version__). columns an
+# older TA-Lib does not have are never in tech_plan and are skipped
+TECH_CUMULATIVE = {
+    'AD': 'add', 'OBV': 'add', 'PVT': 'add', 'WAD': 'add',
+    'PVI': 'mul', 'NVI': 'mul',
+}
+
+_functions = {}
+
+
+@lru_cache(maxsize=None)
+def tech_plan(groups=None):
+    """
+    ((group, (func, ...)), ...) in TECH_GROUPS order, i.e. the column layout of tech_factor.
+    groups: tuple of TECH_GROUPS names, None for all
+    """
+    if groups is None:
+        groups = TECH_GROUPS
+    unknown = set(groups) - set(TECH_GROUPS)
+    if unknown:
+        raise Exception(f"tech groups {sorted(unknown)} undefined")
+
+    function_groups = talib.get_function_groups()
+    return tuple(
+        (group, tuple(func for func in function_groups[group] if func not in TECH_EXCLUDE))
+        for group in TECH_GROUPS if group in groups
+    )
+
+
+def tech_factor(price, groups=None, workers=None, pool=None):
+    """
+    tech indicators of an ohlcv frame, one column per indicator output.
+    with `workers` > 1 (or an executor as `pool`) indicator groups are computed in separate processes
+    """
+    plan = tech_plan(None if groups is None else tuple(groups))
+    if pool is None and (workers is None or workers <= 1):
+        return pd.concat([group_factor(price, funcs) for _, funcs in plan], axis=1)
+
+    if pool is None:
+        with ProcessPoolExecutor(workers) as pool:
+            return tech_factor(price, groups, pool=pool)
+    return collect_factor(submit_factor(pool, price, plan))
+
+
+def tech_owner(columns, groups=None):
+    """
+    indicator functions producing the given factor columns
+    """
+    funcs = [func for _, group in tech_plan(None if groups is None else tuple(groups)) for func in group]
+    return [func for func in funcs if any(col == func or col.startswith(func + '_') for col in columns)]
+
+
+def submit_factor(pool, price, plan):
+    return [pool.submit(group_factor, price, funcs) for _, funcs in plan]
+
+
+def collect_factor(futures):
+    return pd.concat([future.result() for future in futures], axis=1)
+
+
+def group_factor(price, funcs):
+    factor_results = []
+    for func in funcs:
+        factor = _function(func)(price)
+        if isinstance(factor, pd.Series):
+            factor.name = func
+        elif isinstance(factor, pd.DataFrame):
+            factor.columns = ['_'.join([func, col]) for col in factor.columns]
+        factor_results.append(factor)
+
+    return pd.concat(factor_results, axis=1)
+
+
+def _function(func):
+    # abstract.Function objects are built once per process and reused
+    if func not in _functions:
+        _functions[func] = abstract.Function(func)
+    return _functions[func]
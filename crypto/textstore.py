@@ -0,0 +1,282 @@
+import os
+import time
+from copy import copy
+
+import fastparquet
+import numpy as np
+import pandas as pd
+from fastparquet.writer import find_max_part, write_common_metadata
+
+from crypto.utils import text_path
+
+REDDIT_DATASETS = {'p': "reddit/posts.parquet", 'c': "reddit/comments.parquet"}  # as written by save_text
+ROW_GROUP = 100000  # rows per row group of a compacted partition
+POST_INDEX = "reddit/post_index.npz"
+ID_INDEX = {'p': "reddit/post_ids.npz", 'c': "reddit/comment_ids.npz"}
+EXPANDED_INDEX = "reddit/expanded_ids.npz"
+
+
+def reddit_dataset(text_type, root=None):
+    if text_type not in REDDIT_DATASETS:
+        raise Exception(f"text_type {text_type} not supported")
+    return os.path.join(root or text_path, REDDIT_DATASETS[text_type])
+
+
+def id_to_int(ids):
+    """
+    base36 reddit ids -> int64
+    """
+    return np.fromiter((int(i, 36) for i in ids), dtype=np.int64, count=len(ids))
+
+
+def int_to_id(numbers):
+    return [np.base_repr(n, 36).lower() for n in numbers]
+
+
+def compact_reddit(text_type, root=None, row_group=ROW_GROUP, force=False):
+    """
+    rewrite every date/subreddit partition made of more than one file (every partition with `force`) as
+    one file sorted by epoch, in row groups of `row_group` rows with min/max statistics on id and the
+    numeric columns. the new files get a fresh part number, so until the new _metadata is swapped in
+    (os.replace) readers keep seeing the old files, which are only deleted afterwards.
+    not to be run while RedditMaker appends to the same dataset.
+    return (partitions compacted, files before, files after)
+    """
+    path = reddit_dataset(text_type, root)
+    pf = fastparquet.ParquetFile(path)
+
+    partitions = {}
+    for rg in pf.row_groups:
+        file = rg.columns[0].file_path
+        partitions.setdefault(os.path.dirname(file), set()).add(file)
+    files_before = sum(len(files) for files in partitions.values())
+
+    part = find_max_part(pf.row_groups)
+    compacted = {}
+    for partition, files in sorted(partitions.items()):
+        if len(files) < 2 and not force:
+            continue
+        texts = pd.concat([fastparquet.ParquetFile(os.path.join(path, file)).to_pandas() for file in sorted(files)],
+                          ignore_index=True)
+        texts = texts.sort_values("epoch", kind="mergesort", ignore_index=True)
+
+        file = f"{partition}/part.{part}.parquet"
+        stats = [col for col in texts.columns if texts[col].dtype.kind in "iufb"] + ["id"]
+        fastparquet.write(os.path.join(path, file), texts, row_group_offsets=row_group, compression="snappy",
+                          write_index=False, stats=stats)
+        compacted[partition] = file
+
+    if not compacted:
+        return 0, files_before, files_before
+
+    row_groups = [rg for rg in pf.row_groups if os.path.dirname(rg.columns[0].file_path) not in compacted]
+    for partition, file in compacted.items():
+        new = fastparquet.ParquetFile(os.path.join(path, file))
+        if new.schema != pf.schema:
+            raise Exception(f"{file}: schema differs from the dataset")
+        for rg in new.row_groups:
+            for chunk in rg.columns:
+                chunk.file_path = file
+            row_groups.append(rg)
+
+    fmd = copy(pf.fmd)
+    fmd.row_groups = row_groups
+    fmd.num_rows = sum(rg.num_rows for rg in row_groups)
+    for name, no_row_groups in [("_common_metadata", True), ("_metadata", False)]:
+        write_common_metadata(os.path.join(path, name + ".tmp"), fmd, no_row_groups=no_row_groups)
+        os.replace(os.path.join(path, name + ".tmp"), os.path.join(path, name))
+
+    for partition in compacted:
+        for file in partitions[partition]:
+            os.remove(os.path.join(path, file))
+    return len(compacted), files_before, files_before - sum(len(partitions[p]) - 1 for p in compacted)
+
+
+def read_latency(text_type, root=None, repeat=3):
+    """
+    seconds (best of `repeat`) to open the dataset, read one day by partition filter and one day by an
+    epoch filter (row group statistics)
+    """
+    path = reddit_dataset(text_type, root)
+    pf = fastparquet.ParquetFile(path)
+    day = sorted(pf.cats["date"])[len(pf.cats["date"]) // 2]
+    start = int(pd.to_datetime(day).timestamp())
+
+    timings = {
+        "open": lambda: fastparquet.ParquetFile(path),
+        "date filter": lambda: fastparquet.ParquetFile(path).to_pandas(
+            columns=["id", "epoch"], filters=[("date", "==", day)]),
+        "epoch filter": lambda: fastparquet.ParquetFile(path).to_pandas(
+            columns=["id", "epoch"], filters=[("epoch", ">=", start), ("epoch", "<", start + 86400)]),
+    }
+    out = {}
+    for name, func in timings.items():
+        best = None
+        for _ in range(repeat):
+            t = time.perf_counter()
+            func()
+            seconds = time.perf_counter() - t
+            best = seconds if best is None else min(best, seconds)
+        out[name] = best
+    return out
+
+
+class FileIndex:
+    """
+    arrays derived from the files of one reddit dataset, kept in an npz next to it. `update` reads only the
+    files appended since the last update and starts over when a file went away or changed (compaction)
+    """
+    text_type = None
+    name = None  # npz under root
+    columns = []  # read from the new files
+    arrays = {}  # array name -> dtype
+
+    def __init__(self, root=None):
+        self.root = root or text_path
+        self.path = os.path.join(self.root, self.name)
+        self._reset()
+        if os.path.exists(self.path):
+            self._load()
+
+    def update(self):
+        """
+        index the dataset as it is on disk, return the number of rows added
+        """
+        dataset = reddit_dataset(self.text_type, self.root)
+        if not os.path.exists(dataset):
+            return 0
+        files = {}
+        for rg in fastparquet.ParquetFile(dataset).row_groups:
+            files[rg.columns[0].file_path] = files.get(rg.columns[0].file_path, 0) + rg.num_rows
+        if any(files.get(file) != rows for file, rows in self.files.items()):
+            self._reset()
+
+        new = sorted(set(files) - set(self.files))
+        if not new:
+            return 0
+        texts = fastparquet.ParquetFile([os.path.join(dataset, file) for file in new], root=dataset).to_pandas(
+            columns=self.columns)
+        self._add(texts)
+        self.files.update((file, files[file]) for file in new)
+        self._save()
+        return len(texts)
+
+    def _add(self, texts):
+        raise NotImplementedError
+
+    def _reset(self):
+        self.files = {}  # dataset file -> rows indexed
+        for name, dtype in self.arrays.items():
+            setattr(self, name, np.empty(0, dtype=dtype))
+
+    def _load(self):
+        with np.load(self.path) as npz:
+            self.files = dict(zip(npz["files"].tolist(), npz["rows"].tolist()))
+            for name in self.arrays:
+                setattr(self, name, npz[name])
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", 'wb') as f:
+            np.savez(f, files=np.array(list(self.files), dtype=str), rows=np.array(list(self.files.values())),
+                     **{name: getattr(self, name) for name in self.arrays})
+        os.replace(self.path + ".tmp", self.path)
+
+
+class PostIndex(FileIndex):
+    """
+    (id, date, subreddit, num_comments) of every stored post: ids as int64, dates as days since epoch,
+    subreddits as codes into `subreddits`
+    """
+    text_type = 'p'
+    name = POST_INDEX
+    columns = ["id", "num_comments", "date", "subreddit"]
+    arrays = {"subreddits": str, "id": np.int64, "day": np.int32, "subreddit": np.int32, "num_comments": np.int64}
+
+    def _add(self, posts):
+        names = posts.subreddit.astype(str)
+        self.subreddits = np.r_[self.subreddits, np.array(sorted(set(names) - set(self.subreddits)), dtype=str)]
+        day = pd.to_datetime(posts.date.astype(str)).values.astype("datetime64[D]").astype(np.int32)
+        self.id = np.r_[self.id, id_to_int(posts.id.values)]
+        self.day = np.r_[self.day, day]
+        self.subreddit = np.r_[self.subreddit, pd.Index(self.subreddits).get_indexer(names).astype(np.int32)]
+        self.num_comments = np.r_[self.num_comments, posts.num_comments.values.astype(np.int64)]
+
+    def top(self, subreddits, start, end, quantile=0.9):
+        """
+        {day (days since epoch): (ids, num_comments)} for start <= day <= end: per day & subreddit the posts with
+        more comments than the `quantile` of the commented ones, in `subreddits` order
+        """
+        codes = pd.Index(self.subreddits).get_indexer(subreddits)
+        rank = np.full(len(self.subreddits) + 1, -1)
+        rank[codes] = np.arange(len(subreddits))  # codes of unknown subreddits (-1) land on the spare slot
+        rank[-1] = -1
+
+        keep = (self.day >= start) & (self.day <= end) & (rank[self.subreddit] >= 0) & (self.num_comments != 0)
+        posts = pd.DataFrame({"day": self.day[keep], "rank": rank[self.subreddit[keep]],
+                              "num_comments": self.num_comments[keep], "id": self.id[keep]})
+        cutoff = posts.groupby(["day", "rank"]).num_comments.transform("quantile", quantile)
+        posts = posts[posts.num_comments > cutoff].sort_values(["day", "rank"], kind="mergesort")
+
+        return {day: (int_to_id(group.id.values), int(group.num_comments.sum()))
+                for day, group in posts.groupby("day", sort=True)}
+
+
+class IdIndex(FileIndex):
+    """
+    sorted unique int64 ids of every stored post / comment, so saves can skip what is on disk already
+    """
+    columns = ["id"]
+    arrays = {"id": np.int64}
+
+    def __init__(self, text_type, root=None):
+        if text_type not in ID_INDEX:
+            raise Exception(f"text_type {text_type} not supported")
+        self.text_type = text_type
+        self.name = ID_INDEX[text_type]
+        super().__init__(root)
+
+    def contains(self, ids):
+        """
+        bool mask: ids (base36) stored before
+        """
+        return isin_sorted(id_to_int(ids), self.id)
+
+    def _add(self, texts):
+        self.id = np.union1d(self.id, id_to_int(texts.id.values))
+
+
+class ExpandedIndex:
+    """
+    sorted int64 ids of the posts whose whole comment trees were fetched & saved (RedditMaker.search_comment_by_post
+    / _r), in an npz under root. comments of a post saved any other way (subreddit windows) do not count
+    """
+
+    def __init__(self, root=None):
+        self.path = os.path.join(root or text_path, EXPANDED_INDEX)
+        self.id = np.empty(0, dtype=np.int64)
+        if os.path.exists(self.path):
+            with np.load(self.path) as npz:
+                self.id = npz["id"]
+
+    def contains(self, post_ids):
+        """
+        bool mask: posts (base36 ids) expanded before
+        """
+        return isin_sorted(id_to_int(post_ids), self.id)
+
+    def add(self, post_ids):
+        self.id = np.union1d(self.id, id_to_int(post_ids))
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", 'wb') as f:
+            np.savez(f, id=self.id)
+        os.replace(self.path + ".tmp", self.path)
+
+
+def isin_sorted(values, sorted_values):
+    """
+    np.isin for a sorted `sorted_values`, by binary search
+    """
+    pos = np.searchsorted(sorted_values, values)
+    pos[pos == len(sorted_values)] = 0
+    return (sorted_values[pos] == values) if len(sorted_values) else np.zeros(len(values), dtype=bool)
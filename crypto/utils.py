@@ -1,4 +1,7 @@
 price_path = "./data/price/"
+price_store = "h5"  # "h5" / "parquet", see crypto/store.py
+tech_cache_path = "./data/price/tech_cache/"  # see crypto/cache.py
+tech_cache_size = 2 * 1024 ** 3  # bytes, least recently used frames are evicted beyond
 text_path = "./data/text/"
 universe_path = "./data/universe.json"
 universe_size = 50
@@ -11,14 +14,16 @@ price_config = {
         "interval": "8H",
         "interval_1": "7H59min",
         "rate_limit": 10,
-        "chunk_size": 4
+        "chunk_size": 4,
+        "host": "https://api.binance.com"
     },
     "CB": {
         "columns": ["epoch", "high", "low", "open", "close", "volume"],
         "interval": "4H",
         "interval_1": "3H59min",
         "rate_limit": 10,
-        "chunk_size": 6
+        "chunk_size": 6,
+        "host": "https://api.pro.coinbase.com"
     }}
 
 reddit_auth_path = "./crypto/redd_auth.json"
@@ -0,0 +1,135 @@
+import os
+import glob
+import json
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+from crypto.textstore import id_to_int, isin_sorted
+from model.sentiment import REDDIT_PATH, REDDIT_TEXT
+
+RESOLUTION = "5min"  # text bucket width, the finest bars sentiment can be joined onto
+SENTIMENT_SUMS = ["count", "polarity", "subjectivity", "weight", "weighted"]
+
+
+class SentimentBars:
+    """
+    scored texts of one reddit dataset (stream_reddit_sentiment output) summed per `resolution` bucket.
+    a text at epoch t is summed into the bucket closing at the first multiple of `resolution` after t: bars
+    only see it from that close on, so no bar sees a text written after its own close.
+    kept in {root}/sentiment/bars/{dataset}-{resolution}.npz with the ids summed so far, so `update` only
+    reads sentiment partitions rewritten since and only adds texts it has not seen
+    """
+
+    def __init__(self, text_type, root=REDDIT_PATH, resolution=RESOLUTION):
+        if text_type not in REDDIT_TEXT:
+            raise Exception(f"text_type {text_type} not supported")
+        self.dataset = REDDIT_TEXT[text_type][0]
+        self.source = os.path.join(root, f"sentiment/{self.dataset}.parquet")
+        self.step = int(pd.to_timedelta(resolution).total_seconds())
+        self.path = os.path.join(root, f"sentiment/bars/{self.dataset}-{resolution}.npz")
+
+        self.files = {}  # sentiment partition -> [size, mtime_ns] summed
+        self.ids = np.empty(0, dtype=np.int64)
+        self.bucket = np.empty(0, dtype=np.int64)  # bucket close (epoch), sorted
+        self.sums = {name: np.empty(0) for name in SENTIMENT_SUMS}
+        if os.path.exists(self.path):
+            self._load()
+
+    def update(self):
+        """
+        sum the texts of new & rewritten sentiment partitions, return the number of texts added
+        """
+        texts = []
+        for file in sorted(glob.glob(os.path.join(self.source, "date=*", "subreddit=*", "*.parquet"))):
+            name = os.path.relpath(file, self.source)
+            stat = os.stat(file)
+            if self.files.get(name) == [stat.st_size, stat.st_mtime_ns]:
+                continue
+            texts.append(pd.read_parquet(file, columns=["id", "epoch", "score", "polarity", "subjectivity"]))
+            self.files[name] = [stat.st_size, stat.st_mtime_ns]
+        if not texts:
+            return 0
+
+        texts = pd.concat(texts, ignore_index=True).drop_duplicates("id")
+        ids = id_to_int(texts.id.values)
+        new = ~isin_sorted(ids, self.ids)
+        texts = texts[new]
+        self.ids = np.union1d(self.ids, ids[new])
+
+        weight = 1 + np.log1p(texts.score.clip(lower=0).values)  # reddit score, damped
+        bucket = np.r_[self.bucket, (texts.epoch.values // self.step + 1) * self.step]
+        values = {
+            "count": np.ones(len(texts)),
+            "polarity": texts.polarity.values,
+            "subjectivity": texts.subjectivity.values,
+            "weight": weight,
+            "weighted": weight * texts.polarity.values,
+        }
+        self.bucket, inverse = np.unique(bucket, return_inverse=True)
+        for name in SENTIMENT_SUMS:
+            self.sums[name] = np.bincount(inverse, np.r_[self.sums[name], values[name]], len(self.bucket))
+
+        self._save()
+        return len(texts)
+
+    def join(self, price, halflife="6H", prefix=None):
+        """
+        price (e.g. get_clean_price, bars labelled by their close) with the texts of every bar: those that became
+        visible after the previous bar close and no later than this one. columns {prefix}_
+        count / polarity (mean) / polarity_weighted (score-weighted mean) / subjectivity (mean) /
+        polarity_decay (mean of every text visible so far, weights halving every `halflife` since the text
+        became visible). bars must lie on one regular grid (gaps allowed); the decay of a bar does not depend
+        on how far back `price` starts, so new bars can be joined on their own
+        """
+        prefix = prefix or self.dataset
+        closes = price.index.values.astype("datetime64[s]").astype(np.int64)
+        step = np.diff(closes).min() if len(closes) > 1 else self.step
+        if ((closes - closes[0]) % step != 0).any():
+            raise Exception("price bars are not on a regular grid")
+        grid = (closes - closes[0]) // step  # bar positions on the grid from the first bar
+        cells = grid[-1] + 1
+
+        visible = self.bucket <= closes[-1]
+        bucket = self.bucket[visible]
+        sums = {name: values[visible] for name, values in self.sums.items()}
+        cell = np.clip(-(-(bucket - closes[0]) // step), 0, None)  # first grid close at or after the bucket close
+
+        # window sums: buckets closing in (previous bar close, bar close]
+        recent = bucket > closes[0] - step
+        windows = {}
+        for name in SENTIMENT_SUMS:
+            total = np.cumsum(np.bincount(cell[recent], sums[name][recent], cells))[grid]
+            windows[name] = np.diff(np.r_[0, total])
+
+        # decayed sums over every visible bucket, first-order recursion along the grid
+        decay = np.log(2) / pd.to_timedelta(halflife).total_seconds()
+        age = closes[0] + cell * step - bucket
+        decayed = {}
+        for name in ["count", "polarity"]:
+            cell_sums = np.bincount(cell, sums[name] * np.exp(-decay * age), cells)
+            decayed[name] = lfilter([1.0], [1.0, -np.exp(-decay * step)], cell_sums)[grid]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            features = pd.DataFrame({
+                f"{prefix}_count": windows["count"].astype(np.int64),
+                f"{prefix}_polarity": windows["polarity"] / windows["count"],
+                f"{prefix}_polarity_weighted": windows["weighted"] / windows["weight"],
+                f"{prefix}_subjectivity": windows["subjectivity"] / windows["count"],
+                f"{prefix}_polarity_decay": decayed["polarity"] / decayed["count"],
+            }, index=price.index)
+        return price.join(features)
+
+    def _load(self):
+        with np.load(self.path) as npz:
+            self.files = json.loads(str(npz["files"]))
+            self.ids = npz["ids"]
+            self.bucket = npz["bucket"]
+            self.sums = {name: npz[name] for name in SENTIMENT_SUMS}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", 'wb') as f:
+            np.savez(f, files=np.array(json.dumps(self.files)), ids=self.ids, bucket=self.bucket, **self.sums)
+        os.replace(self.path + ".tmp", self.path)
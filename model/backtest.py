@@ -0,0 +1,269 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+FEE = 0.001  # per unit of capital traded
+SLIPPAGE = 0.0005  # per unit of capital traded, on top of the fee
+CHUNK_BYTES = 2 ** 28  # size of the (position, bar, ticker) blocks a run works through
+YEAR_S = 365 * 86400
+GRID_DEFAULTS = {"signal": 0, "entry": 0.0, "exit": 0.0, "long_only": False, "lag": 0, "fee": FEE,
+                 "slippage": SLIPPAGE}
+
+
+def param_grid(**axes):
+    """
+    cartesian product of the axes, {name: (combinations,) array}
+        param_grid(entry=[0.001, 0.002], lag=[0, 1])
+    """
+    names = list(axes)
+    combinations = list(itertools.product(*[np.atleast_1d(axes[name]) for name in names]))
+    return {name: np.array([c[i] for c in combinations]) for i, name in enumerate(names)}
+
+
+def walk_forward(epoch, train, test, expanding=False):
+    """
+    [(train_start, train_end, test_start, test_end)] rows (ends exclusive) of consecutive `test` long folds,
+    each trained on the `train` before it (everything before it if expanding). train & test are durations
+    ("365D") or seconds
+    """
+    epoch = np.asarray(epoch)
+    train, test = _seconds(train), _seconds(test)
+    folds = []
+    t = epoch[0] + train
+    while t <= epoch[-1]:
+        test_start, test_end = np.searchsorted(epoch, [t, t + test])
+        train_start = 0 if expanding else np.searchsorted(epoch, t - train)
+        if test_end > test_start:
+            folds.append((int(train_start), int(test_start), int(test_start), int(test_end)))
+        t += test
+    return folds
+
+
+def walk_forward_signal(folds, fit_predict, shape):
+    """
+    one (bar, ticker) signal stitched from models retrained per fold: fit_predict(fold) fits on the fold's train
+    rows and returns the signal of its test rows; rows of no test fold are NaN (no position taken)
+    """
+    signal = np.full(shape, np.nan, dtype=np.float32)
+    for fold in folds:
+        signal[fold[2]:fold[3]] = fit_predict(fold)
+    return signal
+
+
+class Backtest:
+    """
+    signals -> positions -> portfolio returns for every combination of a parameter grid, over (bar, ticker)
+    closes. per combination:
+        signal      which signal of a (signals, bar, ticker) array
+        entry       long above entry, short below -entry (flat instead with long_only)
+        exit        flat once |signal| < exit, otherwise the position is held (exit <= entry)
+        lag         bars between a signal and its trade
+        fee, slippage   charged on every unit of capital traded
+    positions are taken at a bar close and earn the next bar's return; a ticker's position only changes on bars
+    it has, NaN signals change nothing. capital is split evenly over the tickers, what is not in a position is
+    cash. positions are worked out once per (signal, entry, exit, long_only, lag), fees per combination, in
+    blocks of bars small enough for CHUNK_BYTES, so closes & signals can be memmaps
+    """
+
+    def __init__(self, epoch, close, mask=None, chunk_bytes=CHUNK_BYTES):
+        self.epoch = np.asarray(epoch)
+        self.close = close
+        self.mask = mask
+        self.chunk_bytes = chunk_bytes
+        step = np.diff(self.epoch).min() if len(self.epoch) > 1 else 60
+        self.periods_per_year = YEAR_S / step
+
+    @classmethod
+    def from_panel(cls, panel, start=None, end=None, tickers=None, freq=None, chunk_bytes=CHUNK_BYTES):
+        """
+        closes of a crypto.panel.PricePanel, on its minute grid (views on the memmap) or on `freq` bars: (t - freq, t]
+        labelled by their close t, the bins of crypto.pyramid.resample_bars / get_clean_price, so signals made from
+        those line up (last close of each bar, carried over bars without one)
+        """
+        epoch, values, mask = panel.slice(start, end, tickers, ["close"])
+        close = values[:, :, 0]
+        if freq is None or len(epoch) == 0:
+            return cls(epoch, close, mask, chunk_bytes)
+
+        step = int(pd.to_timedelta(freq).total_seconds())
+        labels = np.arange(-(-epoch[0] // step) * step, -(-epoch[-1] // step) * step + 1, step)
+        ends = np.minimum((labels - epoch[0]) // 60, len(epoch) - 1)  # last grid row of each bar
+        bars = np.empty((len(labels), close.shape[1]))
+        last = np.full(close.shape[1], np.nan)
+        block = 10000 * max(1, step // 60)
+        for lo in range(0, len(epoch), block):
+            rows = _ffill(np.asarray(close[lo:lo + block], dtype=np.float64), last)
+            last = rows[-1]
+            a, b = np.searchsorted(ends, [lo, lo + len(rows)])
+            bars[a:b] = rows[ends[a:b] - lo]
+        return cls(labels, bars, ~np.isnan(bars), chunk_bytes)
+
+    def run(self, signal, grid=None, folds=None):
+        """
+        signal (bar, ticker) or (signals, bar, ticker), aligned with the closes; grid from param_grid (missing
+        names take GRID_DEFAULTS). per combination, bar statistics are kept per segment between the fold edges
+        """
+        n_bars, n_tickers = self.close.shape
+        if signal.ndim == 2:
+            signal = signal[None]
+        if signal.shape[1:] != (n_bars, n_tickers):
+            raise Exception(f"signal {signal.shape[1:]} not aligned with the closes {(n_bars, n_tickers)}")
+
+        grid = dict(grid or {})
+        size = max([len(values) for values in grid.values()], default=1)
+        unknown = set(grid) - set(GRID_DEFAULTS)
+        if unknown:
+            raise Exception(f"grid parameters {sorted(unknown)} undefined")
+        params = {name: np.asarray(grid[name]) if name in grid else np.full(size, default)
+                  for name, default in GRID_DEFAULTS.items()}
+        if (params["exit"] > params["entry"]).any():
+            raise Exception("exit above entry")
+
+        # positions per unique rule, pnl per combination
+        rules = pd.DataFrame({name: params[name] for name in ["signal", "entry", "exit", "long_only"]})
+        rule_keys = rules.drop_duplicates().reset_index(drop=True)
+        rule = rules.merge(rule_keys.reset_index(), how="left").loc[:, "index"].values
+        holds = pd.DataFrame({"rule": rule, "lag": params["lag"]})
+        hold_keys = holds.drop_duplicates().reset_index(drop=True)
+        hold = holds.merge(hold_keys.reset_index(), how="left").loc[:, "index"].values
+        hold_rule, hold_lag = hold_keys.rule.values, hold_keys.lag.values
+        cost = (params["fee"] + params["slippage"])[:, None]
+
+        entry = rule_keys.entry.values[:, None, None]
+        exit_ = rule_keys.exit.values[:, None, None]
+        short = np.where(rule_keys.long_only.values, 0.0, -1.0)[:, None, None]
+        lags = int(hold_lag.max())
+
+        bounds = np.unique(np.r_[0, n_bars, [row for fold in folds or [] for row in fold]].astype(np.int64))
+        stats = {name: np.zeros((size, len(bounds) - 1)) for name in ["bars", "sum", "squares", "log", "turnover"]}
+        last_close = np.full(n_tickers, np.nan)
+        state = np.zeros((len(rule_keys), lags + 1, n_tickers))  # the last lags + 1 rule states
+        position = np.zeros((len(hold_keys), n_tickers))
+        equity = np.zeros(size)  # log
+        peak = np.zeros(size)
+        drawdown = np.zeros(size)
+
+        rows = max(1, self.chunk_bytes // (8 * 3 * ((len(rule_keys) + len(hold_keys)) * n_tickers + size)))
+        for a in range(0, n_bars, rows):
+            b = min(a + rows, n_bars)
+            close = np.array(self.close[a:b], dtype=np.float64)
+            bar = ~np.isnan(close) if self.mask is None else np.asarray(self.mask[a:b])
+            close[~bar] = np.nan
+            close = _ffill(close, last_close)
+            returns = np.nan_to_num(close / np.vstack([last_close, close[:-1]]) - 1)
+            last_close = close[-1]
+
+            s = np.asarray(signal[rule_keys.signal.values, a:b], dtype=np.float64)
+            new = np.where(s > entry, 1.0, np.where(s < -entry, short, np.where(np.abs(s) < exit_, 0.0, np.nan)))
+            new[:, ~bar] = np.nan
+            states = np.concatenate([state, _ffill(new, state[:, -1])], axis=1)
+            state = states[:, -(lags + 1):]
+
+            at = (lags - hold_lag)[:, None] + np.arange(1, b - a + 1)
+            held = states[hold_rule[:, None], at]
+            before = np.concatenate([position[:, None], held[:, :-1]], axis=1)
+            position = held[:, -1]
+            gross = np.einsum("qtn,tn->qt", before, returns) / n_tickers
+            turnover = np.abs(held - before).sum(axis=2) / n_tickers
+
+            pnl = gross[hold] - turnover[hold] * cost
+            log = np.log1p(pnl)
+            curve = equity[:, None] + np.cumsum(log, axis=1)
+            peaks = np.maximum(peak[:, None], np.maximum.accumulate(curve, axis=1))
+            drawdown = np.minimum(drawdown, (curve - peaks).min(axis=1))
+            equity, peak = curve[:, -1], peaks[:, -1]
+
+            cuts = bounds[(bounds > a) & (bounds < b)] - a
+            starts = np.r_[0, cuts]
+            segments = np.searchsorted(bounds, a, side='right') - 1 + np.arange(len(starts))
+            # pnl = gross - cost * turnover: its sums follow from sums per held position
+            sums = {name: np.add.reduceat(values, starts, axis=1)[hold] for name, values in
+                    [("gross", gross), ("turnover", turnover), ("gross2", gross ** 2),
+                     ("cross", gross * turnover), ("turnover2", turnover ** 2)]}
+            stats["bars"][:, segments] += np.diff(np.r_[starts, b - a])
+            stats["sum"][:, segments] += sums["gross"] - cost * sums["turnover"]
+            stats["squares"][:, segments] += sums["gross2"] - 2 * cost * sums["cross"] + cost ** 2 * sums["turnover2"]
+            stats["log"][:, segments] += np.add.reduceat(log, starts, axis=1)
+            stats["turnover"][:, segments] += sums["turnover"]
+
+        return BacktestResult(self.epoch, params, bounds, stats, np.expm1(drawdown), self.periods_per_year)
+
+
+class BacktestResult:
+    """
+    per combination bar statistics of pnl per segment (between the fold edges) and the max drawdown of the whole run
+    """
+
+    def __init__(self, epoch, params, bounds, stats, drawdown, periods_per_year):
+        self.epoch = epoch
+        self.params = params
+        self.bounds = bounds
+        self.stats = stats
+        self.drawdown = drawdown
+        self.periods_per_year = periods_per_year
+
+    def summary(self, start=0, end=None):
+        """
+        DataFrame of the parameters and total_return / annual_return / sharpe / turnover (per year) of every
+        combination over rows start .. end, which have to be fold edges; max_drawdown is the whole run's
+        """
+        frame = pd.DataFrame(self.params)
+        frame = frame.join(self._metrics(self._segments(start, end)))
+        if start == 0 and end in [None, self.bounds[-1]]:
+            frame["max_drawdown"] = self.drawdown
+        return frame
+
+    def walk_forward(self, folds, metric="sharpe"):
+        """
+        out of sample run: per fold the combination with the best `metric` over the train rows, scored over the
+        test rows. DataFrame per fold: test start, chosen combination, its train & test metrics
+        """
+        out = []
+        for train_start, train_end, test_start, test_end in folds:
+            train = self._metrics(self._segments(train_start, train_end))
+            best = int(np.nanargmax(train[metric].values))
+            test = self._metrics(self._segments(test_start, test_end)).iloc[best]
+            row = {"test_start": pd.to_datetime(self.epoch[test_start], unit='s'), "combination": best}
+            row.update({name: values[best] for name, values in self.params.items()})
+            row.update({f"train_{name}": value for name, value in train.iloc[best].items()})
+            row.update({f"test_{name}": value for name, value in test.items()})
+            out.append(row)
+        return pd.DataFrame(out)
+
+    def _segments(self, start, end):
+        end = self.bounds[-1] if end is None else end
+        lo, hi = np.searchsorted(self.bounds, [start, end])
+        if self.bounds[lo] != start or self.bounds[hi] != end:
+            raise Exception(f"rows {start} .. {end} are not on fold edges")
+        return {name: values[:, lo:hi].sum(axis=1) for name, values in self.stats.items()}
+
+    def _metrics(self, stats):
+        bars = np.maximum(stats["bars"], 1)
+        mean = stats["sum"] / bars
+        std = np.sqrt(np.maximum(stats["squares"] / bars - mean ** 2, 0))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sharpe = mean / std * np.sqrt(self.periods_per_year)
+        years = bars / self.periods_per_year
+        return pd.DataFrame({
+            "total_return": np.expm1(stats["log"]),
+            "annual_return": np.expm1(stats["log"] / years),
+            "sharpe": np.where(std > 0, sharpe, np.nan),
+            "turnover": stats["turnover"] / years,
+        })
+
+
+def _ffill(values, first):
+    """
+    NaNs along axis -2 take the last value before them, `first` (..., columns) before the first row
+    """
+    values = np.concatenate([first[..., None, :], values], axis=-2)
+    index = np.where(np.isnan(values), 0, np.arange(values.shape[-2])[:, None])
+    np.maximum.accumulate(index, axis=-2, out=index)
+    return np.take_along_axis(values, index, axis=-2)[..., 1:, :]
+
+
+def _seconds(duration):
+    if isinstance(duration, (int, float, np.integer)):
+        return duration
+    return int(pd.to_timedelta(duration).total_seconds())
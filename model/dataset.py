@@ -0,0 +1,302 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from crypto.PriceMaker import _price_tech_path
+from crypto.utils import price_path
+
+FEATURE_ROOT = os.path.join(price_path, "price_clean/memmap/")
+ROBUST_SAMPLE = 100000  # rows per ticker the robust scaler takes its quantiles from
+
+
+class FeatureFile:
+    """
+    one price_clean/{ticker}-{freq}.h5 frame (make_price_tech) as {root}/{ticker}-{freq}/
+        values.f32  float32 memmap (bar, column)
+        epoch.i64   int64 memmap, epoch seconds of the bar labels
+        meta.json   rows and columns
+    `update` rewrites the last bar (update_price_tech replaces it, it may have been partial), appends the bars
+    the h5 gained after it and rebuilds when earlier bars or the columns changed. meta.json is replaced last
+    """
+
+    def __init__(self, ticker, freq, root=None):
+        self.ticker = ticker
+        self.freq = freq or '1min'
+        self.root = os.path.join(root or FEATURE_ROOT, f"{ticker}-{self.freq}")
+        self.meta = self._load_meta()
+
+    @property
+    def rows(self):
+        return self.meta["rows"] if self.meta else 0
+
+    @property
+    def columns(self):
+        return self.meta["columns"] if self.meta else []
+
+    def values(self, mode='r'):
+        return np.memmap(self._path("values.f32"), dtype=np.float32, mode=mode,
+                         shape=(self.rows, len(self.columns)))
+
+    def epoch(self, mode='r'):
+        return np.memmap(self._path("epoch.i64"), dtype=np.int64, mode=mode, shape=(self.rows,))
+
+    def update(self):
+        """
+        bring the memmaps up to date with the h5, return the number of bars written (the last one again included)
+        """
+        path, key = _price_tech_path(self.ticker, self.freq)
+        with pd.HDFStore(path, mode='r') as hdf:
+            index = hdf.select_column(key, 'index').values.astype("datetime64[s]").astype(np.int64)
+            columns = [str(col) for col in hdf.select(key, stop=0).columns]
+            old = self.rows
+            if self.meta is None or self.meta["columns"] != columns or len(index) < old or \
+                    not np.array_equal(self.epoch()[:], index[:old]):
+                old = 0
+                self.meta = {"rows": 0, "columns": columns}
+                os.makedirs(self.root, exist_ok=True)
+                for name in ["values.f32", "epoch.i64"]:
+                    open(self._path(name), 'wb').close()
+            if len(index) == 0:
+                return 0
+            old = max(old - 1, 0)
+            frame = hdf.select(key, start=old)
+
+        with open(self._path("values.f32"), 'r+b') as f:
+            f.truncate(len(index) * len(columns) * 4)
+        with open(self._path("epoch.i64"), 'r+b') as f:
+            f.truncate(len(index) * 8)
+        self.meta["rows"] = len(index)
+        values, epoch = self.values('r+'), self.epoch('r+')
+        values[old:] = frame.values.astype(np.float32)
+        epoch[old:] = index[old:]
+        values.flush()
+        epoch.flush()
+        self._save_meta()
+        return len(index) - old
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _load_meta(self):
+        if not os.path.exists(self._path("meta.json")):
+            return None
+        with open(self._path("meta.json"), 'r') as f:
+            return json.load(f)
+
+    def _save_meta(self):
+        with open(self._path("meta.json.tmp"), 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(self._path("meta.json.tmp"), self._path("meta.json"))
+
+
+class Scaler:
+    """
+    per column (and per ticker) centre & scale, fitted on the rows a dataset's samples read and applied to
+    one gathered batch at a time: "standard" mean / std, "minmax", "maxabs", "robust" median / IQR
+    (from at most ROBUST_SAMPLE evenly spaced rows per ticker)
+    """
+    KINDS = ["standard", "minmax", "maxabs", "robust"]
+
+    def __init__(self, kind="standard", per_ticker=True, chunk=100000):
+        if kind not in self.KINDS:
+            raise Exception(f"scaler {kind} undefined")
+        self.kind = kind
+        self.per_ticker = per_ticker
+        self.chunk = chunk
+        self.center = None  # (tickers, columns)
+        self.scale = None
+
+    def fit(self, dataset):
+        stats = []
+        for k, values in enumerate(dataset.values):
+            ends = dataset.end[dataset.ticker == k]
+            stats.append(self._stats(values[:ends.max() + 1] if len(ends) else values[:0]))
+        if not self.per_ticker:  # every ticker's rows pooled
+            stats = [self._pool(stats)] * len(stats)
+
+        params = [self._params(stat) for stat in stats]
+        center = np.array([c for c, _ in params])
+        scale = np.array([s for _, s in params])
+        scale[~(scale > 0)] = 1.0
+        self.center, self.scale = center.astype(np.float32), scale.astype(np.float32)
+        return self
+
+    def transform(self, x, ticker, columns=None):
+        """
+        x (batch, ..., columns) of the samples' tickers; `columns` picks the parameters of a column subset
+        """
+        center, scale = self.center[ticker], self.scale[ticker]
+        if columns is not None:
+            center, scale = center[:, columns], scale[:, columns]
+        shape = (len(ticker),) + (1,) * (x.ndim - 2) + (center.shape[1],)
+        return (x - center.reshape(shape)) / scale.reshape(shape)
+
+    def _stats(self, rows):
+        width = rows.shape[1]
+        if self.kind == "robust":
+            return {"sample": np.asarray(rows[::max(1, len(rows) // ROBUST_SAMPLE)], dtype=np.float64)}
+        stat = {"n": 0, "sum": np.zeros(width), "squares": np.zeros(width),
+                "low": np.full(width, np.inf), "high": np.full(width, -np.inf)}
+        for i in range(0, len(rows), self.chunk):
+            block = np.asarray(rows[i:i + self.chunk], dtype=np.float64)
+            stat["n"] += len(block)
+            stat["sum"] += block.sum(axis=0)
+            stat["squares"] += (block ** 2).sum(axis=0)
+            stat["low"] = np.minimum(stat["low"], block.min(axis=0))
+            stat["high"] = np.maximum(stat["high"], block.max(axis=0))
+        return stat
+
+    def _pool(self, stats):
+        if self.kind == "robust":
+            return {"sample": np.concatenate([stat["sample"] for stat in stats])}
+        return {"n": sum(stat["n"] for stat in stats), "sum": sum(stat["sum"] for stat in stats),
+                "squares": sum(stat["squares"] for stat in stats),
+                "low": np.min([stat["low"] for stat in stats], axis=0),
+                "high": np.max([stat["high"] for stat in stats], axis=0)}
+
+    def _params(self, stat):
+        if self.kind == "robust":
+            if len(stat["sample"]) == 0:
+                return np.zeros(stat["sample"].shape[1]), np.ones(stat["sample"].shape[1])
+            q25, q50, q75 = np.nanpercentile(stat["sample"], [25, 50, 75], axis=0)
+            return q50, q75 - q25
+        if stat["n"] == 0:
+            return np.zeros_like(stat["sum"]), np.ones_like(stat["sum"])
+        if self.kind == "standard":
+            mean = stat["sum"] / stat["n"]
+            return mean, np.sqrt(np.maximum(stat["squares"] / stat["n"] - mean ** 2, 0))
+        if self.kind == "minmax":
+            return stat["low"], stat["high"] - stat["low"]
+        return np.zeros_like(stat["sum"]), np.maximum(np.abs(stat["low"]), np.abs(stat["high"]))
+
+
+class WindowDataset:
+    """
+    (lookback window, horizon target) samples over the FeatureFile memmaps of several tickers.
+    a sample is (ticker, end row): its window is a strided view of rows end-lookback+1 .. end, nothing is
+    copied before `batch` gathers a batch (batch, lookback, features), which is where the scaler is applied.
+    target: `target` column `horizon` bars after the window, as a return over the window's last bar
+    (target_kind "return") or as the (scaled) value ("value").
+    FeatureFile(...).update() has to have run for every ticker
+    """
+
+    def __init__(self, tickers, freq, lookback, horizon=1, features=None, target="close", target_kind="return",
+                 scaler=None, root=None):
+        files = [FeatureFile(ticker, freq, root) for ticker in tickers]
+        missing = [file.ticker for file in files if file.meta is None]
+        if missing:
+            raise Exception(f"features of {missing} not built")
+        names = files[0].columns
+        if any(file.columns != names for file in files):
+            raise Exception("tickers have different feature columns")
+        if target_kind not in ["return", "value"]:
+            raise Exception(f"target_kind {target_kind} undefined")
+
+        self.tickers = list(tickers)
+        self.lookback = lookback
+        self.horizon = horizon
+        self.features = list(features or names)
+        self.columns = np.array([names.index(name) for name in self.features])
+        self.target = names.index(target)
+        self.target_kind = target_kind
+        self.scaler = scaler
+        self.epochs = [file.epoch() for file in files]
+        self.values = [file.values() for file in files]
+        self.windows = [sliding_window_view(values, (lookback, len(names)))[:, 0] if len(values) >= lookback
+                        else np.empty((0, lookback, len(names)), dtype=np.float32) for values in self.values]
+
+        ticker, end = [], []
+        for k, values in enumerate(self.values):
+            rows = np.arange(lookback - 1, len(values) - horizon, dtype=np.int64)
+            ticker.append(np.full(len(rows), k, dtype=np.int32))
+            end.append(rows)
+        self.ticker = np.concatenate(ticker) if ticker else np.empty(0, dtype=np.int32)
+        self.end = np.concatenate(end) if end else np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.end)
+
+    def __getitem__(self, i):
+        x, y = self.batch(np.array([i]))
+        return x[0], y[0]
+
+    def window(self, i):
+        """
+        unscaled (lookback, all columns) view of sample i on the memmap
+        """
+        return self.windows[self.ticker[i]][self.end[i] - self.lookback + 1]
+
+    def batch(self, index):
+        """
+        (x (batch, lookback, features), y (batch,)) float32 of the samples in `index`
+        """
+        index = np.asarray(index)
+        ticker, end = self.ticker[index], self.end[index]
+        x = np.empty((len(index), self.lookback, len(self.features)), dtype=np.float32)
+        y = np.empty(len(index), dtype=np.float32)
+        for k in np.unique(ticker):
+            at = np.flatnonzero(ticker == k)
+            x[at] = self.windows[k][end[at] - self.lookback + 1][:, :, self.columns]
+            last = self.values[k][end[at], self.target]
+            ahead = self.values[k][end[at] + self.horizon, self.target]
+            y[at] = ahead / last - 1 if self.target_kind == "return" else ahead
+
+        if self.scaler is not None:
+            x = self.scaler.transform(x, ticker, self.columns)
+            if self.target_kind == "value":
+                y = self.scaler.transform(y[:, None], ticker, [self.target])[:, 0]
+        return x, y
+
+    def batches(self, batch_size=64, shuffle=False, seed=None, drop_last=True, balance=False):
+        """
+        batches over the samples once, in time order per ticker or shuffled. balance: draw samples with
+        every ticker equally likely whatever its history length (with replacement)
+        """
+        rng = np.random.default_rng(seed)
+        if balance:
+            counts = np.bincount(self.ticker, minlength=len(self.tickers))
+            p = 1.0 / (counts[self.ticker] * np.count_nonzero(counts))
+            order = rng.choice(len(self), size=len(self), p=p / p.sum())
+        elif shuffle:
+            order = rng.permutation(len(self))
+        else:
+            order = np.arange(len(self))
+
+        stop = len(order) - len(order) % batch_size if drop_last else len(order)
+        for i in range(0, stop, batch_size):
+            yield self.batch(order[i:i + batch_size])
+
+    def torch_batches(self, *args, **kwargs):
+        """
+        `batches` as torch tensors (sharing the batch arrays)
+        """
+        import torch
+
+        for x, y in self.batches(*args, **kwargs):
+            yield torch.from_numpy(x), torch.from_numpy(y)
+
+    def split(self, val=0.1, test=0.1):
+        """
+        (train, val, test) in time order per ticker; samples whose target lies in the next part are dropped
+        """
+        parts = ([], [], [])
+        for k, epoch in enumerate(self.epochs):
+            at = np.flatnonzero(self.ticker == k)
+            n = len(epoch)
+            cuts = [int(n * (1 - val - test)), int(n * (1 - test)), n]
+            first = self.lookback - 1
+            for part, cut in zip(parts, cuts):
+                end = self.end[at]
+                part.append(at[(end >= first) & (end + self.horizon < cut)])
+                first = cut
+        return tuple(self._subset(np.concatenate(part)) for part in parts)
+
+    def _subset(self, index):
+        subset = object.__new__(WindowDataset)
+        subset.__dict__.update(self.__dict__)
+        subset.ticker = self.ticker[index]
+        subset.end = self.end[index]
+        return subset
@@ -1,7 +1,14 @@
 import pandas as pd 
 import numpy as np
 import re
-import matplotlib.pyplot as plt
+import os
+import glob
+import json
+import sqlite3
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from importlib.metadata import version
 import nltk
 # nltk.download('stopwords')
 # nltk.download('wordnet')
@@ -10,59 +17,350 @@ from nltk.tokenize import TweetTokenizer
 from nltk.stem.wordnet import WordNetLemmatizer
 from nltk.corpus import stopwords
 
+import fastparquet
 from textblob import TextBlob
+from textblob.en import sentiment as pattern_sentiment
+from scipy import sparse
+
+URL_RE = re.compile(r'((www\.[^\s]+)|(http\S+))')
+HASHTAG_RE = re.compile(r'#\w+')
+MENTION_RE = re.compile(r'@\w+')
+NON_ALPHA_RE = re.compile('[^A-Za-z]+')
+
+SENTIMENT_CACHE = "./data/text/sentiment.sqlite"  # scores of cleaned texts, see SentimentScorer
+REDDIT_PATH = "./data/text/reddit/"  # RedditMaker.save_text output, see stream_reddit_sentiment
+REDDIT_TEXT = {  # text_type: (dataset, text column, columns kept next to the scores)
+    "p": ("posts", "selftext", ["id", "epoch", "num_comments", "score", "upvote_ratio"]),
+    "c": ("comments", "body", ["id", "link_id", "epoch", "score"]),
+}
+
+_lemmatizer = None
+
+
+@lru_cache(maxsize=2 ** 16)
+def lemmatize(word):
+    """
+    WordNetLemmatizer().lemmatize, built once per process and memoized per word
+    """
+    global _lemmatizer
+    if _lemmatizer is None:
+        _lemmatizer = WordNetLemmatizer()
+    return _lemmatizer.lemmatize(word)
+
+
+class TextCleaner:
+    """
+    the text_clean pipeline for many texts at once: regexes compiled once, stopwords in a set,
+    lemmas memoized, batches spread over processes.
+    after urls / hashtags / mentions are removed and non-letters replaced by spaces, TweetTokenizer and
+    the isalpha filter reduce to a whitespace split, so that is what runs
+    """
+    def __init__(self, stopwords, cryptowords=()):
+        self.drop = frozenset(stopwords) | frozenset(cryptowords)
+
+    def clean(self, text):
+        text = URL_RE.sub(' ', text)
+        text = HASHTAG_RE.sub(' ', text)
+        text = MENTION_RE.sub(' ', text)
+        text = NON_ALPHA_RE.sub(' ', text).lower()
+        return " ".join([lemmatize(t) for t in text.split() if t not in self.drop])
+
+    def clean_many(self, texts):
+        return [self.clean(text) for text in texts]
+
+    def clean_batch(self, texts, workers=None, chunksize=2000):
+        """
+        texts: Series (cleaned Series with the same index returned) or any iterable of str (list returned).
+        workers > 1: chunks of `chunksize` texts are cleaned in a process pool
+        """
+        index = texts.index if isinstance(texts, pd.Series) else None
+        texts = list(texts)
+        if workers is None or workers <= 1 or len(texts) <= chunksize:
+            cleaned = self.clean_many(texts)
+        else:
+            chunks = [texts[i:i + chunksize] for i in range(0, len(texts), chunksize)]
+            with ProcessPoolExecutor(workers) as pool:
+                cleaned = [text for chunk in pool.map(self.clean_many, chunks) for text in chunk]
+        return cleaned if index is None else pd.Series(cleaned, index=index)
+
+
+class SentimentScorer:
+    """
+    TextBlob polarity & subjectivity of many cleaned texts, parsed once per distinct text.
+    scores are kept in a sqlite table keyed by a hash of the text, so duplicated texts and re-runs are
+    looked up instead of scored. the table is emptied when the textblob version changes.
+    path None: dedup within the process only
+    """
+    def __init__(self, path=SENTIMENT_CACHE):
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path or ":memory:")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS scores "
+                        "(key BLOB PRIMARY KEY, polarity REAL, subjectivity REAL) WITHOUT ROWID")
+        engine = f"textblob {version('textblob')}"
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'engine'").fetchone()
+        if row is None or row[0] != engine:
+            self.db.execute("DELETE FROM scores")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('engine', ?)", (engine,))
+        self.db.commit()
+
+    def score(self, texts):
+        """
+        (polarity, subjectivity) float arrays aligned with texts
+        """
+        texts = list(texts)
+        keys = [hashlib.blake2b(text.encode(), digest_size=16).digest() for text in texts]
+        scores = self.lookup(set(keys))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in scores and key not in missing:
+                missing[key] = text
+        new = [(key, *TextBlob(text).sentiment) for key, text in missing.items()]
+        self.db.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?, ?)", new)
+        self.db.commit()
+        scores.update({key: (polarity, subjectivity) for key, polarity, subjectivity in new})
+
+        values = np.array([scores[key] for key in keys], dtype=float).reshape(-1, 2)
+        return values[:, 0], values[:, 1]
+
+    def lookup(self, keys, batch=900):
+        keys = list(keys)
+        scores = {}
+        for i in range(0, len(keys), batch):
+            chunk = keys[i:i + batch]
+            rows = self.db.execute(
+                f"SELECT key, polarity, subjectivity FROM scores WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            scores.update({key: (polarity, subjectivity) for key, polarity, subjectivity in rows})
+        return scores
+
+    def close(self):
+        self.db.close()
+
+
+class LexiconScorer:
+    """
+    TextBlob's pattern lexicon applied to a whole batch of cleaned texts (lower case words, space separated)
+    at once. the batch is tokenized into one flat token array; words that only count for themselves are
+    summed per text through a sparse (text x word) matrix product with the lexicon, the few that sit in an
+    intensifier or negation context are scored with vectorized versions of pattern's rules:
+        modifier + word ("very good"): word scores * modifier intensity, clipped to [-1, 1], one assessment
+        negation + word ("not good"): polarity * -0.5, the intensity of a negated modifier is inverted
+        -ly modifier + negation + word ("really not good"): one negated assessment
+        modifiers are kept across unknown words of <= 2 letters, negations across unknown single letters
+    exclamation marks and emoticons do not survive text_clean and are not looked at.
+    the same (polarity, subjectivity) interface as SentimentScorer, see benchmarks/bench_sentiment.py for
+    how closely it follows TextBlob
+    """
+    def __init__(self):
+        pattern_sentiment.get("good")  # the lexicon loads lazily
+        words = list(dict.keys(pattern_sentiment))
+        negations = [w for w in pattern_sentiment.negations if w not in pattern_sentiment]
+        self.vocab = pd.Index(words + negations + [None])
+        scores = np.array([dict.__getitem__(pattern_sentiment, w)[None] for w in words], dtype=float)
+        pad = np.zeros((len(negations) + 1, 3))
+        self.polarity, self.subjectivity, self.intensity = np.vstack([scores, pad]).T
+        self.known = np.r_[np.ones(len(words), dtype=bool), np.zeros(len(negations) + 1, dtype=bool)]
+        self.modifier = np.r_[
+            [any(pos in pattern_sentiment.modifiers for pos in dict.__getitem__(pattern_sentiment, w)) for w in words],
+            np.zeros(len(negations) + 1, dtype=bool)
+        ]
+        self.negation = self.vocab.isin(pattern_sentiment.negations)
+        self.adverb = np.r_[[pattern_sentiment.modifier(w) for w in words], np.zeros(len(negations) + 1, dtype=bool)]
+
+    def score(self, texts):
+        """
+        (polarity, subjectivity) float arrays aligned with texts
+        """
+        docs = [text.split() for text in texts]
+        n_docs = len(docs)
+        tokens = [t for doc in docs for t in doc]
+        if len(tokens) == 0:
+            return np.zeros(n_docs), np.zeros(n_docs)
+
+        doc = np.repeat(np.arange(n_docs), [len(d) for d in docs])
+        ids = self.vocab.get_indexer(tokens)
+        ids[ids < 0] = len(self.vocab) - 1
+        known, negation = self.known[ids], self.negation[ids]
+        modifier = self.modifier[ids]
+        length = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+        pos = np.arange(len(tokens))
+
+        # nearest earlier token in the same text that modifier / negation context does not skip
+        prev_m = _previous(pos, doc, known | (length > 2))
+        prev_n = _previous(pos, doc, known | negation | (length > 1))
+
+        # "really not good": a negation right after an -ly modifier negates the modifier's assessment
+        # and keeps the modifier going instead of negating the next word
+        q = np.maximum(prev_m, 0)
+        after_ly = negation & ~known & (prev_m >= 0) & modifier[q] & self.adverb[ids[q]]
+        if after_ly.any():
+            prev_m = _previous(pos, doc, known | ((length > 2) & ~after_ly))
+
+        merged = known & (prev_m >= 0) & modifier[np.maximum(prev_m, 0)]  # scored with the modifier before it
+        negated = (prev_n >= 0) & negation[np.maximum(prev_n, 0)] & ~after_ly[np.maximum(prev_n, 0)]
+
+        end = known.copy()  # last word of an assessment
+        end[prev_m[merged]] = False
+        start = np.maximum.accumulate(np.where(known & ~merged, pos, 0))  # first word of its assessment
+        start_negated = negated[start] & known[start]
+        chain_negated = start_negated.copy()
+        chain_negated[start[q[after_ly]]] = True
+        chain_negated = chain_negated[start]
+
+        context = end & (merged | chain_negated)
+        free = end & ~context
+
+        # context free assessments: one sparse product with the lexicon
+        counts = sparse.csr_matrix((np.ones(free.sum()), (doc[free], ids[free])), shape=(n_docs, len(self.vocab)))
+        polarity = counts @ self.polarity
+        subjectivity = counts @ self.subjectivity
+        n = np.asarray(counts.sum(axis=1)).ravel()
+
+        # intensifier & negation contexts
+        k = pos[context]
+        p, s = self.polarity[ids[k]], self.subjectivity[ids[k]]
+        m = prev_m[k]
+        intensity = self.intensity[ids[m]]
+        inverted = merged[k] & start_negated[k] & (m == start[k])
+        intensity[inverted] = 1 / intensity[inverted]
+        p = np.where(merged[k], np.clip(p * intensity, -1.0, 1.0), p)
+        s = np.where(merged[k], np.clip(s * intensity, -1.0, 1.0), s)
+        p = np.where(chain_negated[k], p * -0.5, p)
+
+        polarity += np.bincount(doc[k], weights=p, minlength=n_docs)
+        subjectivity += np.bincount(doc[k], weights=s, minlength=n_docs)
+        n += np.bincount(doc[k], minlength=n_docs)
+
+        n = np.maximum(n, 1)
+        return polarity / n, subjectivity / n
+
+
+def get_scorer(engine="textblob", cache=SENTIMENT_CACHE):
+    """
+    batch scorer by name: "textblob" / "lexicon"
+    """
+    if engine == "textblob":
+        return SentimentScorer(cache)
+    if engine == "lexicon":
+        return LexiconScorer()
+    raise Exception(f"sentiment engine {engine} undefined")
+
+
+def _previous(pos, doc, kept):
+    """
+    index of the nearest earlier `kept` token in the same text, -1 if none
+    """
+    last = np.maximum.accumulate(np.where(kept, pos, -1))
+    prev = np.r_[-1, last[:-1]]
+    valid = prev >= 0
+    valid[valid] = doc[prev[valid]] == doc[valid]
+    return np.where(valid, prev, -1)
+
+
+def stream_reddit_sentiment(text_type, stopwords, cryptowords, root=REDDIT_PATH, engine="textblob",
+                            cache=SENTIMENT_CACHE, workers=None, rescore=False):
+    """
+    clean & score {root}/posts.parquet (text_type 'p') or comments.parquet ('c') one row group at a time
+    into {root}/sentiment/{dataset}.parquet/date=.../subreddit=.../part.0.parquet, the input's partitioning.
+    memory is bounded by one row group plus the scores of one partition.
+
+    {root}/sentiment/{dataset}.parquet/_scored.json lists the input files (name, size) each partition was
+    scored from: partitions that did not change since are skipped, so a nightly run only scores new
+    dates (and days fetched again). rescore: score everything again.
+    return the number of partitions scored
+    """
+    if text_type not in REDDIT_TEXT:
+        raise Exception(f"text_type {text_type} not supported")
+    dataset, text_column, keep = REDDIT_TEXT[text_type]
+    source = os.path.join(root, f"{dataset}.parquet")
+    target = os.path.join(root, f"sentiment/{dataset}.parquet")
+    os.makedirs(target, exist_ok=True)
+
+    manifest_path = os.path.join(target, "_scored.json")
+    manifest = {}
+    if os.path.exists(manifest_path) and not rescore:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+    cleaner = TextCleaner(stopwords, cryptowords)
+    scorer = get_scorer(engine, cache)
+    scored = 0
+    for partition in sorted(glob.glob(os.path.join(source, "date=*", "subreddit=*"))):
+        name = os.path.relpath(partition, source)
+        files = sorted(glob.glob(os.path.join(partition, "*.parquet")))
+        state = [[os.path.basename(file), os.path.getsize(file)] for file in files]
+        if manifest.get(name) == state:
+            continue
+
+        features = []
+        for file in files:
+            for texts in fastparquet.ParquetFile(file).iter_row_groups(columns=keep + [text_column]):
+                texts = texts.dropna(subset=[text_column])
+                polarity, subjectivity = scorer.score(cleaner.clean_batch(texts[text_column], workers))
+                texts = texts[keep].reset_index(drop=True)
+                texts['subjectivity'] = subjectivity
+                texts['polarity'] = polarity
+                features.append(texts)
+
+        os.makedirs(os.path.join(target, name), exist_ok=True)
+        path = os.path.join(target, name, "part.0.parquet")
+        if features:
+            fastparquet.write(path + ".tmp", pd.concat(features, ignore_index=True), compression="snappy",
+                              write_index=False)
+            os.replace(path + ".tmp", path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+        manifest[name] = state
+        with open(manifest_path + ".tmp", 'w') as f:
+            json.dump(manifest, f)
+        os.replace(manifest_path + ".tmp", manifest_path)
+        scored += 1
+
+    return scored
+
 
 class tweetSentimentAnalysis:
-    def __init__(self, data, stopwords, cryptowords):
+    def __init__(self, data, stopwords, cryptowords, workers=None, cache=SENTIMENT_CACHE, engine="textblob"):
+        """
+        engine: "textblob" (SentimentScorer) / "lexicon" (LexiconScorer, vectorized)
+        """
         self.data = data
         self.stopwords = stopwords
         self.cryptowords = cryptowords
+        self.cleaner = TextCleaner(stopwords, cryptowords)
+        self.scorer = get_scorer(engine, cache)
+        self.engine = engine
+        self.workers = workers
         self.data_preprocessing()
     
     def data_preprocessing(self):
         data = self.data.dropna(subset=['text','hashtags']).reset_index(drop=True)
         text_data = data[['text']].copy()
-        text_data['text'] = text_data['text'].apply(self.text_clean)
-        text_data['subjectivity'] = text_data['text'].apply(self.getSubjectivity)
-        text_data['polarity'] = text_data['text'].apply(self.getPolarity)
+        text_data['text'] = self.cleaner.clean_batch(text_data['text'], self.workers)
+        polarity, subjectivity = self.scorer.score(text_data['text'])
+        text_data['subjectivity'] = subjectivity
+        text_data['polarity'] = polarity
         text_data = pd.concat([data[['date','user_followers','user_friends']], text_data],axis=1)
         self.text_data = text_data
         return self.text_data
 
     def text_clean(self, text):
-        #I.  
-        #1. Remove urls/hyperlinks
-        text = re.sub(r'((www\.[^\s]+)|(http\S+))',' ', text)
-        #2. Remove hashtags
-        text = re.sub(r'#\w+', ' ', text)
-        #3. Remove mentions 
-        text = re.sub(r'@\w+',' ', text)
-        #4. Remove characters that not in the English alphabets
-        text = re.sub('[^A-Za-z]+', ' ', text)
-        #5. Remove additional white spaces
-        text = re.sub('[\s]+', ' ', text)
-        #II. 
-        #1. Tokenize
-        text = TweetTokenizer().tokenize(text)
-        #2. Lower?
-        text = [l.lower() for l in text]
-        #2. Remove Puncs
-        text = [w for w in text if w.isalpha()]
-        #3. Removing Stopwords
-        lemmatizer = WordNetLemmatizer()
-        # Import nltk stopwords and customize it to add common crypto words that don't add too much information 
-        text = [t for t in text if t not in (self.stopwords + self.cryptowords)]
-        #4. lemmatize
-        text = [lemmatizer.lemmatize(t) for t in text]
-        #5. Joining
-
-        return " ".join(text)
+        """
+        urls, hashtags, mentions, non-letters and stopwords out, lower case, lemmatized (see TextCleaner)
+        """
+        return self.cleaner.clean(text)
 
     def getSubjectivity(self, tweet):
         """
         Create a function to get subjectivity
         Subjectivity is in range [0,1]
         """
+        if self.engine == "lexicon":
+            return self.scorer.score([tweet])[1][0]
         return TextBlob(tweet).sentiment.subjectivity
 
     def getPolarity(self, tweet):
@@ -70,60 +368,49 @@ class tweetSentimentAnalysis:
         create a function to get the polarity
         polarity is in range [-1,1]
         """
+        if self.engine == "lexicon":
+            return self.scorer.score([tweet])[0][0]
         return TextBlob(tweet).sentiment.polarity
 
 class redditSentimentAnalysis:
-    def __init__(self, data, stopwords, cryptowords):
+    def __init__(self, data, stopwords, cryptowords, workers=None, cache=SENTIMENT_CACHE, engine="textblob"):
+        """
+        engine: "textblob" (SentimentScorer) / "lexicon" (LexiconScorer, vectorized)
+        """
         self.data = data
         self.stopwords = stopwords
         self.cryptowords = cryptowords
+        self.cleaner = TextCleaner(stopwords, cryptowords)
+        self.scorer = get_scorer(engine, cache)
+        self.engine = engine
+        self.workers = workers
         self.data_preprocessing()
     
     def data_preprocessing(self):
         data = self.data.dropna(subset=['title','selftext']).reset_index(drop=True)
         data['epoch'] = pd.to_datetime(data['epoch'], unit='s')
         text_data = data[['selftext']].copy()
-        text_data['selftext'] = text_data['selftext'].apply(self.text_clean)
-        text_data['subjectivity'] = text_data['selftext'].apply(self.getSubjectivity)
-        text_data['polarity'] = text_data['selftext'].apply(self.getPolarity)
+        text_data['selftext'] = self.cleaner.clean_batch(text_data['selftext'], self.workers)
+        polarity, subjectivity = self.scorer.score(text_data['selftext'])
+        text_data['subjectivity'] = subjectivity
+        text_data['polarity'] = polarity
         text_data = pd.concat([data[['epoch','num_comments','score','upvote_ratio']], text_data],axis=1)
         self.text_data = text_data
         return self.text_data
 
     def text_clean(self, text):
-        #I.  
-        #1. Remove urls/hyperlinks
-        text = re.sub(r'((www\.[^\s]+)|(http\S+))',' ', text)
-        #2. Remove hashtags
-        text = re.sub(r'#\w+', ' ', text)
-        #3. Remove mentions 
-        text = re.sub(r'@\w+',' ', text)
-        #4. Remove characters that not in the English alphabets
-        text = re.sub('[^A-Za-z]+', ' ', text)
-        #5. Remove additional white spaces
-        text = re.sub('[\s]+', ' ', text)
-        #II. 
-        #1. Tokenize
-        text = TweetTokenizer().tokenize(text)
-        #2. Lower?
-        text = [l.lower() for l in text]
-        #2. Remove Puncs
-        text = [w for w in text if w.isalpha()]
-        #3. Removing Stopwords
-        lemmatizer = WordNetLemmatizer()
-        # Import nltk stopwords and customize it to add common crypto words that don't add too much information 
-        text = [t for t in text if t not in (self.stopwords + self.cryptowords)]
-        #4. lemmatize
-        text = [lemmatizer.lemmatize(t) for t in text]
-        #5. Joining
-
-        return " ".join(text)
+        """
+        urls, hashtags, mentions, non-letters and stopwords out, lower case, lemmatized (see TextCleaner)
+        """
+        return self.cleaner.clean(text)
 
     def getSubjectivity(self, reddit):
         """
         Create a function to get subjectivity
         Subjectivity is in range [0,1]
         """
+        if self.engine == "lexicon":
+            return self.scorer.score([reddit])[1][0]
         return TextBlob(reddit).sentiment.subjectivity
 
     def getPolarity(self, reddit):
@@ -131,6 +418,8 @@ class redditSentimentAnalysis:
         create a function to get the polarity
         polarity is in range [-1,1]
         """
+        if self.engine == "lexicon":
+            return self.scorer.score([reddit])[0][0]
         return TextBlob(reddit).sentiment.polarity
 
 if __name__ == "__main__":